@@ -0,0 +1,224 @@
+"""
+Benchmark of the data preparation and loading on synthetic data of increasing size (see synthetic_data.py).
+For each number of rows, reports the preparation time, the bytes written, the latency of loading the
+splits and of drawing the first training batch, and the peak resident memory (RSS) of the process.
+
+Each size runs in a fresh process, so that its peak RSS is not inflated by the previous sizes. Sizes above
+max_in_memory_rows are prepared in chunks (see streaming.py). Runs offline on Linux, e.g. from the
+repository root:
+
+    python -m lab.processes.prepare_data.benchmark --sizes 1e3 1e5 1e7 --output benchmark.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import torch
+
+from lab.processes.prepare_data.cancer_data import (
+    load_data_splits,
+    load_data_splits_as_dataloader,
+    prepare_cancer_data,
+)
+from lab.processes.prepare_data.streaming import prepare_data_streaming
+from lab.processes.prepare_data.synthetic_data import (
+    BLOCK_ROWS,
+    iter_synthetic_data_chunks,
+    make_synthetic_data,
+)
+
+DEFAULT_SIZES = [10**exponent for exponent in range(3, 9)]
+MAX_IN_MEMORY_ROWS = 10**6
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak resident memory of the current process in bytes (ru_maxrss is in kilobytes on Linux)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_dir_size(dir_path: Union[str, Path]) -> int:
+    """
+    Returns the total size in bytes of the files in a directory
+    """
+    return sum(
+        path.stat().st_size for path in Path(dir_path).iterdir() if path.is_file()
+    )
+
+
+def benchmark_size(
+    n_rows: int,
+    dir_output: str,
+    n_features: int = 30,
+    positive_fraction: float = 0.5,
+    feature_dtype: str = "float32",
+    label_dtype: str = "uint8",
+    batch_size: int = 1024,
+    mmap_mode: Optional[str] = "r",
+    max_in_memory_rows: int = MAX_IN_MEMORY_ROWS,
+) -> dict:
+    """
+    Prepares and loads synthetic data of one size, timing each step.
+
+    Args:
+        n_rows: (int) number of rows of the synthetic data
+        dir_output: (str) destination directory of the processed data
+        n_features: (int) number of features of the synthetic data
+        positive_fraction: (float) expected fraction of rows in the positive class
+        feature_dtype: (str) dtype in which the features are stored
+        label_dtype: (str) dtype in which the labels are stored
+        batch_size: (int) batch size of the training dataloader
+        mmap_mode: (str or None) memory-map mode used to load the splits (see load_data_splits)
+        max_in_memory_rows: (int) largest number of rows prepared in memory; larger sizes are streamed
+
+    Returns:
+        (dict) of the benchmark results, with times in seconds and sizes in bytes
+    """
+    streaming = n_rows > max_in_memory_rows
+
+    start = time.perf_counter()
+    if streaming:
+        prepare_data_streaming(
+            chunks=lambda: iter_synthetic_data_chunks(
+                n_rows, n_features, positive_fraction, chunksize=BLOCK_ROWS
+            ),
+            dir_output=dir_output,
+            use_cache=False,
+            feature_dtype=feature_dtype,
+            label_dtype=label_dtype,
+        )
+    else:
+        prepare_cancer_data(
+            dir_output=dir_output,
+            use_cache=False,
+            feature_dtype=feature_dtype,
+            label_dtype=label_dtype,
+            load_data=lambda: make_synthetic_data(
+                n_rows, n_features, positive_fraction
+            ),
+        )
+    prepare_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_data_splits(dir_output, as_type="tensor", mmap_mode=mmap_mode)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    train_loader, _, _ = load_data_splits_as_dataloader(
+        dir_output, batch_size=batch_size, n_workers=0, mmap_mode=mmap_mode
+    )
+    next(iter(train_loader))
+    first_batch_s = time.perf_counter() - start
+
+    return dict(
+        n_rows=n_rows,
+        n_features=n_features,
+        mode="streaming" if streaming else "in_memory",
+        prepare_s=prepare_s,
+        bytes_written=get_dir_size(dir_output),
+        load_s=load_s,
+        first_batch_s=first_batch_s,
+        peak_rss_bytes=get_peak_rss(),
+    )
+
+
+def run_benchmark(
+    sizes: list = None,
+    dir_root: Optional[Union[str, Path]] = None,
+    **kwargs,
+) -> dict:
+    """
+    Runs benchmark_size for each number of rows in a fresh process, removing the processed data of each
+    size before moving on to the next.
+
+    Args:
+        sizes: (list of int) numbers of rows to benchmark, by default 10^3 to 10^8
+        dir_root: (str, Path or None) directory under which the processed data is written (it needs room
+            for the largest size, e.g. about 12 GB for 10^8 rows of 30 float32 features), by default a
+            temporary directory
+        **kwargs: further arguments of benchmark_size
+
+    Returns:
+        (dict) with a description of the environment and the list of results per size
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=dir_root) as dir_temp:
+        for n_rows in sizes:
+            dir_output = str(Path(dir_temp) / f"rows_{n_rows}")
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                results.append(
+                    executor.submit(
+                        benchmark_size, n_rows, dir_output, **kwargs
+                    ).result()
+                )
+            shutil.rmtree(dir_output)
+
+    environment = dict(
+        platform=platform.platform(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        torch=torch.__version__,
+        cpu_count=multiprocessing.cpu_count(),
+    )
+    return dict(environment=environment, results=results)
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments of the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=lambda size: int(float(size)),
+        default=DEFAULT_SIZES,
+        help="numbers of rows to benchmark (e.g. 1e3 1e6)",
+    )
+    parser.add_argument("--n-features", type=int, default=30)
+    parser.add_argument("--positive-fraction", type=float, default=0.5)
+    parser.add_argument("--feature-dtype", default="float32")
+    parser.add_argument("--label-dtype", default="uint8")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--max-in-memory-rows", type=int, default=MAX_IN_MEMORY_ROWS)
+    parser.add_argument("--dir", default=None, help="directory for the processed data")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+
+    arguments = parse_args()
+    report = run_benchmark(
+        sizes=arguments.sizes,
+        dir_root=arguments.dir,
+        n_features=arguments.n_features,
+        positive_fraction=arguments.positive_fraction,
+        feature_dtype=arguments.feature_dtype,
+        label_dtype=arguments.label_dtype,
+        batch_size=arguments.batch_size,
+        max_in_memory_rows=arguments.max_in_memory_rows,
+    )
+
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(report, indent=2))
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,40 @@
+"""
+Integration tests for the data preparation benchmark in lab/processes/prepare_data/benchmark.py
+"""
+
+import json
+
+import pytest
+
+from lab.processes.prepare_data.benchmark import parse_args, run_benchmark
+
+
+@pytest.mark.integration
+def test_benchmark_reports_each_size_as_json(tmp_path):
+    """
+    Test that the benchmark reports the measurements of each size, including a streamed size, in a
+    JSON-serializable report and removes the processed data afterwards
+    """
+    report = run_benchmark(
+        sizes=[1000, 5000], dir_root=tmp_path, n_features=4, max_in_memory_rows=2000
+    )
+
+    json.dumps(report)
+    assert [result["n_rows"] for result in report["results"]] == [1000, 5000]
+    assert [result["mode"] for result in report["results"]] == [
+        "in_memory",
+        "streaming",
+    ]
+    for result in report["results"]:
+        assert result["bytes_written"] > result["n_rows"] * 4 * 4
+        assert result["prepare_s"] > 0 and result["first_batch_s"] > 0
+        assert result["peak_rss_bytes"] > 0
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.unittest
+def test_sizes_can_be_given_in_scientific_notation():
+    """
+    Test that the benchmark sizes are parsed as integers from the command line
+    """
+    assert parse_args(["--sizes", "1e3", "20000"]).sizes == [1000, 20000]
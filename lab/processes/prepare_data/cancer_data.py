@@ -2,8 +2,9 @@
 Functions for preparing the breast cancer dataset for training and validating ML algorithms
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Callable, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -14,9 +15,34 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from torch.utils.data import DataLoader
 
-from lib.pytorch import create_dataloader
+from lab.processes.prepare_data.indexed import (
+    FEATURES_FNAME,
+    get_split_variant_name,
+    load_split_variant,
+    save_split_variant,
+)
+from lab.processes.prepare_data.manifest import (
+    artifact_is_stored,
+    hash_array,
+    hash_code,
+    hash_data,
+    is_up_to_date,
+    read_manifest,
+    remove_stale_artifacts,
+    write_manifest,
+)
+from lab.processes.prepare_data.packed import (
+    PACKED_FNAME,
+    SPLIT_CODES,
+    load_packed_split,
+    save_packed_splits,
+)
+from lib.pytorch import TensorBatchLoader, create_dataloader, create_tensor_loader
 
 RANDOM_STATE = 42
+TEST_SIZE = 0.15
+VAL_SIZE = 0.2
+SPLIT_NAMES = ("X_train", "X_val", "X_test", "y_train", "y_val", "y_test")
 
 
 def load_cancer_data() -> Tuple[DataFrame, Series]:
@@ -32,36 +58,176 @@ def split_data(X: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray]:
     Splits the data into train/val/test sets
     """
     X_trainval, X_test, y_trainval, y_test = train_test_split(
-        X, y, test_size=0.15, random_state=RANDOM_STATE, stratify=y
+        X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y
     )
     X_train, X_val, y_train, y_val = train_test_split(
         X_trainval,
         y_trainval,
-        test_size=0.2,
+        test_size=VAL_SIZE,
         random_state=RANDOM_STATE,
         stratify=y_trainval,
     )
     return X_train, X_val, X_test, y_train, y_val, y_test
 
 
-def prepare_cancer_data(dir_output: str) -> None:
+def cast_to_storage_dtype(array: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Casts an array to its storage dtype (without copying if it already has that dtype).
+
+    Args:
+        array: (numpy ndarray) the array to store
+        dtype: (str) storage dtype, e.g. 'float32' for features or 'uint8' for labels
+
+    Raises:
+        ValueError: if the storage dtype is an integer type that cannot hold all values of the array
+
+    Returns:
+        (numpy ndarray) the array with the storage dtype
+    """
+    stored = array.astype(dtype, copy=False)
+    if np.issubdtype(stored.dtype, np.integer) and not np.array_equal(stored, array):
+        raise ValueError(f"The values of the array do not fit in dtype {dtype}")
+    return stored
+
+
+def save_npy_splits(dir_output: Union[str, Path], splits: dict, manifest: dict) -> dict:
+    """
+    Saves each array as a separate .npy file ('X_train.npy', 'y_train.npy', etc.), skipping the files
+    that the manifest shows to be stored with the same contents already.
+
+    Args:
+        dir_output: (str or Path) destination directory
+        splits: (dict) mapping names (see SPLIT_NAMES) to numpy arrays
+        manifest: (dict) manifest of the outputs currently stored in dir_output
+
+    Returns:
+        (dict) manifest entries of the saved files
+    """
+    artifacts = {}
+    for name, array in splits.items():
+        fname = f"{name}.npy"
+        digest = hash_array(array)
+        if not artifact_is_stored(dir_output, manifest, fname, digest):
+            np.save(str(Path(dir_output) / fname), array)
+        artifacts[fname] = dict(
+            sha256=digest, size=(Path(dir_output) / fname).stat().st_size
+        )
+    return artifacts
+
+
+def save_packed(
+    dir_output: Union[str, Path],
+    splits: dict,
+    manifest: dict,
+    feature_names: list,
+    scaler: StandardScaler,
+) -> dict:
+    """
+    Saves all arrays in a single packed file (see packed.py), unless the manifest shows it to be stored
+    with the same contents already.
+
+    Args:
+        dir_output: (str or Path) destination directory
+        splits: (dict) mapping names (see SPLIT_NAMES) to numpy arrays
+        manifest: (dict) manifest of the outputs currently stored in dir_output
+        feature_names: (list of str) names of the input features
+        scaler: (StandardScaler) the fitted scaler, whose statistics are stored in the file
+
+    Returns:
+        (dict) manifest entry of the saved file
+    """
+    filepath = Path(dir_output) / PACKED_FNAME
+    digest = hash_array(
+        np.array([hash_array(array) for array in splits.values()] + feature_names)
+    )
+    if not artifact_is_stored(dir_output, manifest, PACKED_FNAME, digest):
+        save_packed_splits(
+            filepath,
+            {
+                split: (splits[f"X_{split}"], splits[f"y_{split}"])
+                for split in SPLIT_CODES
+            },
+            feature_names=feature_names,
+            scaler=scaler,
+        )
+    return {PACKED_FNAME: dict(sha256=digest, size=filepath.stat().st_size)}
+
+
+def prepare_cancer_data(
+    dir_output: str,
+    use_cache: bool = True,
+    output_format: str = "npy",
+    feature_dtype: str = "float64",
+    label_dtype: str = "int64",
+    load_data: Callable[[], Tuple[DataFrame, Series]] = load_cancer_data,
+) -> None:
     """
     Conducts a series of steps necessary to prepare the digit data for training and validation:
     - Loads digit image data from sklearn
     - Splits the data into train, val, and test sets
     - Applies transformations as defined in transform_data
     - Saves output tensors to the destination path provided
+    - Records the inputs and the content digests of the outputs in a manifest (see manifest.py)
+
+    With use_cache, a rerun with the same source data, split parameters and code version as recorded in the
+    manifest is a no-op, and otherwise only the arrays whose contents changed are rewritten.
 
     Args:
         dir_output: (str) destination filepath, must be str not PosixPath
+        use_cache: (bool) reuse the outputs already stored in dir_output where they are up to date
+        output_format: (str) one of 'npy' (a separate .npy file per array), 'packed' (a single Parquet file
+            holding all splits, the feature names and the scaler statistics, see packed.py) or 'indexed'
+            (the unscaled feature matrix and target stored once, with the splits stored as row indices and
+            scaler statistics, see indexed.py)
+        feature_dtype: (str) dtype in which the features are stored: 'float64', 'float32' or 'float16'
+            ('float16' is not supported by the packed format)
+        label_dtype: (str) integer dtype in which the labels are stored, e.g. 'int64' or 'uint8'
+        load_data: (callable) data source, returning the features and binary target as pandas DataFrame
+            and Series; defaults to the breast cancer data (see synthetic_data.py for synthetic data)
 
     Returns:
         (None)
     """
+    if output_format not in ("npy", "packed", "indexed"):
+        raise ValueError(
+            "Please specify output_format argument as one of 'npy', 'packed' or 'indexed'"
+        )
+    if output_format == "packed" and np.dtype(feature_dtype) == np.float16:
+        raise ValueError("The packed output format does not support float16 features")
+
     Path(dir_output).mkdir(exist_ok=True)
 
     # Load digit data
-    imgs, y = load_cancer_data()
+    imgs, y = load_data()
+
+    # Skip all work if the stored outputs were produced from the same inputs
+    inputs = dict(
+        source_hash=hash_data(imgs, y),
+        random_state=RANDOM_STATE,
+        test_size=TEST_SIZE,
+        val_size=VAL_SIZE,
+        code_version=hash_code(Path(__file__).parent),
+        output_format=output_format,
+        feature_dtype=feature_dtype,
+        label_dtype=label_dtype,
+    )
+    manifest = read_manifest(dir_output) if use_cache else {}
+    if is_up_to_date(dir_output, manifest, inputs):
+        print(f"Processed data in {dir_output} is up to date, skipping preparation")
+        return
+
+    if output_format == "indexed":
+        X = cast_to_storage_dtype(imgs.to_numpy(), feature_dtype)
+        y = cast_to_storage_dtype(y.to_numpy(), label_dtype)
+        artifacts = save_npy_splits(dir_output, dict(X=X, y=y), manifest)
+        artifacts.update(
+            save_split_variant(
+                dir_output, X, y, RANDOM_STATE, TEST_SIZE, VAL_SIZE, manifest
+            )
+        )
+        remove_stale_artifacts(dir_output, artifacts)
+        write_manifest(dir_output, dict(inputs=inputs, artifacts=artifacts, version=1))
+        return
 
     # Split into train/test/val
     X_train, X_val, X_test, y_train, y_val, y_test = split_data(X=imgs, y=y)
@@ -72,73 +238,156 @@ def prepare_cancer_data(dir_output: str) -> None:
     X_val = pd.DataFrame(scaler.transform(X_val), columns=X_val.columns)
     X_test = pd.DataFrame(scaler.transform(X_test), columns=X_test.columns)
 
-    # Save processed data
-    np.save(str(Path(dir_output) / "X_train.npy"), X_train.to_numpy())
-    np.save(str(Path(dir_output) / "y_train.npy"), y_train.to_numpy())
-    np.save(str(Path(dir_output) / "X_val.npy"), X_val.to_numpy())
-    np.save(str(Path(dir_output) / "y_val.npy"), y_val.to_numpy())
-    np.save(str(Path(dir_output) / "X_test.npy"), X_test.to_numpy())
-    np.save(str(Path(dir_output) / "y_test.npy"), y_test.to_numpy())
+    # Save processed data, only writing the outputs whose contents changed
+    splits = {
+        name: cast_to_storage_dtype(
+            split.to_numpy(), feature_dtype if name.startswith("X") else label_dtype
+        )
+        for name, split in zip(
+            SPLIT_NAMES, (X_train, X_val, X_test, y_train, y_val, y_test)
+        )
+    }
+    if output_format == "packed":
+        feature_names = [str(column) for column in imgs.columns]
+        artifacts = save_packed(dir_output, splits, manifest, feature_names, scaler)
+    else:
+        artifacts = save_npy_splits(dir_output, splits, manifest)
+
+    # Remove outputs of previous runs that are no longer produced (e.g. after a format change)
+    remove_stale_artifacts(dir_output, artifacts)
+    write_manifest(dir_output, dict(inputs=inputs, artifacts=artifacts, version=1))
+
+
+def split_to_tensor(array: np.ndarray, name: str) -> torch.Tensor:
+    """
+    Converts a loaded split (e.g. 'X_train' or 'y_val') to a torch tensor: features as float32, the dtype
+    the models take (sharing memory with float32 arrays, converted once otherwise), and labels in the dtype
+    they are stored in (e.g. uint8, converted per batch by lib.pytorch.train_loop and val_loop)
+    """
+    tensor = torch.from_numpy(array)
+    return tensor.float() if name.startswith("X") else tensor
 
 
 def load_data_splits(
-    dir_processed: Union[str, Path], as_type: str
+    dir_processed: Union[str, Path],
+    as_type: str,
+    mmap_mode: Optional[str] = None,
+    split_variant: Optional[str] = None,
+    splits: Sequence[str] = SPLIT_NAMES,
+    max_workers: Optional[int] = None,
 ) -> Tuple[Union[np.ndarray, torch.Tensor]]:
     """
     Loads train/val/test files for X and y (named 'X_train.npy', 'y_train.npy', etc.)
-    from the location specified and returns as numpy arrays.
+    from the location specified and returns as numpy arrays. If the location holds a packed splits file
+    instead (see packed.py), the splits are read from that file and mmap_mode does not apply. If it holds
+    data in the indexed format (see indexed.py), the splits of the requested split variant are gathered
+    from the stored feature matrix.
+
+    Only the requested splits are read, and the files (or the splits of the packed file) are read
+    concurrently by a pool of threads, so that the latency of each read is not paid one file after another
+    on high-latency (e.g. networked) storage.
+
+    The arrays keep the dtypes they are stored in (see the feature_dtype and label_dtype arguments of
+    prepare_cancer_data). Feature tensors are float32, created without conversion from features stored as
+    float32 (sharing their memory) and converted once here from other dtypes, while label tensors keep
+    the storage dtype of the labels (see split_to_tensor).
+    With mmap_mode set, the files are memory-mapped instead of being read into memory, so that the tensors
+    of float32 features and of the labels share memory with the mapped files. Pages are then read on demand
+    and shared through the page cache between all processes loading the same splits.
 
     Args:
         dir_processed: (str or Path) directory containing processed data files
         as_type: (str) type of outputs; one of 'array' (returns as numpy ndarray)
             or 'tensor' (returns as pytorch tensor)
+        mmap_mode: (str or None) memory-map mode passed to numpy.load ('r', 'r+' or 'c'), or None to read
+            the files into memory. Read-only maps ('r') are opened copy-on-write ('c') for tensor outputs,
+            as torch cannot wrap read-only buffers
+        split_variant: (str or None) name of the split variant to load from data in the indexed format
+            (see indexed.get_split_variant_name), or None for the split with the default seed and ratios
+        splits: (sequence of str) names of the splits to load (see SPLIT_NAMES), by default all of them
+        max_workers: (int or None) number of threads reading the files, by default one per file
 
     Returns:
-        (tuple) of numpy arrays or torch tensors for
-            X_train, X_val, X_test, y_train, y_val, y_test
+        (tuple) of numpy arrays or torch tensors for the requested splits, in the requested order;
+            by default X_train, X_val, X_test, y_train, y_val, y_test
     """
-    X_train = np.load(str(Path(dir_processed) / "X_train.npy"))
-    y_train = np.load(str(Path(dir_processed) / "y_train.npy"))
-    X_val = np.load(str(Path(dir_processed) / "X_val.npy"))
-    y_val = np.load(str(Path(dir_processed) / "y_val.npy"))
-    X_test = np.load(str(Path(dir_processed) / "X_test.npy"))
-    y_test = np.load(str(Path(dir_processed) / "y_test.npy"))
+    if as_type not in ("array", "tensor"):
+        raise ValueError(
+            "Please specify as_type argument as one of 'array' or 'tensor'"
+        )
+    if not set(splits) <= set(SPLIT_NAMES):
+        raise ValueError(f"Please specify splits as names among {SPLIT_NAMES}")
 
-    if as_type == "array":
-        return X_train, X_val, X_test, y_train, y_val, y_test
+    if as_type == "tensor" and mmap_mode == "r":
+        mmap_mode = "c"
 
-    elif as_type == "tensor":
-        # pylint: disable=not-callable
-        X_train = torch.Tensor(X_train).float()
-        y_train = torch.Tensor(y_train).float()
-        X_val = torch.Tensor(X_val).float()
-        y_val = torch.Tensor(y_val).float()
-        X_test = torch.Tensor(X_test).float()
-        y_test = torch.Tensor(y_test).float()
+    filepath_packed = Path(dir_processed) / PACKED_FNAME
+    if (Path(dir_processed) / FEATURES_FNAME).is_file():
+        if split_variant is None:
+            split_variant = get_split_variant_name(RANDOM_STATE, TEST_SIZE, VAL_SIZE)
+        arrays = load_split_variant(
+            dir_processed, split_variant, mmap_mode=mmap_mode, splits=splits
+        )
+    elif filepath_packed.is_file():
+        packed_splits = sorted({name.split("_")[1] for name in splits})
+        with ThreadPoolExecutor(max_workers or len(packed_splits)) as executor:
+            loaded = dict(
+                zip(
+                    packed_splits,
+                    executor.map(
+                        lambda split: load_packed_split(filepath_packed, split),
+                        packed_splits,
+                    ),
+                )
+            )
+        arrays = tuple(
+            loaded[name.split("_")[1]][0 if name.startswith("X") else 1]
+            for name in splits
+        )
+    else:
+        with ThreadPoolExecutor(max_workers or len(splits)) as executor:
+            arrays = tuple(
+                executor.map(
+                    lambda name: np.load(
+                        str(Path(dir_processed) / f"{name}.npy"), mmap_mode=mmap_mode
+                    ),
+                    splits,
+                )
+            )
 
-        return X_train, X_val, X_test, y_train, y_val, y_test
+    if as_type == "array":
+        return arrays
 
-    else:
-        raise ValueError(
-            "Please specify as_type argument as one of 'array' or 'tensor'"
-        )
+    return tuple(split_to_tensor(array, name) for array, name in zip(arrays, splits))
 
 
 def load_data_splits_as_dataloader(
-    dir_processed: str, batch_size: int, n_workers: int
-) -> Tuple[DataLoader]:
+    dir_processed: str,
+    batch_size: int,
+    n_workers: int,
+    mmap_mode: Optional[str] = None,
+    splits: Sequence[str] = ("train", "val", "test"),
+    in_memory: bool = False,
+) -> Tuple[Union[DataLoader, TensorBatchLoader]]:
     """
     Loads data tensors saved in processed data directory and returns as dataloaders.
+    Optionally memory-maps the data files (see load_data_splits for mmap_mode), and only loads the
+    splits requested, e.g. ('train', 'val') for a training step that does not use the test set.
+    With in_memory, returns TensorBatchLoaders, which take batches from the tensors directly without
+    worker processes (n_workers is then ignored), instead of DataLoaders.
     """
-    X_train, X_val, X_test, y_train, y_val, y_test = load_data_splits(
-        dir_processed, as_type="tensor"
+    tensors = load_data_splits(
+        dir_processed,
+        as_type="tensor",
+        mmap_mode=mmap_mode,
+        splits=[f"X_{split}" for split in splits] + [f"y_{split}" for split in splits],
     )
 
     # Convert tensors to dataloaders
     dataloader_args = dict(batch_size=batch_size, num_workers=n_workers, shuffle=True)
 
-    train_loader = create_dataloader(X_train, y_train, dataloader_args)
-    val_loader = create_dataloader(X_val, y_val, dataloader_args)
-    test_loader = create_dataloader(X_test, y_test, dataloader_args)
-
-    return train_loader, val_loader, test_loader
+    create_loader = create_tensor_loader if in_memory else create_dataloader
+    return tuple(
+        create_loader(X, y, dataloader_args)
+        for X, y in zip(tensors[: len(splits)], tensors[len(splits) :])
+    )
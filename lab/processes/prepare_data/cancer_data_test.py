@@ -12,12 +12,16 @@ import torch
 from pandas import DataFrame, Series
 
 from lab.processes.prepare_data.cancer_data import (
+    SPLIT_NAMES,
+    cast_to_storage_dtype,
     load_cancer_data,
     load_data_splits,
     load_data_splits_as_dataloader,
     prepare_cancer_data,
     split_data,
+    split_to_tensor,
 )
+from lab.processes.prepare_data.manifest import MANIFEST_FNAME
 
 
 @pytest.mark.unittest
@@ -61,7 +65,7 @@ class TestCancerDataPreparation:
 
     def test_prepare_cancer_data_saves_npy_arrays(self):
         """
-        Test that prepare_cancer_data saves arrays as .npy files
+        Test that prepare_cancer_data saves arrays as .npy files, along with their manifest
         """
 
         dir_output = "temp"  # Temporarily save the resulting files generated by running the function
@@ -74,8 +78,10 @@ class TestCancerDataPreparation:
 
         files_created = os.listdir(dir_output)
         assert (
-            len(files_created) == 6
-        ), "Expected to find 6 files created by prepare_cancer_data"
+            len(files_created) == 7
+        ), "Expected to find 7 files created by prepare_cancer_data"
+        assert MANIFEST_FNAME in files_created
+        files_created.remove(MANIFEST_FNAME)
         for fname in files_created:
             assert (
                 ".npy" in fname
@@ -106,13 +112,15 @@ class TestCancerDataLoading:
 
     def test_load_data_splits_as_torch_tensors(self, temp_data_dir):
         """
-        Test that data splits can be loaded as torch tensors.
+        Test that data splits can be loaded as torch tensors, with float32 features.
         Note: requires dir_temp populated with .npy files as generated by prepare_cancer_data, prepared by
         test fixture temp_cancer_data_dir (in conftest.py)
         """
         result = load_data_splits(dir_processed=temp_data_dir, as_type="tensor")
         for tensor in result:
             assert isinstance(tensor, torch.Tensor)
+        for tensor in result[:3]:
+            assert tensor.dtype == torch.float32
 
     def test_load_data_splits_as_dataloader(self, temp_data_dir):
         """
@@ -125,3 +133,99 @@ class TestCancerDataLoading:
         )
         for loader in result:
             assert isinstance(loader, torch.utils.data.DataLoader)
+
+    def test_load_data_splits_selected_splits(self, temp_data_dir):
+        """
+        Test that only the requested splits are returned, in the requested order, for each output format
+        Note: requires dir_temp populated with .npy files as generated by prepare_cancer_data, prepared by
+        test fixture temp_cancer_data_dir (in conftest.py)
+        """
+        all_splits = dict(
+            zip(SPLIT_NAMES, load_data_splits(temp_data_dir, as_type="array"))
+        )
+        splits = ("y_val", "X_train", "X_val")
+
+        selected = load_data_splits(temp_data_dir, as_type="array", splits=splits)
+
+        assert len(selected) == 3
+        for name, array in zip(splits, selected):
+            np.testing.assert_array_equal(array, all_splits[name])
+
+        with pytest.raises(ValueError):
+            load_data_splits(temp_data_dir, as_type="array", splits=("X_holdout",))
+
+    def test_load_data_splits_as_dataloader_selected_splits(self, temp_data_dir):
+        """
+        Test that dataloaders are only created for the requested splits
+        Note: requires dir_temp populated with .npy files as generated by prepare_cancer_data, prepared by
+        test fixture temp_cancer_data_dir (in conftest.py)
+        """
+        train_loader, val_loader = load_data_splits_as_dataloader(
+            dir_processed=temp_data_dir,
+            batch_size=4,
+            n_workers=0,
+            splits=("train", "val"),
+        )
+
+        assert len(train_loader.dataset) > len(val_loader.dataset)
+
+    def test_load_data_splits_memory_mapped(self, temp_data_dir):
+        """
+        Test that data splits can be memory-mapped and hold the same values as the splits read into memory.
+        Note: requires dir_temp populated with .npy files as generated by prepare_cancer_data, prepared by
+        test fixture temp_cancer_data_dir (in conftest.py)
+        """
+        in_memory = load_data_splits(dir_processed=temp_data_dir, as_type="array")
+        mapped = load_data_splits(
+            dir_processed=temp_data_dir, as_type="array", mmap_mode="r"
+        )
+        for array, mapped_array in zip(in_memory, mapped):
+            assert isinstance(mapped_array, np.memmap)
+            np.testing.assert_array_equal(array, mapped_array)
+
+        tensors = load_data_splits(
+            dir_processed=temp_data_dir, as_type="tensor", mmap_mode="r"
+        )
+        for name, array, tensor in zip(SPLIT_NAMES, in_memory, tensors):
+            assert torch.equal(tensor, split_to_tensor(array, name))
+
+    def test_load_data_splits_tensors_share_memory_with_mapped_files(self, tmp_path):
+        """
+        Test that tensors loaded from memory-mapped float32 files are views of the files rather than copies
+        """
+        for name in SPLIT_NAMES:
+            np.save(str(tmp_path / f"{name}.npy"), np.zeros((4, 3), dtype=np.float32))
+
+        X_train = load_data_splits(
+            dir_processed=tmp_path, as_type="tensor", mmap_mode="r+"
+        )[0]
+        X_train[0, 0] = 1.0
+        del X_train
+
+        assert np.load(str(tmp_path / "X_train.npy"))[0, 0] == 1.0
+
+    def test_load_data_splits_keeps_storage_dtypes(self, tmp_path):
+        """
+        Test that splits prepared with compact storage dtypes are loaded as arrays of those dtypes, and as
+        float32 feature tensors and label tensors of the storage dtype
+        """
+        prepare_cancer_data(
+            dir_output=str(tmp_path), feature_dtype="float16", label_dtype="uint8"
+        )
+
+        arrays = load_data_splits(dir_processed=tmp_path, as_type="array")
+        tensors = load_data_splits(dir_processed=tmp_path, as_type="tensor")
+
+        for array, tensor in zip(arrays[:3], tensors[:3]):
+            assert array.dtype == np.float16 and tensor.dtype == torch.float32
+            assert torch.equal(tensor, torch.from_numpy(array).float())
+        for array, tensor in zip(arrays[3:], tensors[3:]):
+            assert array.dtype == np.uint8 and tensor.dtype == torch.uint8
+        assert os.path.getsize(tmp_path / "X_train.npy") < 8 * arrays[0].size / 3
+
+    def test_cast_to_storage_dtype_rejects_labels_not_fitting_dtype(self):
+        """
+        Test that labels are not silently truncated by an integer storage dtype that cannot hold them
+        """
+        with pytest.raises(ValueError):
+            cast_to_storage_dtype(np.array([0, 1, 300]), "uint8")
@@ -0,0 +1,183 @@
+"""
+Functions for persisting stratified K-fold cross-validation folds with the processed data (in the indexed
+format, see indexed.py) and for iterating over the folds when training models
+"""
+
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+from lab.processes.prepare_data.cancer_data import (
+    RANDOM_STATE,
+    TEST_SIZE,
+    split_to_tensor,
+)
+from lab.processes.prepare_data.indexed import FEATURES_FNAME, TARGET_FNAME
+from lab.processes.prepare_data.manifest import (
+    artifact_is_stored,
+    hash_array,
+    read_manifest,
+    write_manifest,
+)
+
+
+def get_cv_folds_fname(n_folds: int, random_state: int) -> str:
+    """
+    Returns the file name of the cross-validation folds with the given number of folds and seed
+    """
+    return f"cv_k{n_folds}_rs{random_state}.npz"
+
+
+def compute_cv_folds(
+    X: np.ndarray,
+    y: np.ndarray,
+    n_folds: int,
+    random_state: int = RANDOM_STATE,
+    test_size: float = TEST_SIZE,
+) -> dict:
+    """
+    Holds out a test set (the same as in the train/val/test split with the same seed) and assigns the
+    remaining rows to stratified folds. For each fold, computes the mean and scale of the features over the
+    rows of all other folds, so that standardizing a fold's training data never uses its validation rows.
+
+    Args:
+        X: (numpy ndarray) feature matrix (possibly memory-mapped)
+        y: (numpy ndarray) target
+        n_folds: (int) number of folds
+        random_state: (int) seed of the test set hold-out and the fold assignment
+        test_size: (float) fraction of rows in the test set
+
+    Returns:
+        (dict) of numpy arrays:
+            - trainval: row indices of the rows used for cross-validation
+            - test: row indices of the held-out test set
+            - folds: fold number of each of the trainval rows
+            - mean, scale: (n_folds, n_features) training statistics of each fold
+    """
+    index_dtype = np.int32 if len(y) < np.iinfo(np.int32).max else np.int64
+    idx_trainval, idx_test = train_test_split(
+        np.arange(len(y), dtype=index_dtype),
+        test_size=test_size,
+        random_state=random_state,
+        stratify=y,
+    )
+
+    folds = np.empty(len(idx_trainval), dtype=np.int8)
+    kfold = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    for fold, (_, rows_val) in enumerate(kfold.split(idx_trainval, y[idx_trainval])):
+        folds[rows_val] = fold
+
+    # Per-fold sums, combined into the statistics of all other folds without gathering them
+    counts = np.bincount(folds, minlength=n_folds)
+    sums = np.zeros((n_folds, X.shape[1]))
+    sums_sq = np.zeros((n_folds, X.shape[1]))
+    for fold in range(n_folds):
+        X_fold = np.asarray(X[idx_trainval[folds == fold]], dtype=np.float64)
+        sums[fold] = X_fold.sum(axis=0)
+        sums_sq[fold] = (X_fold**2).sum(axis=0)
+
+    n_train = (counts.sum() - counts)[:, np.newaxis]
+    mean = (sums.sum(axis=0) - sums) / n_train
+    var = (sums_sq.sum(axis=0) - sums_sq) / n_train - mean**2
+    scale = np.sqrt(np.clip(var, 0.0, None))
+    scale[scale == 0.0] = 1.0
+
+    return dict(
+        trainval=idx_trainval, test=idx_test, folds=folds, mean=mean, scale=scale
+    )
+
+
+def add_cv_folds(
+    dir_processed: Union[str, Path],
+    n_folds: int,
+    random_state: int = RANDOM_STATE,
+    test_size: float = TEST_SIZE,
+) -> str:
+    """
+    Computes cross-validation folds (see compute_cv_folds) for processed data stored in the indexed format,
+    saves them next to the data and records them in the manifest. The file is not rewritten if the manifest
+    shows it to be stored with the same contents already.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format
+        n_folds: (int) number of folds
+        random_state: (int) seed of the test set hold-out and the fold assignment
+        test_size: (float) fraction of rows in the test set
+
+    Returns:
+        (str) file name of the saved folds
+    """
+    X = np.load(str(Path(dir_processed) / FEATURES_FNAME), mmap_mode="r")
+    y = np.load(str(Path(dir_processed) / TARGET_FNAME))
+
+    cv_folds = compute_cv_folds(X, y, n_folds, random_state, test_size)
+    fname = get_cv_folds_fname(n_folds, random_state)
+    digest = hash_array(np.array([hash_array(array) for array in cv_folds.values()]))
+
+    manifest = read_manifest(dir_processed)
+    if not artifact_is_stored(dir_processed, manifest, fname, digest):
+        np.savez(str(Path(dir_processed) / fname), **cv_folds)
+
+    manifest["artifacts"][fname] = dict(
+        sha256=digest, size=(Path(dir_processed) / fname).stat().st_size
+    )
+    write_manifest(dir_processed, manifest)
+
+    return fname
+
+
+def iter_cv_folds(
+    dir_processed: Union[str, Path],
+    n_folds: int,
+    random_state: int = RANDOM_STATE,
+    as_type: str = "array",
+    mmap_mode: Optional[str] = None,
+) -> Iterator[Tuple]:
+    """
+    Iterates over the stored cross-validation folds, gathering the training and validation data of one
+    fold at a time and standardizing both with the training statistics of that fold. The folds keep the
+    dtypes of the stored feature matrix and target, except for feature tensors, which are float32 (see
+    cancer_data.split_to_tensor).
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format,
+            with folds added by add_cv_folds
+        n_folds: (int) number of folds
+        random_state: (int) seed the folds were computed with
+        as_type: (str) type of outputs; one of 'array' (numpy ndarray) or 'tensor' (pytorch tensor)
+        mmap_mode: (str or None) memory-map mode for the stored feature matrix and target
+
+    Yields:
+        (tuple) of fold number (int) and numpy arrays or torch tensors for X_train, X_val, y_train, y_val
+    """
+    if as_type not in ("array", "tensor"):
+        raise ValueError(
+            "Please specify as_type argument as one of 'array' or 'tensor'"
+        )
+
+    X = np.load(str(Path(dir_processed) / FEATURES_FNAME), mmap_mode=mmap_mode)
+    y = np.load(str(Path(dir_processed) / TARGET_FNAME), mmap_mode=mmap_mode)
+    with np.load(
+        str(Path(dir_processed) / get_cv_folds_fname(n_folds, random_state))
+    ) as cv_folds:
+        idx_trainval, folds = cv_folds["trainval"], cv_folds["folds"]
+        mean, scale = cv_folds["mean"], cv_folds["scale"]
+
+    for fold in range(n_folds):
+        idx_train = idx_trainval[folds != fold]
+        idx_val = idx_trainval[folds == fold]
+        arrays = (
+            ((X[idx_train] - mean[fold]) / scale[fold]).astype(X.dtype),
+            ((X[idx_val] - mean[fold]) / scale[fold]).astype(X.dtype),
+            y[idx_train],
+            y[idx_val],
+        )
+        if as_type == "tensor":
+            arrays = tuple(
+                split_to_tensor(array, name)
+                for array, name in zip(arrays, ("X_train", "X_val", "y_train", "y_val"))
+            )
+
+        yield (fold, *arrays)
@@ -0,0 +1,78 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/cross_validation.py
+"""
+
+import numpy as np
+import pytest
+import torch
+from sklearn.preprocessing import StandardScaler
+
+from lab.processes.prepare_data.cancer_data import prepare_cancer_data
+from lab.processes.prepare_data.cross_validation import (
+    add_cv_folds,
+    compute_cv_folds,
+    iter_cv_folds,
+)
+from lab.processes.prepare_data.indexed import split_indices
+from lab.processes.prepare_data.manifest import read_manifest
+
+
+@pytest.mark.unittest
+class TestCrossValidationFolds:
+    """
+    Tests for computing, storing and iterating over cross-validation folds
+    """
+
+    def test_folds_are_stratified_and_hold_out_the_test_set(self):
+        """
+        Test that the folds partition the non-test rows with balanced classes, and that the held-out test
+        set is the same as in the default train/val/test split
+        """
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(1000, 3))
+        y = (rng.random(1000) < 0.3).astype(np.int64)
+
+        cv_folds = compute_cv_folds(X, y, n_folds=5)
+
+        _, _, idx_test = split_indices(y, random_state=42, test_size=0.15, val_size=0.2)
+        np.testing.assert_array_equal(np.sort(cv_folds["test"]), np.sort(idx_test))
+        assert np.bincount(cv_folds["folds"]).tolist() == [170] * 5
+        y_trainval = y[cv_folds["trainval"]]
+        for fold in range(5):
+            assert abs(y_trainval[cv_folds["folds"] == fold].mean() - 0.3) < 0.02
+
+    def test_fold_statistics_exclude_validation_rows(self):
+        """
+        Test that the scaler statistics of each fold match a StandardScaler fitted on the other folds only
+        """
+        X = np.random.default_rng(0).normal(loc=3.0, size=(300, 4))
+        y = np.arange(300) % 2
+
+        cv_folds = compute_cv_folds(X, y, n_folds=3)
+
+        for fold in range(3):
+            rows_train = cv_folds["trainval"][cv_folds["folds"] != fold]
+            scaler = StandardScaler().fit(X[rows_train])
+            np.testing.assert_allclose(cv_folds["mean"][fold], scaler.mean_)
+            np.testing.assert_allclose(cv_folds["scale"][fold], scaler.scale_)
+
+    def test_iter_cv_folds_yields_standardized_folds(self, tmp_path):
+        """
+        Test that the stored folds are iterated in order, as standardized tensors covering all non-test rows
+        """
+        prepare_cancer_data(dir_output=str(tmp_path), output_format="indexed")
+        fname = add_cv_folds(tmp_path, n_folds=4)
+        assert fname in read_manifest(tmp_path)["artifacts"]
+
+        folds = list(iter_cv_folds(tmp_path, n_folds=4, as_type="tensor"))
+
+        assert [fold for fold, *_ in folds] == [0, 1, 2, 3]
+        n_val_rows = 0
+        for _, X_train, X_val, y_train, y_val in folds:
+            assert isinstance(X_train, torch.Tensor)
+            assert len(X_train) == len(y_train) and len(X_val) == len(y_val)
+            assert torch.allclose(
+                X_train.mean(dim=0), torch.zeros(30, dtype=X_train.dtype), atol=1e-5
+            )
+            n_val_rows += len(X_val)
+        assert n_val_rows == len(X_train) + len(X_val)
@@ -0,0 +1,255 @@
+"""
+Functions for appending new labelled rows to processed data stored in the indexed format (see indexed.py),
+without rerunning the whole preparation:
+- the new rows are appended in place to the stored (unscaled) feature matrix and target
+- each split variant assigns the new rows to its splits, stratified by label within each batch of new
+    rows (see assign_rows_to_splits), and updates its running training statistics with the new training
+    rows only
+- the dataset version in the manifest is increased, so that downstream steps can record which version
+    they were trained on (see manifest.get_dataset_version)
+"""
+
+import hashlib
+import io
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+from numpy.lib import format as npy_format
+from pandas import DataFrame, Series
+from sklearn.preprocessing import StandardScaler
+
+from lab.processes.prepare_data.cancer_data import cast_to_storage_dtype
+from lab.processes.prepare_data.indexed import (
+    FEATURES_FNAME,
+    TARGET_FNAME,
+    get_split_variant_fname,
+    parse_split_variant_name,
+    write_split_variant,
+)
+from lab.processes.prepare_data.manifest import (
+    hash_array,
+    hash_data,
+    read_manifest,
+    remove_stale_artifacts,
+    write_manifest,
+)
+from lab.processes.prepare_data.streaming import SPLITS, TEST, TRAIN, VAL
+
+
+def append_rows_to_npy(filepath: Union[str, Path], rows: np.ndarray) -> None:
+    """
+    Appends rows to the end of a C-ordered .npy file. The rows are written after the stored data and the
+    shape in the file header is updated in place, so the cost depends on the number of new rows only.
+    If the updated header does not fit in the space of the current one, the file is rewritten instead.
+
+    Args:
+        filepath: (str or Path) location of the .npy file
+        rows: (numpy ndarray) rows with the dtype and trailing dimensions of the stored array
+    """
+    with open(filepath, "r+b") as npy_file:
+        version = npy_format.read_magic(npy_file)
+        read_header, write_header = (
+            (npy_format.read_array_header_1_0, npy_format.write_array_header_1_0)
+            if version == (1, 0)
+            else (npy_format.read_array_header_2_0, npy_format.write_array_header_2_0)
+        )
+        shape, fortran_order, dtype = read_header(npy_file)
+        data_offset = npy_file.tell()
+        if fortran_order or dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+            raise ValueError(
+                f"Rows of dtype {rows.dtype} and shape {rows.shape} cannot be appended to {filepath}"
+            )
+
+        header = io.BytesIO()
+        write_header(
+            header,
+            dict(
+                descr=npy_format.dtype_to_descr(dtype),
+                fortran_order=False,
+                shape=(shape[0] + len(rows), *shape[1:]),
+            ),
+        )
+
+        if len(header.getvalue()) == data_offset:
+            npy_file.seek(0, io.SEEK_END)
+            npy_file.write(np.ascontiguousarray(rows).data)
+            npy_file.seek(0)
+            npy_file.write(header.getvalue())
+            return
+
+    stored = np.load(str(filepath))
+    np.save(str(filepath), np.concatenate([stored, rows]))
+
+
+def _chain_digest(digest: str, rows: np.ndarray) -> str:
+    """
+    Returns the digest of a stored artifact after appending rows, from its previous digest and the rows
+    """
+    return hashlib.sha256(f"{digest}{hash_array(rows)}".encode()).hexdigest()
+
+
+def assign_rows_to_splits(
+    y: np.ndarray, test_size: float, val_size: float, random_state: int
+) -> np.ndarray:
+    """
+    Assigns a batch of rows to the train, val and test splits, stratified by label: each class is split in
+    the requested proportions, its number of rows per split rounded with the largest remainder method (so
+    that the counts add up to the rows of the class), and its rows are assigned in a seeded random order.
+
+    Args:
+        y: (numpy ndarray) labels of the rows
+        test_size: (float) fraction of the rows in the test set
+        val_size: (float) fraction of the remaining (non-test) rows in the validation set
+        random_state: (int) seed of the random order of the rows of each class
+
+    Returns:
+        (numpy ndarray) of int8 split assignments (TRAIN, VAL or TEST), one per row
+    """
+    proportions = np.array(
+        [(1 - test_size) * (1 - val_size), (1 - test_size) * val_size, test_size]
+    )
+    rng = np.random.default_rng(random_state)
+    assignments = np.empty(len(y), dtype=np.int8)
+    for label in np.unique(y):
+        rows = np.flatnonzero(y == label)
+        shares = len(rows) * proportions
+        counts = np.floor(shares).astype(int)
+        # Give the rows left by rounding down to the splits with the largest remainders
+        n_left = len(rows) - counts.sum()
+        counts[np.argsort(counts - shares, kind="stable")[:n_left]] += 1
+        assignments[rng.permutation(rows)] = np.repeat(
+            np.array([TRAIN, VAL, TEST], dtype=np.int8), counts
+        )
+    return assignments
+
+
+def _append_to_split_variant(
+    dir_processed: Union[str, Path],
+    split_variant: str,
+    X_new: np.ndarray,
+    y_new: np.ndarray,
+    n_rows_stored: int,
+    version: int,
+    manifest: dict,
+) -> dict:
+    """
+    Assigns the new rows to the splits of a split variant and updates its training statistics.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format
+        split_variant: (str) name of the split variant (see indexed.get_split_variant_name)
+        X_new: (numpy ndarray) features of the new rows
+        y_new: (numpy ndarray) target of the new rows
+        n_rows_stored: (int) number of rows stored before the new rows, i.e. the index of the first new row
+        version: (int) dataset version after the append, used to seed the split assignment of the new rows
+        manifest: (dict) manifest of the outputs currently stored in dir_processed
+
+    Returns:
+        (dict) manifest entry of the updated split variant file
+    """
+    random_state, test_size, val_size = parse_split_variant_name(split_variant)
+    fname = get_split_variant_fname(split_variant)
+    with np.load(str(Path(dir_processed) / fname)) as variant:
+        arrays = dict(variant)
+
+    seed = int(np.random.SeedSequence([random_state, version]).generate_state(1)[0])
+    assignments = assign_rows_to_splits(y_new, test_size, val_size, seed)
+
+    index_dtype = np.result_type(
+        arrays["train"].dtype, np.min_scalar_type(n_rows_stored + len(y_new))
+    )
+    for index, split in zip((TRAIN, VAL, TEST), SPLITS):
+        new_indices = n_rows_stored + np.flatnonzero(assignments == index)
+        arrays[split] = np.concatenate([arrays[split], new_indices]).astype(index_dtype)
+
+    X_train_new = X_new[assignments == TRAIN]
+    if len(X_train_new):
+        # Continue the scaler fit from the stored statistics of the previous training rows
+        scaler = StandardScaler()
+        scaler.n_samples_seen_ = np.full(
+            X_new.shape[1], len(arrays["train"]) - len(X_train_new), dtype=np.int64
+        )
+        scaler.mean_ = arrays["mean"]
+        scaler.var_ = arrays["var"] if "var" in arrays else arrays["scale"] ** 2
+        scaler.scale_ = arrays["scale"]
+        scaler.partial_fit(X_train_new)
+        arrays.update(mean=scaler.mean_, var=scaler.var_, scale=scaler.scale_)
+
+    return write_split_variant(dir_processed, fname, arrays, manifest)
+
+
+def append_data(
+    dir_processed: Union[str, Path], X_new: DataFrame, y_new: Series
+) -> int:
+    """
+    Appends new labelled rows to processed data stored in the indexed format (see the module docstring).
+    The work done only depends on the number of new rows, except for the split variant files, which hold
+    a row index per stored row and are rewritten.
+
+    Other artifacts derived from the stored rows, such as cross-validation folds, are removed, as they do
+    not cover the new rows; they can be recomputed with cross_validation.add_cv_folds. Note that rerunning
+    prepare_cancer_data with changed inputs rebuilds the processed data from its source, without the
+    appended rows.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format
+        X_new: (pandas DataFrame) features of the new rows, in the order of the stored features
+        y_new: (pandas Series) target of the new rows
+
+    Returns:
+        (int) the dataset version after the append
+    """
+    manifest = read_manifest(dir_processed)
+    filepath_X = Path(dir_processed) / FEATURES_FNAME
+    filepath_y = Path(dir_processed) / TARGET_FNAME
+    if FEATURES_FNAME not in manifest.get("artifacts", {}):
+        raise ValueError(
+            f"Rows can only be appended to processed data in the indexed format, "
+            f"which {dir_processed} does not hold"
+        )
+
+    X = np.load(str(filepath_X), mmap_mode="r")
+    y = np.load(str(filepath_y), mmap_mode="r")
+    n_rows_stored = len(y)
+    X_rows = cast_to_storage_dtype(X_new.to_numpy(), X.dtype)
+    y_rows = cast_to_storage_dtype(y_new.to_numpy(), y.dtype)
+    if X_rows.shape[1:] != X.shape[1:] or len(X_rows) != len(y_rows):
+        raise ValueError(
+            f"Expected new rows with {X.shape[1]} features and one label each, "
+            f"got features of shape {X_rows.shape} and {len(y_rows)} labels"
+        )
+    del X, y
+
+    version = manifest.get("version", 1) + 1
+    artifacts = {}
+    for fname, rows in [(FEATURES_FNAME, X_rows), (TARGET_FNAME, y_rows)]:
+        append_rows_to_npy(Path(dir_processed) / fname, rows)
+        artifacts[fname] = dict(
+            sha256=_chain_digest(manifest["artifacts"][fname]["sha256"], rows),
+            size=(Path(dir_processed) / fname).stat().st_size,
+        )
+
+    for fname in manifest["artifacts"]:
+        if fname.startswith("split_"):
+            split_variant = fname[len("split_") : -len(".npz")]
+            artifacts.update(
+                _append_to_split_variant(
+                    dir_processed,
+                    split_variant,
+                    X_rows,
+                    y_rows,
+                    n_rows_stored,
+                    version,
+                    manifest,
+                )
+            )
+
+    remove_stale_artifacts(dir_processed, artifacts)
+    manifest.update(artifacts=artifacts, version=version)
+    manifest.setdefault("appends", []).append(
+        dict(version=version, n_rows=len(y_rows), source_hash=hash_data(X_new, y_new))
+    )
+    write_manifest(dir_processed, manifest)
+
+    return version
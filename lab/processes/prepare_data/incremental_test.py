@@ -0,0 +1,166 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/incremental.py
+"""
+
+import numpy as np
+import pytest
+
+from lab.processes.prepare_data.cancer_data import (
+    load_cancer_data,
+    load_data_splits,
+    prepare_cancer_data,
+)
+from lab.processes.prepare_data.cross_validation import add_cv_folds
+from lab.processes.prepare_data.incremental import append_data, append_rows_to_npy
+from lab.processes.prepare_data.indexed import parse_split_variant_name
+from lab.processes.prepare_data.manifest import (
+    get_dataset_version,
+    is_up_to_date,
+    read_manifest,
+)
+
+
+@pytest.fixture(name="cancer_data_halves")
+def split_cancer_data_in_halves():
+    """
+    Pytest fixture that yields the breast cancer data split into a first and a second half
+    """
+    X, y = load_cancer_data()
+    yield (X.iloc[:300], y.iloc[:300]), (X.iloc[300:], y.iloc[300:])
+
+
+@pytest.mark.unittest
+class TestAppendRowsToNpy:
+    """
+    Tests for appending rows to .npy files in place
+    """
+
+    def test_rows_are_appended_in_place(self, tmp_path):
+        """
+        Test that the appended file holds the stored and the new rows
+        """
+        filepath = tmp_path / "array.npy"
+        stored = np.arange(12, dtype=np.float32).reshape(4, 3)
+        np.save(str(filepath), stored)
+        new_rows = -np.arange(6, dtype=np.float32).reshape(2, 3)
+
+        append_rows_to_npy(filepath, new_rows)
+        append_rows_to_npy(filepath, new_rows[:1])
+
+        np.testing.assert_array_equal(
+            np.load(str(filepath)), np.concatenate([stored, new_rows, new_rows[:1]])
+        )
+
+    def test_rows_of_another_dtype_are_rejected(self, tmp_path):
+        """
+        Test that rows are not appended to a file holding a different dtype
+        """
+        filepath = tmp_path / "array.npy"
+        np.save(str(filepath), np.zeros((4, 3), dtype=np.float32))
+
+        with pytest.raises(ValueError):
+            append_rows_to_npy(filepath, np.zeros((1, 3), dtype=np.float64))
+
+
+@pytest.mark.unittest
+class TestAppendData:
+    """
+    Tests for appending new rows to processed data in the indexed format
+    """
+
+    def test_appended_rows_are_split_and_scaled_with_updated_statistics(
+        self, tmp_path, cancer_data_halves
+    ):
+        """
+        Test that all appended rows are assigned to splits, that the training statistics match a scaler
+        fitted on all training rows, and that the dataset version is increased
+        """
+        (X_first, y_first), (X_second, y_second) = cancer_data_halves
+        prepare_cancer_data(
+            dir_output=str(tmp_path),
+            output_format="indexed",
+            load_data=lambda: (X_first, y_first),
+        )
+        assert get_dataset_version(tmp_path) == 1
+
+        version = append_data(tmp_path, X_second, y_second)
+
+        assert version == get_dataset_version(tmp_path) == 2
+        X_train, X_val, X_test, y_train, y_val, y_test = load_data_splits(
+            tmp_path, as_type="array"
+        )
+        assert len(y_train) + len(y_val) + len(y_test) == 569
+        np.testing.assert_allclose(X_train.mean(axis=0), 0.0, atol=1e-10)
+        np.testing.assert_allclose(X_train.std(axis=0), 1.0, atol=1e-10)
+
+    def test_each_class_of_a_small_append_is_split_in_proportion(
+        self, tmp_path, cancer_data_halves
+    ):
+        """
+        Test that the rows of each class of a small appended batch are assigned to the val and test splits
+        in the proportions of the split variant, up to rounding
+        """
+        (X_first, y_first), (X_second, y_second) = cancer_data_halves
+        prepare_cancer_data(
+            dir_output=str(tmp_path),
+            output_format="indexed",
+            load_data=lambda: (X_first, y_first),
+        )
+        batch = np.concatenate(
+            [np.flatnonzero(y_second == 0)[:13], np.flatnonzero(y_second == 1)[:20]]
+        )
+
+        append_data(tmp_path, X_second.iloc[batch], y_second.iloc[batch])
+
+        y_new = y_second.to_numpy()[batch]
+        (fname,) = [
+            fname
+            for fname in read_manifest(tmp_path)["artifacts"]
+            if fname.startswith("split_")
+        ]
+        _, test_size, val_size = parse_split_variant_name(
+            fname[len("split_") : -len(".npz")]
+        )
+        with np.load(str(tmp_path / fname)) as variant:
+            for split, share in [
+                ("val", (1 - test_size) * val_size),
+                ("test", test_size),
+            ]:
+                new_rows = variant[split][variant[split] >= len(y_first)] - len(y_first)
+                for label in (0, 1):
+                    n_class = (y_new == label).sum()
+                    n_split = (y_new[new_rows] == label).sum()
+                    assert n_split >= 1
+                    assert abs(n_split - n_class * share) < 1
+
+    def test_append_keeps_the_stored_outputs_valid(self, tmp_path, cancer_data_halves):
+        """
+        Test that rerunning the preparation after an append is a no-op, and that cross-validation folds,
+        which do not cover the new rows, are removed
+        """
+        (X_first, y_first), (X_second, y_second) = cancer_data_halves
+        prepare_cancer_data(
+            dir_output=str(tmp_path),
+            output_format="indexed",
+            load_data=lambda: (X_first, y_first),
+        )
+        fname_folds = add_cv_folds(tmp_path, n_folds=3)
+
+        append_data(tmp_path, X_second.iloc[:10], y_second.iloc[:10])
+        append_data(tmp_path, X_second.iloc[10:], y_second.iloc[10:])
+
+        manifest = read_manifest(tmp_path)
+        assert manifest["version"] == 3
+        assert [entry["n_rows"] for entry in manifest["appends"]] == [10, 259]
+        assert is_up_to_date(tmp_path, manifest, manifest["inputs"])
+        assert not (tmp_path / fname_folds).exists()
+
+    def test_append_requires_the_indexed_format(self, tmp_path, cancer_data_halves):
+        """
+        Test that rows cannot be appended to the (scaled) splits of the npy format
+        """
+        _, (X_second, y_second) = cancer_data_halves
+        prepare_cancer_data(dir_output=str(tmp_path))
+
+        with pytest.raises(ValueError):
+            append_data(tmp_path, X_second, y_second)
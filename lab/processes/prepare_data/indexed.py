@@ -0,0 +1,224 @@
+"""
+Functions for storing the feature matrix and target once, with the data splits kept as compact index
+arrays (split variants), so that any number of split seeds and ratios can be kept for little extra disk
+space and memory. The splits are gathered from the stored matrix when loaded.
+"""
+
+import re
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from lab.processes.prepare_data.manifest import (
+    artifact_is_stored,
+    hash_array,
+    read_manifest,
+    write_manifest,
+)
+
+FEATURES_FNAME = "X.npy"
+TARGET_FNAME = "y.npy"
+
+
+def get_split_variant_name(random_state: int, test_size: float, val_size: float) -> str:
+    """
+    Returns the name identifying the split variant with the given seed and split ratios
+    """
+    return f"rs{random_state}_test{test_size}_val{val_size}"
+
+
+def parse_split_variant_name(split_variant: str) -> Tuple[int, float, float]:
+    """
+    Returns the seed, test size and validation size of the split variant with the given name
+    """
+    random_state, test_size, val_size = re.fullmatch(
+        r"rs(-?\d+)_test([\d.e-]+)_val([\d.e-]+)", split_variant
+    ).groups()
+    return int(random_state), float(test_size), float(val_size)
+
+
+def get_split_variant_fname(split_variant: str) -> str:
+    """
+    Returns the file name of the split variant with the given name
+    """
+    return f"split_{split_variant}.npz"
+
+
+def split_indices(
+    y: np.ndarray, random_state: int, test_size: float, val_size: float
+) -> Tuple[np.ndarray]:
+    """
+    Splits the row indices of a dataset into train/val/test sets, stratified by target. The splits are
+    the same as obtained by split_data with the same seed and ratios.
+
+    Args:
+        y: (numpy ndarray) target
+        random_state: (int) seed of the splits
+        test_size: (float) fraction of rows in the test set
+        val_size: (float) fraction of the remaining (non-test) rows in the validation set
+
+    Returns:
+        (tuple) of numpy arrays with the row indices of the train, val and test sets
+    """
+    index_dtype = np.int32 if len(y) < np.iinfo(np.int32).max else np.int64
+    indices = np.arange(len(y), dtype=index_dtype)
+
+    idx_trainval, idx_test = train_test_split(
+        indices, test_size=test_size, random_state=random_state, stratify=y
+    )
+    idx_train, idx_val = train_test_split(
+        idx_trainval,
+        test_size=val_size,
+        random_state=random_state,
+        stratify=y[idx_trainval],
+    )
+    return idx_train, idx_val, idx_test
+
+
+def save_split_variant(
+    dir_output: Union[str, Path],
+    X: np.ndarray,
+    y: np.ndarray,
+    random_state: int,
+    test_size: float,
+    val_size: float,
+    manifest: dict,
+) -> dict:
+    """
+    Saves a split variant: the row indices of each split and the mean, variance and scale of the training
+    features (used to standardize all splits of the variant when loaded, and to update the statistics when
+    rows are appended). The file is not rewritten if the manifest shows it to be stored with the same
+    contents already.
+
+    Args:
+        dir_output: (str or Path) directory holding the stored feature matrix and target
+        X: (numpy ndarray) feature matrix (possibly memory-mapped)
+        y: (numpy ndarray) target
+        random_state: (int) seed of the splits
+        test_size: (float) fraction of rows in the test set
+        val_size: (float) fraction of the remaining (non-test) rows in the validation set
+        manifest: (dict) manifest of the outputs currently stored in dir_output
+
+    Returns:
+        (dict) manifest entry of the saved file
+    """
+    idx_train, idx_val, idx_test = split_indices(y, random_state, test_size, val_size)
+    X_train = X[idx_train]
+    mean = X_train.mean(axis=0, dtype=np.float64)
+    var = X_train.var(axis=0, dtype=np.float64)
+    scale = np.sqrt(var)
+    scale[scale == 0.0] = 1.0
+
+    fname = get_split_variant_fname(
+        get_split_variant_name(random_state, test_size, val_size)
+    )
+    arrays = dict(
+        train=idx_train, val=idx_val, test=idx_test, mean=mean, var=var, scale=scale
+    )
+    return write_split_variant(dir_output, fname, arrays, manifest)
+
+
+def write_split_variant(
+    dir_output: Union[str, Path], fname: str, arrays: dict, manifest: dict
+) -> dict:
+    """
+    Writes the arrays of a split variant to its file, unless the manifest shows it to be stored with the
+    same contents already.
+
+    Args:
+        dir_output: (str or Path) directory holding the stored feature matrix and target
+        fname: (str) file name of the split variant (see get_split_variant_fname)
+        arrays: (dict) of numpy arrays: the row indices of the train, val and test sets and the training
+            statistics of the variant
+        manifest: (dict) manifest of the outputs currently stored in dir_output
+
+    Returns:
+        (dict) manifest entry of the file
+    """
+    digest = hash_array(np.array([hash_array(array) for array in arrays.values()]))
+    if not artifact_is_stored(dir_output, manifest, fname, digest):
+        np.savez(str(Path(dir_output) / fname), **arrays)
+
+    return {fname: dict(sha256=digest, size=(Path(dir_output) / fname).stat().st_size)}
+
+
+def add_split_variant(
+    dir_processed: Union[str, Path],
+    random_state: int,
+    test_size: float,
+    val_size: float,
+) -> str:
+    """
+    Adds a new split variant to processed data stored in the indexed format, recording it in the manifest.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format
+        random_state: (int) seed of the splits
+        test_size: (float) fraction of rows in the test set
+        val_size: (float) fraction of the remaining (non-test) rows in the validation set
+
+    Returns:
+        (str) name of the split variant, to pass to load_data_splits
+    """
+    X = np.load(str(Path(dir_processed) / FEATURES_FNAME), mmap_mode="r")
+    y = np.load(str(Path(dir_processed) / TARGET_FNAME))
+
+    manifest = read_manifest(dir_processed)
+    manifest["artifacts"].update(
+        save_split_variant(
+            dir_processed, X, y, random_state, test_size, val_size, manifest
+        )
+    )
+    write_manifest(dir_processed, manifest)
+
+    return get_split_variant_name(random_state, test_size, val_size)
+
+
+def load_split_variant(
+    dir_processed: Union[str, Path],
+    split_variant: str,
+    mmap_mode: Optional[str] = None,
+    splits: Sequence[str] = (
+        "X_train",
+        "X_val",
+        "X_test",
+        "y_train",
+        "y_val",
+        "y_test",
+    ),
+) -> Tuple[np.ndarray]:
+    """
+    Loads the data splits of a split variant, gathering its rows from the stored feature matrix and target
+    and standardizing the features with the training set statistics of the variant. The splits keep the
+    dtypes of the stored feature matrix and target.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files in the indexed format
+        split_variant: (str) name of the split variant (see get_split_variant_name)
+        mmap_mode: (str or None) memory-map mode for the stored feature matrix and target, so that only the
+            rows in the splits are read from disk
+        splits: (sequence of str) names of the splits to load, e.g. ('X_train', 'y_train')
+
+    Returns:
+        (tuple) of numpy arrays for the requested splits, in the requested order
+    """
+    X = np.load(str(Path(dir_processed) / FEATURES_FNAME), mmap_mode=mmap_mode)
+    y = np.load(str(Path(dir_processed) / TARGET_FNAME), mmap_mode=mmap_mode)
+
+    with np.load(
+        str(Path(dir_processed) / get_split_variant_fname(split_variant))
+    ) as variant:
+        mean, scale = variant["mean"], variant["scale"]
+        indices = {split: variant[split] for split in ("train", "val", "test")}
+
+    arrays = []
+    for name in splits:
+        data, split = name.split("_")
+        if data == "X":
+            arrays.append(((X[indices[split]] - mean) / scale).astype(X.dtype))
+        else:
+            arrays.append(y[indices[split]])
+
+    return tuple(arrays)
@@ -0,0 +1,92 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/indexed.py and the indexed output format
+of prepare_cancer_data
+"""
+
+import numpy as np
+import pytest
+
+from lab.processes.prepare_data.cancer_data import (
+    load_data_splits,
+    prepare_cancer_data,
+    split_data,
+)
+from lab.processes.prepare_data.indexed import (
+    FEATURES_FNAME,
+    add_split_variant,
+    get_split_variant_fname,
+    split_indices,
+)
+
+
+@pytest.mark.unittest
+class TestSplitIndices:
+    """
+    Tests for splitting datasets by row index
+    """
+
+    def test_split_indices_match_split_data(self):
+        """
+        Test that the index splits select the same rows as the materialized splits of split_data
+        """
+        X = np.arange(1000).reshape(500, 2)
+        y = np.random.default_rng(0).integers(0, 2, size=500)
+
+        X_train, X_val, X_test, _, _, _ = split_data(X=X, y=y)
+        idx_train, idx_val, idx_test = split_indices(
+            y, random_state=42, test_size=0.15, val_size=0.2
+        )
+
+        np.testing.assert_array_equal(X[idx_train], X_train)
+        np.testing.assert_array_equal(X[idx_val], X_val)
+        np.testing.assert_array_equal(X[idx_test], X_test)
+        assert idx_train.dtype == np.int32
+
+
+@pytest.mark.unittest
+class TestIndexedPreparation:
+    """
+    Tests for prepare_cancer_data with the indexed output format and for split variants
+    """
+
+    def test_indexed_output_loads_as_the_npy_output(self, tmp_path):
+        """
+        Test that the default split variant holds the same (scaled) splits as the .npy files
+        """
+        prepare_cancer_data(dir_output=str(tmp_path / "npy"))
+        prepare_cancer_data(
+            dir_output=str(tmp_path / "indexed"), output_format="indexed"
+        )
+
+        for from_npy, from_indexed in zip(
+            load_data_splits(tmp_path / "npy", as_type="array"),
+            load_data_splits(tmp_path / "indexed", as_type="array", mmap_mode="r"),
+        ):
+            np.testing.assert_allclose(from_npy, from_indexed, atol=1e-12)
+
+    def test_added_split_variant_is_small_and_kept_on_rerun(self, tmp_path):
+        """
+        Test that a new split variant only stores indices and scaler statistics, loads different splits
+        than the default variant and is kept when the preparation is rerun with the same inputs
+        """
+        prepare_cancer_data(dir_output=str(tmp_path), output_format="indexed")
+
+        split_variant = add_split_variant(
+            tmp_path, random_state=7, test_size=0.2, val_size=0.25
+        )
+        filepath_variant = tmp_path / get_split_variant_fname(split_variant)
+        assert (
+            filepath_variant.stat().st_size
+            < (tmp_path / FEATURES_FNAME).stat().st_size / 10
+        )
+
+        X_train_default = load_data_splits(tmp_path, as_type="array")[0]
+        X_train, X_val, X_test, y_train, y_val, y_test = load_data_splits(
+            tmp_path, as_type="array", split_variant=split_variant
+        )
+        assert len(X_train) + len(X_val) + len(X_test) == 569
+        assert len(y_test) == len(X_test)
+        assert X_train.shape != X_train_default.shape
+
+        prepare_cancer_data(dir_output=str(tmp_path), output_format="indexed")
+        assert filepath_variant.is_file()
@@ -7,14 +7,42 @@ import configparser
 import os
 
 from lab.processes.prepare_data.cancer_data import prepare_cancer_data
+from lab.processes.prepare_data.cross_validation import add_cv_folds
+from lab.processes.prepare_data.streaming import (
+    check_streaming_options,
+    iter_cancer_data_chunks,
+    prepare_data_streaming,
+)
 
 PATH_CONFIG = os.getenv("PATH_CONFIG")
 config = configparser.ConfigParser()
 config.read(str(PATH_CONFIG))
 
 DIR_DATA_PROCESSED = config["paths"]["dir_processed"]
+CHUNKSIZE = config.get("preparation", "chunksize", fallback="")
+OUTPUT_FORMAT = config.get("preparation", "output_format", fallback="npy")
+N_FOLDS = config.get("preparation", "n_folds", fallback="")
+FEATURE_DTYPE = config.get("preparation", "feature_dtype", fallback="float64")
+LABEL_DTYPE = config.get("preparation", "label_dtype", fallback="int64")
 
 
 if __name__ == "__main__":
 
-    prepare_cancer_data(dir_output=DIR_DATA_PROCESSED)
+    if CHUNKSIZE:
+        check_streaming_options(output_format=OUTPUT_FORMAT, n_folds=int(N_FOLDS or 0))
+        prepare_data_streaming(
+            chunks=lambda: iter_cancer_data_chunks(chunksize=int(CHUNKSIZE)),
+            dir_output=DIR_DATA_PROCESSED,
+            feature_dtype=FEATURE_DTYPE,
+            label_dtype=LABEL_DTYPE,
+        )
+    else:
+        prepare_cancer_data(
+            dir_output=DIR_DATA_PROCESSED,
+            output_format=OUTPUT_FORMAT,
+            feature_dtype=FEATURE_DTYPE,
+            label_dtype=LABEL_DTYPE,
+        )
+
+    if N_FOLDS:
+        add_cv_folds(dir_processed=DIR_DATA_PROCESSED, n_folds=int(N_FOLDS))
@@ -0,0 +1,221 @@
+"""
+Functions for fingerprinting the inputs and outputs of the data preparation, recorded in a manifest
+next to the processed data so that unchanged work can be skipped on later runs
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+from pandas import DataFrame, Series
+
+MANIFEST_FNAME = "manifest.json"
+
+
+class ArrayHasher:
+    """
+    Computes the digest of an array (as returned by hash_array) incrementally, from consecutive blocks of
+    rows, for arrays that are written to disk in parts and never held in memory as a whole.
+    """
+
+    def __init__(self, dtype: np.dtype, shape: tuple):
+        self._hasher = hashlib.sha256()
+        self._hasher.update(f"{np.dtype(dtype).str}{tuple(shape)}".encode())
+
+    def update(self, rows: np.ndarray) -> None:
+        """
+        Feeds the next block of rows of the array into the digest
+        """
+        self._hasher.update(np.ascontiguousarray(rows).data)
+
+    def hexdigest(self) -> str:
+        """
+        Returns the hexadecimal digest of the rows fed so far
+        """
+        return self._hasher.hexdigest()
+
+
+def _update_hash(hasher, array: np.ndarray) -> None:
+    """
+    Feeds the dtype, shape and contents of an array into a hashlib hasher
+    """
+    hasher.update(f"{array.dtype.str}{array.shape}".encode())
+    hasher.update(np.ascontiguousarray(array).data)
+
+
+def hash_array(array: np.ndarray) -> str:
+    """
+    Computes a sha256 digest of the contents of a numpy array (including its dtype and shape).
+
+    Args:
+        array: (numpy ndarray) the array to fingerprint
+
+    Returns:
+        (str) hexadecimal digest
+    """
+    hasher = ArrayHasher(array.dtype, array.shape)
+    hasher.update(array)
+    return hasher.hexdigest()
+
+
+def hash_data(X: DataFrame, y: Series) -> str:
+    """
+    Computes a sha256 digest of a source dataset given as features (X) and target (y), including the
+    feature names.
+
+    Args:
+        X: (pandas DataFrame) input features
+        y: (pandas Series) target
+
+    Returns:
+        (str) hexadecimal digest
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([str(column) for column in X.columns]).encode())
+    _update_hash(hasher, X.to_numpy())
+    _update_hash(hasher, y.to_numpy())
+    return hasher.hexdigest()
+
+
+def hash_file(filepath: Union[str, Path]) -> str:
+    """
+    Computes a sha256 digest of the contents of a file (e.g. a source file, to use as code version)
+    """
+    return hashlib.sha256(Path(filepath).read_bytes()).hexdigest()
+
+
+def hash_code(dirpath: Union[str, Path]) -> str:
+    """
+    Computes a sha256 digest of the Python modules in a directory, except tests (*_test.py), to use as code
+    version of the data preparation: a change to any of the modules producing the processed data (not only
+    the one running it) then invalidates the stored outputs.
+
+    Args:
+        dirpath: (str or Path) directory of the modules
+
+    Returns:
+        (str) hexadecimal digest
+    """
+    hasher = hashlib.sha256()
+    for filepath in sorted(Path(dirpath).glob("*.py")):
+        if not filepath.name.endswith("_test.py"):
+            hasher.update(filepath.name.encode())
+            hasher.update(Path(filepath).read_bytes())
+    return hasher.hexdigest()
+
+
+def read_manifest(dir_processed: Union[str, Path]) -> dict:
+    """
+    Reads the manifest stored in the processed data directory.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+
+    Returns:
+        (dict) the manifest contents, or an empty dict if there is no (readable) manifest
+    """
+    filepath = Path(dir_processed) / MANIFEST_FNAME
+    try:
+        with open(filepath, encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_manifest(dir_processed: Union[str, Path], manifest: dict) -> None:
+    """
+    Writes the manifest to the processed data directory. The file is replaced atomically, so that readers
+    never see a partially written manifest.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+        manifest: (dict) JSON-serializable manifest contents
+    """
+    filepath = Path(dir_processed) / MANIFEST_FNAME
+    filepath_tmp = filepath.with_suffix(".tmp")
+    with open(filepath_tmp, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(filepath_tmp, filepath)
+
+
+def get_dataset_version(dir_processed: Union[str, Path]) -> Optional[int]:
+    """
+    Returns the version of the processed data, starting at 1 when prepared and increased by every append of
+    new rows (see incremental.py), or None if there is no manifest.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+
+    Returns:
+        (int or None) the dataset version recorded in the manifest
+    """
+    manifest = read_manifest(dir_processed)
+    return manifest.get("version", 1) if manifest else None
+
+
+def artifact_is_stored(
+    dir_processed: Union[str, Path],
+    manifest: dict,
+    fname: str,
+    digest: Optional[str] = None,
+) -> bool:
+    """
+    Checks that an artifact listed in the manifest exists on disk with the recorded size and, if a digest
+    is given, that the manifest records that same content digest for it.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+        manifest: (dict) manifest contents as returned by read_manifest
+        fname: (str) file name of the artifact within dir_processed
+        digest: (str or None) expected content digest of the artifact
+
+    Returns:
+        (bool) True if the stored artifact can be reused as is
+    """
+    entry = manifest.get("artifacts", {}).get(fname)
+    if entry is None or (digest is not None and entry["sha256"] != digest):
+        return False
+
+    filepath = Path(dir_processed) / fname
+    return filepath.is_file() and filepath.stat().st_size == entry["size"]
+
+
+def is_up_to_date(
+    dir_processed: Union[str, Path], manifest: dict, inputs: dict
+) -> bool:
+    """
+    Checks whether the processed data directory holds all artifacts produced from the given inputs.
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+        manifest: (dict) manifest contents as returned by read_manifest
+        inputs: (dict) fingerprint of the inputs (source data hash, parameters, code version)
+
+    Returns:
+        (bool) True if the inputs match the manifest and all its artifacts are stored
+    """
+    return (
+        bool(manifest.get("artifacts"))
+        and manifest.get("inputs") == inputs
+        and all(
+            artifact_is_stored(dir_processed, manifest, fname)
+            for fname in manifest["artifacts"]
+        )
+    )
+
+
+def remove_stale_artifacts(dir_processed: Union[str, Path], artifacts: dict) -> None:
+    """
+    Removes the artifacts listed in the stored manifest that are not among the artifacts just produced
+    (e.g. the .npy files left behind after switching to the packed format).
+
+    Args:
+        dir_processed: (str or Path) directory containing processed data files
+        artifacts: (dict) manifest entries of the artifacts produced by the current run
+    """
+    stored_artifacts = read_manifest(dir_processed).get("artifacts", {})
+    for fname in set(stored_artifacts) - set(artifacts):
+        (Path(dir_processed) / fname).unlink(missing_ok=True)
@@ -0,0 +1,136 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/manifest.py and their use in prepare_cancer_data
+"""
+
+import numpy as np
+import pytest
+
+from lab.processes.prepare_data import cancer_data
+from lab.processes.prepare_data.cancer_data import prepare_cancer_data
+from lab.processes.prepare_data.manifest import (
+    hash_array,
+    hash_code,
+    is_up_to_date,
+    read_manifest,
+    write_manifest,
+)
+
+
+def get_modification_times(dir_processed) -> dict:
+    """
+    Returns the modification time (in ns) of each .npy file in dir_processed
+    """
+    return {path.name: path.stat().st_mtime_ns for path in dir_processed.glob("*.npy")}
+
+
+@pytest.mark.unittest
+class TestManifest:
+    """
+    Tests for fingerprinting arrays and reading/writing manifests
+    """
+
+    def test_hash_array_depends_on_contents_dtype_and_shape(self):
+        """
+        Test that the array digest changes with any of the contents, dtype or shape of the array
+        """
+        array = np.arange(6, dtype=np.int64)
+
+        assert hash_array(array) == hash_array(array.copy())
+        assert hash_array(array) != hash_array(array + 1)
+        assert hash_array(array) != hash_array(array.astype(np.int32))
+        assert hash_array(array) != hash_array(array.reshape(2, 3))
+
+    def test_hash_code_covers_every_module_but_tests(self, tmp_path):
+        """
+        Test that the code version changes with any module of the directory, but not with its tests
+        """
+        (tmp_path / "prepare.py").write_text("STEP = 1\n")
+        (tmp_path / "packed.py").write_text("FORMAT = 1\n")
+        (tmp_path / "packed_test.py").write_text("TEST = 1\n")
+        code_version = hash_code(tmp_path)
+
+        (tmp_path / "packed_test.py").write_text("TEST = 2\n")
+        assert hash_code(tmp_path) == code_version
+
+        (tmp_path / "packed.py").write_text("FORMAT = 2\n")
+        assert hash_code(tmp_path) != code_version
+
+    def test_manifest_roundtrip(self, tmp_path):
+        """
+        Test that a written manifest is read back unchanged, and that a missing one reads as empty
+        """
+        assert read_manifest(tmp_path) == {}
+
+        manifest = dict(inputs=dict(random_state=42), artifacts={})
+        write_manifest(tmp_path, manifest)
+
+        assert read_manifest(tmp_path) == manifest
+
+    def test_is_up_to_date_requires_matching_inputs_and_stored_artifacts(
+        self, tmp_path
+    ):
+        """
+        Test that the outputs are only considered up to date with the same inputs and all artifacts in place
+        """
+        (tmp_path / "a.npy").write_bytes(b"1234")
+        manifest = dict(
+            inputs=dict(random_state=42),
+            artifacts={"a.npy": dict(sha256="digest", size=4)},
+        )
+
+        assert is_up_to_date(tmp_path, manifest, dict(random_state=42))
+        assert not is_up_to_date(tmp_path, manifest, dict(random_state=0))
+
+        (tmp_path / "a.npy").write_bytes(b"12")
+        assert not is_up_to_date(tmp_path, manifest, dict(random_state=42))
+
+
+@pytest.mark.unittest
+class TestCachedPreparation:
+    """
+    Tests for skipping unchanged work in prepare_cancer_data
+    """
+
+    def test_rerun_with_identical_inputs_is_a_no_op(self, tmp_path):
+        """
+        Test that rerunning prepare_cancer_data with the same inputs does not rewrite any file
+        """
+        prepare_cancer_data(dir_output=str(tmp_path))
+        mtimes_before = get_modification_times(tmp_path)
+
+        prepare_cancer_data(dir_output=str(tmp_path))
+
+        assert get_modification_times(tmp_path) == mtimes_before
+
+    def test_only_missing_artifacts_are_rebuilt(self, tmp_path):
+        """
+        Test that a deleted output file is recreated without rewriting the other ones
+        """
+        prepare_cancer_data(dir_output=str(tmp_path))
+        (tmp_path / "X_test.npy").unlink()
+        mtimes_before = get_modification_times(tmp_path)
+
+        prepare_cancer_data(dir_output=str(tmp_path))
+
+        mtimes_after = get_modification_times(tmp_path)
+        assert "X_test.npy" in mtimes_after
+        mtimes_after.pop("X_test.npy")
+        assert mtimes_after == mtimes_before
+
+    def test_changed_split_parameters_rebuild_affected_artifacts(
+        self, tmp_path, monkeypatch
+    ):
+        """
+        Test that changing the validation split size rewrites the train/val splits and records the new inputs,
+        while the test labels (unaffected by that parameter) are kept
+        """
+        prepare_cancer_data(dir_output=str(tmp_path))
+        mtimes_before = get_modification_times(tmp_path)
+
+        monkeypatch.setattr(cancer_data, "VAL_SIZE", 0.25)
+        prepare_cancer_data(dir_output=str(tmp_path))
+
+        mtimes_after = get_modification_times(tmp_path)
+        assert mtimes_after["y_test.npy"] == mtimes_before["y_test.npy"]
+        assert mtimes_after["y_train.npy"] != mtimes_before["y_train.npy"]
+        assert read_manifest(tmp_path)["inputs"]["val_size"] == 0.25
@@ -0,0 +1,126 @@
+"""
+Functions for storing all data splits in a single packed Parquet file, together with the feature names,
+dtypes and the statistics of the fitted scaler, and for reading back one split and a subset of its columns
+
+pyarrow is only imported by the functions reading and writing the packed file, so that the data preparation
+and training steps only depend on it when they use the packed format.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+PACKED_FNAME = "splits.parquet"
+SPLIT_COLUMN = "split"
+SPLIT_CODES = {"train": 0, "val": 1, "test": 2}
+METADATA_KEY = b"splits_metadata"
+
+
+def save_packed_splits(
+    filepath: Union[str, Path],
+    splits: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    feature_names: List[str],
+    scaler: StandardScaler,
+    target_name: str = "target",
+    row_group_size: int = 100_000,
+) -> None:
+    """
+    Saves the data splits to a single Parquet file, one column per feature plus the target and a split code
+    column. Each split is written as its own row groups, so that reading one split skips all others.
+    The feature names, dtypes, split sizes and scaler statistics are stored in the file metadata.
+
+    Args:
+        filepath: (str or Path) destination file
+        splits: (dict) mapping split names ('train', 'val', 'test') to tuples of (X, y) numpy arrays
+        feature_names: (list of str) names of the columns of X
+        scaler: (StandardScaler) the fitted scaler used to transform X
+        target_name: (str) name of the target column
+        row_group_size: (int) maximum number of rows per row group
+
+    Returns:
+        (None)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    X_first, y_first = next(iter(splits.values()))
+    dtypes = {name: X_first.dtype.str for name in feature_names}
+    dtypes[target_name] = y_first.dtype.str
+
+    metadata = dict(
+        feature_names=feature_names,
+        target_name=target_name,
+        dtypes=dtypes,
+        n_rows={split: len(y) for split, (_, y) in splits.items()},
+        scaler=dict(
+            mean=scaler.mean_.tolist(),
+            scale=scaler.scale_.tolist(),
+            var=scaler.var_.tolist(),
+            n_samples_seen=int(np.max(scaler.n_samples_seen_)),
+        ),
+    )
+    schema = pa.schema(
+        [(name, pa.from_numpy_dtype(X_first.dtype)) for name in feature_names]
+        + [
+            (target_name, pa.from_numpy_dtype(y_first.dtype)),
+            (SPLIT_COLUMN, pa.int8()),
+        ],
+        metadata={METADATA_KEY: json.dumps(metadata).encode()},
+    )
+
+    with pq.ParquetWriter(str(filepath), schema) as writer:
+        for split, (X, y) in splits.items():
+            columns = [X[:, index] for index in range(X.shape[1])]
+            columns += [y, np.full(len(y), SPLIT_CODES[split], dtype=np.int8)]
+            table = pa.Table.from_arrays(
+                [pa.array(column) for column in columns], schema=schema
+            )
+            writer.write_table(table, row_group_size=row_group_size)
+
+
+def read_packed_metadata(filepath: Union[str, Path]) -> dict:
+    """
+    Reads the metadata stored with the packed splits (feature_names, target_name, dtypes, n_rows and
+    scaler statistics), without reading any data.
+    """
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(str(filepath))
+    return json.loads(schema.metadata[METADATA_KEY])
+
+
+def load_packed_split(
+    filepath: Union[str, Path], split: str, columns: Optional[List[str]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Loads a single split from the packed splits file, optionally reading only some of the feature columns.
+
+    Args:
+        filepath: (str or Path) location of the packed splits file
+        split: (str) one of 'train', 'val' or 'test'
+        columns: (list of str or None) names of the features to read, or None to read all features
+
+    Returns:
+        (tuple) of numpy arrays X (with the requested columns, in the requested order) and y
+    """
+    import pyarrow.parquet as pq
+
+    metadata = read_packed_metadata(filepath)
+    columns = metadata["feature_names"] if columns is None else list(columns)
+    target_name = metadata["target_name"]
+
+    table = pq.read_table(
+        str(filepath),
+        columns=columns + [target_name],
+        filters=[(SPLIT_COLUMN, "=", SPLIT_CODES[split])],
+    )
+    dtype = np.dtype(metadata["dtypes"][columns[0]]) if columns else np.float64
+    X = np.empty((table.num_rows, len(columns)), dtype=dtype)
+    for index, name in enumerate(columns):
+        X[:, index] = table.column(name).to_numpy()
+    y = table.column(target_name).to_numpy()
+
+    return X, y
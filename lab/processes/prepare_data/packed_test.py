@@ -0,0 +1,158 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/packed.py and the packed output format
+of prepare_cancer_data
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from lab.processes.prepare_data.cancer_data import (
+    load_data_splits,
+    prepare_cancer_data,
+)
+from lab.processes.prepare_data.manifest import MANIFEST_FNAME
+from lab.processes.prepare_data.packed import (
+    PACKED_FNAME,
+    load_packed_split,
+    read_packed_metadata,
+    save_packed_splits,
+)
+
+
+@pytest.fixture(name="packed_filepath")
+def packed_splits_file(tmp_path):
+    """
+    Pytest fixture that saves small random train/val/test splits to a packed file and yields its location
+    along with the splits saved
+    """
+    rng = np.random.default_rng(0)
+    splits = {
+        split: (rng.normal(size=(n_rows, 4)), rng.integers(0, 2, size=n_rows))
+        for split, n_rows in [("train", 50), ("val", 20), ("test", 10)]
+    }
+    scaler = StandardScaler().fit(splits["train"][0])
+    filepath = tmp_path / PACKED_FNAME
+
+    save_packed_splits(
+        filepath,
+        splits,
+        feature_names=["a", "b", "c", "d"],
+        scaler=scaler,
+        row_group_size=16,
+    )
+
+    yield filepath, splits, scaler
+
+
+@pytest.mark.unittest
+class TestPackedSplits:
+    """
+    Tests for saving and loading the packed splits file
+    """
+
+    def test_each_split_is_read_back_unchanged(self, packed_filepath):
+        """
+        Test that reading one split returns exactly the arrays saved for that split
+        """
+        filepath, splits, _ = packed_filepath
+
+        for split, (X, y) in splits.items():
+            X_loaded, y_loaded = load_packed_split(filepath, split)
+            np.testing.assert_array_equal(X_loaded, X)
+            np.testing.assert_array_equal(y_loaded, y)
+            assert X_loaded.dtype == X.dtype
+            assert y_loaded.dtype == y.dtype
+
+    def test_column_projection(self, packed_filepath):
+        """
+        Test that only the requested feature columns are returned, in the requested order
+        """
+        filepath, splits, _ = packed_filepath
+
+        X_loaded, _ = load_packed_split(filepath, "val", columns=["c", "a"])
+
+        np.testing.assert_array_equal(X_loaded, splits["val"][0][:, [2, 0]])
+
+    def test_metadata_holds_feature_names_and_scaler_statistics(self, packed_filepath):
+        """
+        Test that the file metadata describes the features, split sizes and fitted scaler
+        """
+        filepath, _, scaler = packed_filepath
+
+        metadata = read_packed_metadata(filepath)
+
+        assert metadata["feature_names"] == ["a", "b", "c", "d"]
+        assert metadata["n_rows"] == dict(train=50, val=20, test=10)
+        np.testing.assert_allclose(metadata["scaler"]["mean"], scaler.mean_)
+        np.testing.assert_allclose(metadata["scaler"]["scale"], scaler.scale_)
+
+
+@pytest.mark.unittest
+class TestPackedPreparation:
+    """
+    Tests for prepare_cancer_data with the packed output format
+    """
+
+    def test_packed_output_loads_as_the_npy_output(self, tmp_path):
+        """
+        Test that the packed format holds the same splits as the .npy files, in a single file
+        """
+        prepare_cancer_data(dir_output=str(tmp_path / "npy"))
+        prepare_cancer_data(dir_output=str(tmp_path / "packed"), output_format="packed")
+
+        assert sorted(os.listdir(tmp_path / "packed")) == sorted(
+            [PACKED_FNAME, MANIFEST_FNAME]
+        )
+        for from_npy, from_packed in zip(
+            load_data_splits(tmp_path / "npy", as_type="array"),
+            load_data_splits(tmp_path / "packed", as_type="array"),
+        ):
+            np.testing.assert_array_equal(from_npy, from_packed)
+
+    def test_selected_splits_are_read_from_the_packed_file(self, tmp_path):
+        """
+        Test that the requested splits are returned in the requested order from the packed file
+        """
+        prepare_cancer_data(dir_output=str(tmp_path), output_format="packed")
+        filepath = tmp_path / PACKED_FNAME
+
+        y_val, X_train = load_data_splits(
+            tmp_path, as_type="array", splits=("y_val", "X_train")
+        )
+
+        np.testing.assert_array_equal(X_train, load_packed_split(filepath, "train")[0])
+        np.testing.assert_array_equal(y_val, load_packed_split(filepath, "val")[1])
+
+    def test_switching_format_removes_previous_outputs(self, tmp_path):
+        """
+        Test that the .npy files are removed when the same directory is prepared in the packed format
+        """
+        prepare_cancer_data(dir_output=str(tmp_path))
+        prepare_cancer_data(dir_output=str(tmp_path), output_format="packed")
+
+        assert not list(tmp_path.glob("*.npy"))
+
+    def test_npy_output_does_not_need_pyarrow(self, tmp_path):
+        """
+        Test that the npy output format is prepared and loaded in a process where pyarrow cannot be imported,
+        as it is only needed by the packed format
+        """
+        script = "\n".join(
+            [
+                "import sys",
+                "class BlockPyarrow:",
+                "    def find_spec(self, name, path=None, target=None):",
+                "        if name.split('.')[0] == 'pyarrow':",
+                "            raise ImportError(name)",
+                "sys.meta_path.insert(0, BlockPyarrow())",
+                "from lab.processes.prepare_data.cancer_data import load_data_splits, prepare_cancer_data",
+                f"prepare_cancer_data(dir_output={str(tmp_path)!r})",
+                f"load_data_splits({str(tmp_path)!r}, as_type='array')",
+            ]
+        )
+        subprocess.run([sys.executable, "-c", script], check=True)
@@ -0,0 +1,269 @@
+"""
+Functions for preparing datasets that do not fit in memory, reading the source data in chunks:
+- rows are assigned to train/val/test splits in a stratified way as they stream past
+- the StandardScaler is fitted incrementally on the training rows
+- the transformed chunks are written as consecutive row blocks (shards) of the output .npy files
+
+The output has the same layout as prepare_cancer_data (including the manifest), so it can be loaded with
+load_data_splits, preferably memory-mapped.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from pandas import DataFrame, Series
+from sklearn.preprocessing import StandardScaler
+
+from lab.processes.prepare_data.cancer_data import (
+    RANDOM_STATE,
+    SPLIT_NAMES,
+    TEST_SIZE,
+    VAL_SIZE,
+    cast_to_storage_dtype,
+    load_cancer_data,
+)
+from lab.processes.prepare_data.manifest import (
+    ArrayHasher,
+    hash_code,
+    is_up_to_date,
+    read_manifest,
+    remove_stale_artifacts,
+    write_manifest,
+)
+
+TRAIN, VAL, TEST = 0, 1, 2
+SPLITS = ("train", "val", "test")
+
+ChunkSource = Callable[[], Iterable[Tuple[DataFrame, Series]]]
+
+
+class StratifiedStreamSplitter:
+    """
+    Assigns streamed rows to the train (0), val (1) and test (2) splits, stratified by label.
+
+    The rows of each class are assigned from shuffled blocks of block_size assignments holding the split
+    proportions, so every class is split in the requested proportions up to one block. Each class has its
+    own random generator (seeded by random_state and the order in which the classes first appear), so the
+    assignments do not depend on how the rows are chunked and can be reproduced in a second pass.
+    """
+
+    def __init__(
+        self,
+        test_size: float = TEST_SIZE,
+        val_size: float = VAL_SIZE,
+        random_state: int = RANDOM_STATE,
+        block_size: int = 1000,
+    ):
+        n_test = round(block_size * test_size)
+        n_val = round((block_size - n_test) * val_size)
+        n_train = block_size - n_test - n_val
+        self._block = np.repeat(
+            np.array([TRAIN, VAL, TEST], dtype=np.int8), [n_train, n_val, n_test]
+        )
+        self._random_state = random_state
+        self._generators = {}
+        self._pending = {}
+
+    def _take(self, label, n_rows: int) -> np.ndarray:
+        """
+        Takes the next n_rows assignments for the class label, drawing new shuffled blocks as needed
+        """
+        if label not in self._generators:
+            self._generators[label] = np.random.default_rng(
+                [self._random_state, len(self._generators)]
+            )
+            self._pending[label] = self._block[:0]
+
+        pending = self._pending[label]
+        if len(pending) < n_rows:
+            n_blocks = -(-(n_rows - len(pending)) // len(self._block))
+            new_blocks = [
+                self._generators[label].permutation(self._block)
+                for _ in range(n_blocks)
+            ]
+            pending = np.concatenate([pending, *new_blocks])
+
+        self._pending[label] = pending[n_rows:]
+        return pending[:n_rows]
+
+    def assign(self, y: np.ndarray) -> np.ndarray:
+        """
+        Assigns the next rows of the stream to splits.
+
+        Args:
+            y: (numpy ndarray) labels of the next rows
+
+        Returns:
+            (numpy ndarray) of int8 split assignments (TRAIN, VAL or TEST), one per row
+        """
+        assignments = np.empty(len(y), dtype=np.int8)
+        labels, first_positions = np.unique(y, return_index=True)
+        # Visit classes in order of appearance, so that their generators are seeded in a stable order
+        for label in labels[np.argsort(first_positions)]:
+            rows = np.flatnonzero(y == label)
+            assignments[rows] = self._take(label, len(rows))
+        return assignments
+
+
+def iter_cancer_data_chunks(chunksize: int) -> Iterator[Tuple[DataFrame, Series]]:
+    """
+    Yields the breast cancer data (see load_cancer_data) in chunks of chunksize rows
+    """
+    X, y = load_cancer_data()
+    for start in range(0, len(X), chunksize):
+        yield X.iloc[start : start + chunksize], y.iloc[start : start + chunksize]
+
+
+def iter_csv_chunks(
+    filepath: Union[str, Path], target_column: str, chunksize: int
+) -> Iterator[Tuple[DataFrame, Series]]:
+    """
+    Yields the contents of a CSV file in chunks of chunksize rows, as features (X) and target (y).
+
+    Args:
+        filepath: (str or Path) location of the CSV file
+        target_column: (str) name of the column holding the target
+        chunksize: (int) number of rows per chunk
+
+    Yields:
+        (tuple) of pandas DataFrame (features) and Series (target)
+    """
+    for chunk in pd.read_csv(filepath, chunksize=chunksize):
+        yield chunk.drop(columns=target_column), chunk[target_column]
+
+
+def check_streaming_options(output_format: str, n_folds: int) -> None:
+    """
+    Checks that the options of the data preparation can be met by the streaming preparation, which only
+    writes the npy output format, and so cannot store cross-validation folds (which require the indexed
+    format).
+
+    Args:
+        output_format: (str) output format of the processed data, one of 'npy', 'packed' or 'indexed'
+        n_folds: (int) number of cross-validation folds to store, 0 for none
+    """
+    if output_format != "npy":
+        raise ValueError(
+            f"The streaming preparation (chunksize) writes the npy output format, "
+            f"please unset chunksize to prepare the {output_format} format"
+        )
+    if n_folds:
+        raise ValueError(
+            "Cross-validation folds require the indexed output format, which the streaming preparation "
+            "(chunksize) does not write, please unset chunksize or n_folds"
+        )
+
+
+def prepare_data_streaming(
+    chunks: ChunkSource,
+    dir_output: str,
+    random_state: int = RANDOM_STATE,
+    use_cache: bool = True,
+    feature_dtype: str = "float64",
+    label_dtype: str = "int64",
+) -> None:
+    """
+    Prepares a dataset for training and validation in two passes over its chunks, so that memory use is
+    bounded by the chunk size regardless of the number of rows:
+    - Pass 1: assigns rows to splits (see StratifiedStreamSplitter), counts the rows in each split and
+        fits the scaler incrementally on the training rows
+    - Pass 2: replays the same assignments, scales each chunk and writes its rows for each split at the
+        end of the output files, preallocated with the row counts from pass 1
+
+    The outputs ('X_train.npy', 'y_train.npy', etc.) and manifest match those of prepare_cancer_data.
+    With use_cache, pass 2 is skipped if the manifest shows the outputs were already produced from the
+    same source data and parameters.
+
+    Args:
+        chunks: (callable) returning an iterable of (X, y) chunks as pandas DataFrame and Series; called
+            once per pass, so it must yield the same chunks every time
+        dir_output: (str) destination filepath
+        random_state: (int) seed for the split assignments
+        use_cache: (bool) skip writing the outputs if they are up to date
+        feature_dtype: (str) dtype in which the features are stored, e.g. 'float32'
+        label_dtype: (str) integer dtype in which the labels are stored, e.g. 'uint8'
+
+    Returns:
+        (None)
+    """
+    Path(dir_output).mkdir(exist_ok=True)
+
+    # Pass 1: split assignment, row counts and incremental scaler fit
+    splitter = StratifiedStreamSplitter(random_state=random_state)
+    scaler = StandardScaler()
+    source_hasher = hashlib.sha256()
+    counts = np.zeros(len(SPLITS), dtype=np.int64)
+    columns = None
+
+    for X_chunk, y_chunk in chunks():
+        if columns is None:
+            columns = [str(column) for column in X_chunk.columns]
+            source_hasher.update(json.dumps(columns).encode())
+        X_chunk, y_chunk = X_chunk.to_numpy(), y_chunk.to_numpy()
+        source_hasher.update(np.ascontiguousarray(X_chunk).data)
+        source_hasher.update(np.ascontiguousarray(y_chunk).data)
+
+        assignments = splitter.assign(y_chunk)
+        counts += np.bincount(assignments, minlength=len(SPLITS))
+        if np.any(assignments == TRAIN):
+            scaler.partial_fit(X_chunk[assignments == TRAIN])
+
+    inputs = dict(
+        source_hash=source_hasher.hexdigest(),
+        random_state=random_state,
+        test_size=TEST_SIZE,
+        val_size=VAL_SIZE,
+        code_version=hash_code(Path(__file__).parent),
+        mode="streaming",
+        feature_dtype=feature_dtype,
+        label_dtype=label_dtype,
+    )
+    manifest = read_manifest(dir_output) if use_cache else {}
+    if is_up_to_date(dir_output, manifest, inputs):
+        print(f"Processed data in {dir_output} is up to date, skipping preparation")
+        return
+
+    # Pass 2: scaling and writing each chunk's rows at the current end of its split
+    outputs, hashers = {}, {}
+    for split, count in zip(SPLITS, counts.tolist()):
+        for name, shape, dtype in [
+            (f"X_{split}", (count, len(columns)), np.dtype(feature_dtype)),
+            (f"y_{split}", (count,), np.dtype(label_dtype)),
+        ]:
+            filepath = str(Path(dir_output) / f"{name}.npy")
+            outputs[name] = open_memmap(filepath, mode="w+", dtype=dtype, shape=shape)
+            hashers[name] = ArrayHasher(dtype, shape)
+
+    splitter = StratifiedStreamSplitter(random_state=random_state)
+    offsets = np.zeros(len(SPLITS), dtype=np.int64)
+
+    for X_chunk, y_chunk in chunks():
+        y_chunk = cast_to_storage_dtype(y_chunk.to_numpy(), label_dtype)
+        X_scaled = scaler.transform(X_chunk.to_numpy()).astype(feature_dtype)
+        assignments = splitter.assign(y_chunk)
+
+        for index, split in enumerate(SPLITS):
+            rows = assignments == index
+            start, stop = offsets[index], offsets[index] + rows.sum()
+            for name, values in [(f"X_{split}", X_scaled), (f"y_{split}", y_chunk)]:
+                outputs[name][start:stop] = values[rows]
+                hashers[name].update(values[rows])
+            offsets[index] = stop
+
+    artifacts = {}
+    for name in SPLIT_NAMES:
+        outputs[name].flush()
+        fname = f"{name}.npy"
+        artifacts[fname] = dict(
+            sha256=hashers[name].hexdigest(),
+            size=(Path(dir_output) / fname).stat().st_size,
+        )
+    del outputs
+
+    remove_stale_artifacts(dir_output, artifacts)
+    write_manifest(dir_output, dict(inputs=inputs, artifacts=artifacts, version=1))
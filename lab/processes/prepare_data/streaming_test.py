@@ -0,0 +1,137 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/streaming.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lab.processes.prepare_data.cancer_data import load_cancer_data, load_data_splits
+from lab.processes.prepare_data.manifest import hash_array, read_manifest
+from lab.processes.prepare_data.streaming import (
+    TEST,
+    TRAIN,
+    VAL,
+    StratifiedStreamSplitter,
+    check_streaming_options,
+    iter_cancer_data_chunks,
+    iter_csv_chunks,
+    prepare_data_streaming,
+)
+
+
+@pytest.mark.unittest
+class TestStratifiedStreamSplitter:
+    """
+    Tests for the assignment of streamed rows to splits
+    """
+
+    def test_each_class_is_split_in_the_requested_proportions(self):
+        """
+        Test that every class gets (approximately) the requested train/val/test proportions
+        """
+        y = np.random.default_rng(0).integers(0, 2, size=20_000)
+
+        assignments = StratifiedStreamSplitter(test_size=0.15, val_size=0.2).assign(y)
+
+        for label in (0, 1):
+            fractions = np.bincount(assignments[y == label], minlength=3) / np.sum(
+                y == label
+            )
+            np.testing.assert_allclose(
+                fractions[[TRAIN, VAL, TEST]], [0.68, 0.17, 0.15], atol=0.01
+            )
+
+    def test_assignments_do_not_depend_on_chunking(self):
+        """
+        Test that streaming the labels in chunks gives the same assignments as a single pass
+        """
+        y = np.random.default_rng(0).integers(0, 3, size=5000)
+
+        single_pass = StratifiedStreamSplitter(random_state=1).assign(y)
+        splitter = StratifiedStreamSplitter(random_state=1)
+        chunked = np.concatenate(
+            [splitter.assign(chunk) for chunk in np.array_split(y, 7)]
+        )
+
+        np.testing.assert_array_equal(single_pass, chunked)
+
+
+@pytest.mark.unittest
+class TestStreamingPreparation:
+    """
+    Tests for the out-of-core preparation of datasets
+    """
+
+    def test_outputs_can_be_loaded_as_data_splits(self, tmp_path):
+        """
+        Test that the streamed outputs hold all rows, scaled with the training set statistics,
+        and load with load_data_splits
+        """
+        prepare_data_streaming(
+            chunks=lambda: iter_cancer_data_chunks(chunksize=100),
+            dir_output=str(tmp_path),
+        )
+
+        X_train, X_val, X_test, y_train, y_val, y_test = load_data_splits(
+            dir_processed=tmp_path, as_type="array", mmap_mode="r"
+        )
+        X, _ = load_cancer_data()
+
+        assert len(X_train) + len(X_val) + len(X_test) == len(X)
+        assert len(y_train) + len(y_val) + len(y_test) == len(X)
+        np.testing.assert_allclose(X_train.mean(axis=0), 0, atol=1e-8)
+        np.testing.assert_allclose(X_train.std(axis=0), 1, atol=1e-8)
+
+    def test_manifest_digests_match_outputs(self, tmp_path):
+        """
+        Test that the incrementally computed digests match the digests of the complete arrays
+        """
+        prepare_data_streaming(
+            chunks=lambda: iter_cancer_data_chunks(chunksize=64),
+            dir_output=str(tmp_path),
+        )
+
+        artifacts = read_manifest(tmp_path)["artifacts"]
+        for fname, entry in artifacts.items():
+            assert entry["sha256"] == hash_array(np.load(str(tmp_path / fname)))
+
+    def test_csv_source_gives_same_outputs_as_in_memory_source(self, tmp_path):
+        """
+        Test that a CSV source read in chunks is prepared the same way as the in-memory data
+        """
+        X, y = load_cancer_data()
+        filepath_csv = tmp_path / "source.csv"
+        pd.concat([X, y], axis=1).to_csv(filepath_csv, index=False)
+
+        prepare_data_streaming(
+            chunks=lambda: iter_cancer_data_chunks(chunksize=100),
+            dir_output=str(tmp_path / "from_memory"),
+        )
+        prepare_data_streaming(
+            chunks=lambda: iter_csv_chunks(filepath_csv, "target", chunksize=150),
+            dir_output=str(tmp_path / "from_csv"),
+        )
+
+        for from_memory, from_csv in zip(
+            load_data_splits(tmp_path / "from_memory", as_type="array"),
+            load_data_splits(tmp_path / "from_csv", as_type="array"),
+        ):
+            np.testing.assert_allclose(from_memory, from_csv)
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize(
+    "output_format, n_folds", [("packed", 0), ("indexed", 0), ("npy", 3)]
+)
+def test_options_not_met_by_the_streaming_preparation_are_rejected(
+    output_format, n_folds
+):
+    """
+    Test that an output format other than npy, or cross-validation folds, raise a ValueError with the
+    streaming preparation, while its default options are accepted
+    """
+    check_streaming_options(output_format="npy", n_folds=0)
+
+    with pytest.raises(ValueError):
+        check_streaming_options(output_format=output_format, n_folds=n_folds)
@@ -0,0 +1,116 @@
+"""
+Synthetic tabular data of any shape, for measuring how the data preparation and loading scale with the
+number of rows and features. The data can be used in place of the breast cancer data, both in memory
+(with prepare_cancer_data) and in chunks (with prepare_data_streaming).
+"""
+
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+BLOCK_ROWS = 65_536
+TARGET_NAME = "target"
+
+
+def _make_block(
+    index: int,
+    n_rows: int,
+    n_features: int,
+    positive_fraction: float,
+    random_state: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generates the rows of one block, with its own random generator so that blocks are independent
+    """
+    rng = np.random.default_rng([random_state, index])
+    y = (rng.random(n_rows) < positive_fraction).astype(np.int64)
+    X = rng.standard_normal((n_rows, n_features))
+    # Shift the features of the positive class, so that the classes can be told apart
+    X += y[:, np.newaxis] * np.random.default_rng(random_state).normal(
+        scale=0.5, size=n_features
+    )
+    return X, y
+
+
+def iter_synthetic_data_chunks(
+    n_rows: int,
+    n_features: int = 30,
+    positive_fraction: float = 0.5,
+    random_state: int = 0,
+    chunksize: int = BLOCK_ROWS,
+) -> Iterator[Tuple[DataFrame, Series]]:
+    """
+    Yields a synthetic binary classification dataset in chunks of chunksize rows, as features (X) and
+    target (y). The features are standard normal, shifted by a fixed random offset for the positive class.
+
+    The rows are generated in blocks of BLOCK_ROWS rows, each from its own seed, so the data is the same
+    for any chunksize and memory use is bounded by the chunk and block sizes.
+
+    Args:
+        n_rows: (int) number of rows
+        n_features: (int) number of features
+        positive_fraction: (float) expected fraction of rows in the positive class (1)
+        random_state: (int) seed of the data
+        chunksize: (int) number of rows per chunk
+
+    Yields:
+        (tuple) of pandas DataFrame (features) and Series (target)
+    """
+    columns = [f"feature_{column}" for column in range(n_features)]
+    X_pending, y_pending = [], []
+    n_pending, start = 0, 0
+
+    for index, block_start in enumerate(range(0, n_rows, BLOCK_ROWS)):
+        block_rows = min(BLOCK_ROWS, n_rows - block_start)
+        X_block, y_block = _make_block(
+            index, block_rows, n_features, positive_fraction, random_state
+        )
+        X_pending.append(X_block)
+        y_pending.append(y_block)
+        n_pending += block_rows
+
+        is_last_block = block_start + block_rows == n_rows
+        if n_pending < chunksize and not is_last_block:
+            continue
+
+        X_rows, y_rows = np.concatenate(X_pending), np.concatenate(y_pending)
+        while len(y_rows) >= chunksize or (is_last_block and len(y_rows) > 0):
+            n_chunk = min(chunksize, len(y_rows))
+            index_chunk = pd.RangeIndex(start, start + n_chunk)
+            yield (
+                DataFrame(X_rows[:n_chunk], columns=columns, index=index_chunk),
+                Series(y_rows[:n_chunk], name=TARGET_NAME, index=index_chunk),
+            )
+            X_rows, y_rows = X_rows[n_chunk:], y_rows[n_chunk:]
+            start += n_chunk
+        X_pending, y_pending = [X_rows], [y_rows]
+        n_pending = len(y_rows)
+
+
+def make_synthetic_data(
+    n_rows: int,
+    n_features: int = 30,
+    positive_fraction: float = 0.5,
+    random_state: int = 0,
+) -> Tuple[DataFrame, Series]:
+    """
+    Generates a synthetic binary classification dataset in memory, as pandas DataFrame (features) and
+    Series (target). The data is the same as yielded by iter_synthetic_data_chunks with the same arguments.
+
+    Args:
+        n_rows: (int) number of rows
+        n_features: (int) number of features
+        positive_fraction: (float) expected fraction of rows in the positive class (1)
+        random_state: (int) seed of the data
+
+    Returns:
+        (tuple) of pandas DataFrame (features) and Series (target)
+    """
+    X, y = next(
+        iter_synthetic_data_chunks(
+            n_rows, n_features, positive_fraction, random_state, chunksize=n_rows
+        )
+    )
+    return X, y
@@ -0,0 +1,63 @@
+"""
+Unit tests for the functions in lab/processes/prepare_data/synthetic_data.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lab.processes.prepare_data.cancer_data import load_data_splits, prepare_cancer_data
+from lab.processes.prepare_data.synthetic_data import (
+    BLOCK_ROWS,
+    iter_synthetic_data_chunks,
+    make_synthetic_data,
+)
+
+
+@pytest.mark.unittest
+class TestSyntheticData:
+    """
+    Tests for generating synthetic tabular data
+    """
+
+    def test_synthetic_data_has_the_requested_shape_and_balance(self):
+        """
+        Test that the generated data has the requested number of rows and features and class balance
+        """
+        X, y = make_synthetic_data(n_rows=20_000, n_features=7, positive_fraction=0.2)
+
+        assert X.shape == (20_000, 7)
+        assert len(y) == 20_000 and set(y.unique()) == {0, 1}
+        assert abs(y.mean() - 0.2) < 0.01
+
+    def test_chunks_do_not_depend_on_chunksize(self):
+        """
+        Test that the data yielded in chunks, across block boundaries, matches the data generated in memory
+        """
+        n_rows = BLOCK_ROWS + 1000
+        X, y = make_synthetic_data(n_rows=n_rows, n_features=3, random_state=5)
+
+        chunks = list(
+            iter_synthetic_data_chunks(
+                n_rows=n_rows, n_features=3, random_state=5, chunksize=10_000
+            )
+        )
+
+        assert [len(X_chunk) for X_chunk, _ in chunks] == [10_000] * 6 + [6536]
+        pd.testing.assert_frame_equal(pd.concat([X_chunk for X_chunk, _ in chunks]), X)
+        pd.testing.assert_series_equal(pd.concat([y_chunk for _, y_chunk in chunks]), y)
+
+    def test_synthetic_data_as_preparation_source(self, tmp_path):
+        """
+        Test that prepare_cancer_data processes synthetic data passed as its data source
+        """
+        prepare_cancer_data(
+            dir_output=str(tmp_path),
+            load_data=lambda: make_synthetic_data(n_rows=2000, n_features=5),
+        )
+
+        X_train, X_val, X_test, _, _, _ = load_data_splits(tmp_path, as_type="array")
+
+        assert len(X_train) + len(X_val) + len(X_test) == 2000
+        assert X_train.shape[1] == 5
+        np.testing.assert_allclose(X_train.mean(axis=0), 0.0, atol=1e-10)
@@ -2,17 +2,43 @@
 A densely connected neural network for binary classification and its usage on the example dataset
 """
 
-from configparser import ConfigParser
+import json
+import math
+from configparser import ConfigParser, SectionProxy
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Optional, Tuple, Union
 
 import numpy as np
+import pandas as pd
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from sklearn.metrics import confusion_matrix
+from torch.utils.data import DataLoader
 
-from lab.processes.prepare_data.cancer_data import load_data_splits_as_dataloader
-from lib.pytorch import train_and_validate, val_loop
+from lab.processes.prepare_data.cancer_data import (
+    load_data_splits,
+    load_data_splits_as_dataloader,
+)
+from lab.processes.prepare_data.cross_validation import iter_cv_folds
+from lab.processes.prepare_data.manifest import get_dataset_version
+from lib.autotune import autotune_training
+from lib.distributed import is_main_process, run_data_parallel
+from lib.history import HistoryRecorder
+from lib.profiling import create_training_profiler
+from lib.pytorch import (
+    HISTORY_COLUMNS,
+    TensorBatchLoader,
+    create_dataloader,
+    create_tensor_loader,
+    create_warmup_scheduler,
+    get_run_key,
+    scale_learning_rate,
+    shard_loader,
+    train_and_validate,
+    val_loop,
+)
 from lib.viz import plot_confusion_matrix, plot_training_history
 
 
@@ -58,11 +84,432 @@ class DenseNN(nn.Module):
         x = F.relu(x)
 
         x = self.output_layer(x)
-        x = nn.Sigmoid()(x)
+        x = torch.sigmoid(x)
 
         return x
 
 
+def cross_validate_densenet(
+    dir_processed: str,
+    n_folds: int,
+    batch_size: int,
+    n_workers: int,
+    epochs: int,
+    learning_rate: float,
+    mmap_mode: Optional[str] = None,
+    in_memory: bool = False,
+    precision: str = "float32",
+    monitor: str = "val_acc",
+    patience: Optional[int] = None,
+) -> dict:
+    """
+    Trains a fresh DenseNN on the training data of each stored cross-validation fold
+    (see prepare_data.cross_validation) and records its best validation accuracy on that fold.
+
+    Args:
+        dir_processed: (str) directory containing processed data files with cross-validation folds
+        n_folds: (int) number of folds
+        batch_size: (int) batch size for training and validation
+        n_workers: (int) number of dataloader workers
+        epochs: (int) number of epochs per fold
+        learning_rate: (float) learning rate of the Adam optimizer
+        mmap_mode: (str or None) memory-map mode for the stored data
+        in_memory: (bool) iterate over the folds with TensorBatchLoaders instead of DataLoaders
+            (see lib.pytorch.TensorBatchLoader)
+        precision: (str) precision of the forward passes, one of 'float32' or 'bfloat16'
+            (see lib.pytorch.train_loop)
+        monitor: (str) metric checked for early stopping (see lib.pytorch.train_and_validate)
+        patience: (int or None) number of epochs without improvement after which training on a fold
+            stops, or None to train for all epochs
+
+    Returns:
+        (dict) of metrics: mean and standard deviation of the best validation accuracy across folds
+            (cv_val_acc, cv_val_acc_std) and the best validation accuracy of each fold (cv_val_acc_fold<n>)
+    """
+    dataloader_args = dict(batch_size=batch_size, num_workers=n_workers, shuffle=True)
+    create_loader = create_tensor_loader if in_memory else create_dataloader
+    accuracies = {}
+
+    for fold, X_train, X_val, y_train, y_val in iter_cv_folds(
+        dir_processed, n_folds=n_folds, as_type="tensor", mmap_mode=mmap_mode
+    ):
+        net = DenseNN()
+        _, df_history, _ = train_and_validate(
+            model=net,
+            loss_fn=nn.BCELoss(),
+            optimizer=torch.optim.Adam(net.parameters(), lr=learning_rate),
+            train_loader=create_loader(X_train, y_train, dataloader_args),
+            val_loader=create_loader(X_val, y_val, dataloader_args),
+            epochs=epochs,
+            precision=precision,
+            monitor=monitor,
+            patience=patience,
+        )
+        accuracies[fold] = float(df_history["val_acc"].max())
+
+    metrics = {f"cv_val_acc_fold{fold}": acc for fold, acc in accuracies.items()}
+    metrics["cv_val_acc"] = float(np.mean(list(accuracies.values())))
+    metrics["cv_val_acc_std"] = float(np.std(list(accuracies.values())))
+    return metrics
+
+
+def get_warmup_steps(
+    train_loader: DataLoader, warmup_epochs: int, accumulation_steps: int
+) -> int:
+    """
+    Returns the number of optimizer steps in warmup_epochs epochs over a training loader
+    """
+    return warmup_epochs * math.ceil(len(train_loader) / accumulation_steps)
+
+
+def read_training_settings(
+    training_config: SectionProxy, overrides: Optional[dict] = None
+) -> dict:
+    """
+    Reads the options of the "training" section of the config (with their defaults for the optional ones),
+    replacing the values of those given in overrides (e.g. the options of a trial of a sweep, see sweep.py).
+
+    Args:
+        training_config: (SectionProxy) the "training" section of the config
+        overrides: (dict or None) values replacing those of the config, by option name
+
+    Returns:
+        (dict) the value of each option, by name
+    """
+    settings = dict(
+        random_seed=int(training_config["random_seed"]),
+        in_memory_loader=training_config.getboolean("in_memory_loader", fallback=False),
+        n_workers=int(training_config["n_workers"]),
+        batch_size=int(training_config["batch_size"]),
+        n_threads=int(training_config.get("n_threads", fallback="") or 0) or None,
+        n_processes=int(training_config.get("n_processes", fallback="1")),
+        accumulation_steps=int(training_config.get("accumulation_steps", fallback="1")),
+        epochs=int(training_config["epochs"]),
+        lr=float(training_config["lr"]),
+        lr_scaling=training_config.get("lr_scaling", fallback="none"),
+        warmup_epochs=int(training_config.get("warmup_epochs", fallback="0")),
+        precision=training_config.get("precision", fallback="float32"),
+        monitor=training_config.get("monitor", fallback="val_acc"),
+        patience=int(training_config.get("patience", fallback="") or 0) or None,
+        checkpoint_every=int(training_config.get("checkpoint_every", fallback="1")),
+        log_epoch_metrics=training_config.getboolean(
+            "log_epoch_metrics", fallback=False
+        ),
+    )
+    return {**settings, **(overrides or {})}
+
+
+def fit_densenet(
+    train_loader: Union[DataLoader, TensorBatchLoader],
+    val_loader: Union[DataLoader, TensorBatchLoader],
+    learning_rate: float,
+    warmup_epochs: int = 0,
+    accumulation_steps: int = 1,
+    **training_args,
+) -> Tuple[nn.Module, pd.DataFrame, tuple]:
+    """
+    Instantiates a DenseNN with its loss function, Adam optimizer and learning rate warmup, and trains and
+    validates it (see lib.pytorch.train_and_validate). This is the training shared by train_densenet (in
+    the current process or data parallel) and the trials of a sweep (see sweep.py).
+
+    Args:
+        train_loader: (DataLoader or TensorBatchLoader) training data
+        val_loader: (DataLoader or TensorBatchLoader) validation data
+        learning_rate: (float) learning rate of the Adam optimizer, already scaled to the effective batch size
+            (see lib.pytorch.scale_learning_rate)
+        warmup_epochs: (int) number of epochs of linear learning rate warmup
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+        **training_args: further arguments of train_and_validate (e.g. epochs, precision, patience)
+
+    Returns:
+        (tuple) the trained model, its training history and the validation labels and predictions, as
+            returned by train_and_validate
+    """
+    net = DenseNN()
+    optimizer = torch.optim.Adam(net.parameters(), lr=learning_rate)
+    return train_and_validate(
+        model=net,
+        loss_fn=nn.BCELoss(),
+        optimizer=optimizer,
+        train_loader=train_loader,
+        val_loader=val_loader,
+        accumulation_steps=accumulation_steps,
+        scheduler=create_warmup_scheduler(
+            optimizer,
+            get_warmup_steps(train_loader, warmup_epochs, accumulation_steps),
+        ),
+        **training_args,
+    )
+
+
+def train_densenet_data_parallel(
+    dir_processed: str,
+    batch_size: int,
+    n_workers: int,
+    epochs: int,
+    learning_rate: float,
+    filepath_model: Path,
+    filepath_history: Path,
+    random_seed: int = 0,
+    mmap_mode: Optional[str] = None,
+    in_memory: bool = False,
+    accumulation_steps: int = 1,
+    warmup_epochs: int = 0,
+    profiling: Optional[dict] = None,
+    **training_args,
+) -> None:
+    """
+    Trains a DenseNN in one process of a process group (see lib.distributed.run_data_parallel), on its
+    shard of the training data and with the gradients averaged across processes. Each process loads the
+    data splits itself (sharing the pages of memory-mapped files). The main process saves the best model
+    and streams the training history to a CSV file.
+
+    Args:
+        dir_processed: (str) directory containing the processed data files
+        batch_size: (int) batch size of each process
+        n_workers: (int) number of dataloader workers of each process
+        epochs: (int) maximum number of epochs
+        learning_rate: (float) learning rate of the Adam optimizer
+        filepath_model: (Path) location at which the main process saves the best model
+        filepath_history: (Path) location of the training history CSV written by the main process
+        random_seed: (int) seed of the random generators, the same in every process
+        mmap_mode: (str or None) memory-map mode for the stored data
+        in_memory: (bool) iterate over the data with TensorBatchLoaders instead of DataLoaders
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+        warmup_epochs: (int) number of epochs of linear learning rate warmup
+        profiling: (dict or None) arguments of create_training_profiler, to profile the training of the main
+            process; None to not profile
+        **training_args: further arguments of train_and_validate (e.g. precision, patience)
+    """
+    np.random.seed(random_seed)
+    torch.manual_seed(random_seed)
+
+    train_loader, val_loader = load_data_splits_as_dataloader(
+        dir_processed=dir_processed,
+        batch_size=batch_size,
+        n_workers=n_workers,
+        mmap_mode=mmap_mode,
+        splits=("train", "val"),
+        in_memory=in_memory,
+    )
+
+    profiler = (
+        create_training_profiler(**profiling)
+        if profiling is not None and is_main_process()
+        else None
+    )
+    with profiler if profiler is not None else nullcontext():
+        fit_densenet(
+            shard_loader(train_loader),
+            val_loader,
+            learning_rate=learning_rate,
+            warmup_epochs=warmup_epochs,
+            accumulation_steps=accumulation_steps,
+            epochs=epochs,
+            filepath_model=filepath_model,
+            history=HistoryRecorder(
+                HISTORY_COLUMNS,
+                capacity=epochs,
+                filepath=filepath_history if is_main_process() else None,
+            ),
+            profiler=profiler,
+            **training_args,
+        )
+
+
+def _parse_int_list(value: str) -> list:
+    """
+    Parses a comma-separated list of integers from the config (an empty value gives an empty list)
+    """
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def autotune_densenet(
+    autotune_config: SectionProxy,
+    dir_processed: str,
+    mmap_mode: Optional[str],
+    learning_rate: float,
+    in_memory: bool,
+    precision: str,
+) -> dict:
+    """
+    Times a few training iterations of a DenseNN on the training data with each combination of the
+    candidate settings in the "autotune" section of the config (see lib.autotune.autotune_training).
+
+    Args:
+        autotune_config: (SectionProxy) the "autotune" section of the config
+        dir_processed: (str) directory containing the processed data files
+        mmap_mode: (str or None) memory-map mode for the stored data
+        learning_rate: (float) learning rate of the Adam optimizer
+        in_memory: (bool) time TensorBatchLoaders instead of DataLoaders
+        precision: (str) precision of the forward passes
+
+    Returns:
+        (dict) with the fastest setting within the memory cap ('best') and the results of all trials
+    """
+    X_train, y_train = load_data_splits(
+        dir_processed,
+        as_type="tensor",
+        mmap_mode=mmap_mode,
+        splits=("X_train", "y_train"),
+    )
+    max_memory_mb = autotune_config.get("max_memory_mb", fallback="")
+
+    return autotune_training(
+        X_train,
+        y_train,
+        create_model=DenseNN,
+        loss_fn=nn.BCELoss(),
+        create_optimizer=lambda parameters: torch.optim.Adam(
+            parameters, lr=learning_rate
+        ),
+        batch_sizes=_parse_int_list(autotune_config["batch_sizes"]),
+        n_workers_options=_parse_int_list(autotune_config.get("n_workers", fallback=""))
+        or [0],
+        n_threads_options=_parse_int_list(autotune_config.get("n_threads", fallback=""))
+        or None,
+        in_memory=in_memory,
+        n_batches=int(autotune_config.get("n_batches", fallback="20")),
+        max_memory_bytes=int(float(max_memory_mb) * 2**20) if max_memory_mb else None,
+        precision=precision,
+    )
+
+
+def _get_checkpoint_path(config: ConfigParser) -> Optional[Path]:
+    """
+    Returns the location of the training checkpoint in dir_checkpoints of the "paths" section of the
+    config, or None if checkpoints are disabled
+    """
+    dir_checkpoints = config["paths"].get("dir_checkpoints")
+    if not dir_checkpoints:
+        return None
+    return Path(dir_checkpoints) / config["filenames"].get(
+        "fname_checkpoint", fallback="densenet_checkpoint.pt"
+    )
+
+
+def _get_profiling_args(config: ConfigParser, dir_artifacts: Path) -> Optional[dict]:
+    """
+    Returns the arguments of create_training_profiler from the "profiling" section of the config, with the
+    trace and table of top operators saved to dir_artifacts, or None if profiling is not enabled
+    """
+    if not config.getboolean("profiling", "enabled", fallback=False):
+        return None
+    return dict(
+        filepath_trace=dir_artifacts
+        / config["filenames"].get(
+            "fname_profiler_trace", fallback="profiler_trace.json"
+        ),
+        filepath_ops=dir_artifacts
+        / config["filenames"].get(
+            "fname_profiler_ops", fallback="profiler_top_ops.txt"
+        ),
+        **{
+            option: int(config["profiling"].get(option, fallback=default))
+            for option, default in (
+                ("wait", "5"),
+                ("warmup", "2"),
+                ("active", "10"),
+                ("row_limit", "30"),
+            )
+        },
+    )
+
+
+def _maybe_autotune(
+    config: ConfigParser,
+    settings: dict,
+    dir_processed: str,
+    mmap_mode: Optional[str],
+    dir_artifacts: Path,
+) -> Tuple[int, int, Optional[int]]:
+    """
+    Returns the batch size, number of dataloader workers and number of torch threads to train with: those of
+    the training settings, or if enabled in the "autotune" section of the config, the fastest ones timed by
+    autotune_densenet (saving the timings to fname_autotune in dir_artifacts)
+    """
+    if not config.getboolean("autotune", "enabled", fallback=False):
+        return settings["batch_size"], settings["n_workers"], settings["n_threads"]
+
+    autotune_results = autotune_densenet(
+        config["autotune"],
+        dir_processed=dir_processed,
+        mmap_mode=mmap_mode,
+        learning_rate=settings["lr"],
+        in_memory=settings["in_memory_loader"],
+        precision=settings["precision"],
+    )
+    filepath_autotune = dir_artifacts / config["filenames"].get(
+        "fname_autotune", fallback="autotune.json"
+    )
+    filepath_autotune.write_text(json.dumps(autotune_results, indent=2))
+    # The trials draw from the random generators
+    np.random.seed(settings["random_seed"])
+    torch.manual_seed(settings["random_seed"])
+    return tuple(
+        autotune_results["best"][key]
+        for key in ("batch_size", "n_workers", "n_threads")
+    )
+
+
+def _train_data_parallel(
+    n_processes: int, history: HistoryRecorder, **kwargs
+) -> Tuple[nn.Module, pd.DataFrame]:
+    """
+    Trains a DenseNN in n_processes local processes (see train_densenet_data_parallel, taking kwargs), and
+    returns the best model saved by the main process and the training history it wrote, recorded into
+    history (e.g. to log the epoch metrics to MLflow from the current process)
+    """
+    run_data_parallel(train_densenet_data_parallel, n_processes, kwargs=kwargs)
+
+    net = DenseNN()
+    net.load_state_dict(torch.load(kwargs["filepath_model"]))
+    for row in pd.read_csv(kwargs["filepath_history"]).to_dict("records"):
+        history.record(**row)
+    return net, history.to_dataframe()
+
+
+def _export_quantized(
+    mlflow,
+    net: nn.Module,
+    val_loader: Union[DataLoader, TensorBatchLoader],
+    config: ConfigParser,
+    dir_artifacts: Path,
+) -> None:
+    """
+    Exports the network with its linear layers quantized to int8 (fname_model_int8 in dir_artifacts), and
+    compares the int8 and float32 networks on the validation set (see quantization.py), saving the
+    comparison to fname_quantization_benchmark and logging it to MLflow
+    """
+    # Imported here, as the quantization module imports DenseNN from this module
+    from lab.processes.train_dnn_pytorch.quantization import (
+        benchmark_quantization,
+        export_quantized_densenet,
+    )
+
+    filepath_model_int8 = dir_artifacts / config["filenames"].get(
+        "fname_model_int8", fallback="densenet_int8.pt"
+    )
+    filepath_quantization = dir_artifacts / config["filenames"].get(
+        "fname_quantization_benchmark", fallback="quantization_benchmark.csv"
+    )
+
+    export_quantized_densenet(net, filepath_model_int8)
+    df_quantization = benchmark_quantization(
+        net,
+        *val_loader.dataset.tensors,
+        n_single_rows=int(config.get("quantization", "n_single_rows", fallback="1000")),
+    )
+    df_quantization.to_csv(filepath_quantization)
+    mlflow.log_metrics(
+        {
+            f"{model}_{metric}": float(value)
+            for model, row in df_quantization.iterrows()
+            for metric, value in row.items()
+        }
+    )
+
+
 def train_densenet(
     mlflow, config: ConfigParser, mlflow_url: str, mlflow_tags: dict
 ) -> None:
@@ -71,70 +518,173 @@ def train_densenet(
 
     - Loads and prepares breast cancer data for training (as defined in prepare_data.cancer_data)
     - Instantiates the densely connected neural network, optimizer and loss function for model training
-    - Trains and validates a neural network (as defined in train_and_validate)
+    - Trains and validates a neural network (as defined in train_and_validate), stopping early if
+      patience is set in the "training" section of the config, and resuming from the last checkpoint of an
+      interrupted run if dir_checkpoints is set in the "paths" section
+    - If enabled in the "autotune" section of the config, picks the batch size, number of dataloader workers
+      and torch threads by timing a few training iterations with each candidate setting
+      (see autotune_densenet), logging the chosen values to MLflow and the timings as an artifact
+    - Accumulates the gradients of accumulation_steps batches per optimizer step, with the learning rate
+      scaled to the effective batch size (lr_scaling) and warmed up over warmup_epochs, if set in the
+      "training" section
+    - With n_processes > 1 in the "training" section, trains in that many local processes in parallel,
+      each on a shard of the training data (see train_densenet_data_parallel)
+    - If enabled in the "profiling" section of the config, profiles a window of training steps with
+      torch.profiler, saving a Chrome trace and a table of the top operators as artifacts
+      (see lib.profiling.create_training_profiler)
     - Keeps the best version of the model for final evaluation (not necessarily after final epoch)
+    - If enabled in the "quantization" section of the config, also exports the model with its linear
+      layers quantized to int8, and benchmarks it against the float32 model (see quantization.py)
     - Saves the model, its training and validation metrics and associated validation artifacts in MLflow
+    - If n_folds is set in the "preparation" section of the config, also reports the cross-validated
+      accuracy on the folds stored with the processed data (see cross_validate_densenet)
     """
     # Unpack config
     mlflow_experiment = config["mlflow"]["mlflow_experiment"]
-    random_seed = int(config["training"]["random_seed"])
-    batch_size = int(config["training"]["batch_size"])
-    n_workers = int(config["training"]["n_workers"])
-    epochs = int(config["training"]["epochs"])
-    learning_rate = float(config["training"]["lr"])
+    settings = read_training_settings(config["training"])
+    random_seed = settings["random_seed"]
+    n_processes = settings["n_processes"]
+    accumulation_steps = settings["accumulation_steps"]
+    in_memory_loader = settings["in_memory_loader"]
+    precision = settings["precision"]
+    epochs = settings["epochs"]
     workspace_dir = Path(config["paths"]["workspace_dir"])
     dir_processed = config["paths"]["dir_processed"]
+    mmap_mode = config["paths"].get("mmap_mode") or None
+    n_folds = int(config.get("preparation", "n_folds", fallback="") or 0)
     dir_artifacts = Path(config["paths"]["artifacts_temp"])
     full_dir_artifacts = workspace_dir / dir_artifacts
     filepath_conf_matrix = full_dir_artifacts / config["filenames"]["fname_conf_mat"]
     filepath_model = full_dir_artifacts / config["filenames"]["fname_model"]
+    filepath_checkpoint = _get_checkpoint_path(config)
     filepath_training_history = (
         full_dir_artifacts / config["filenames"]["fname_training_history"]
     )
     filepath_training_history_csv = (
         full_dir_artifacts / config["filenames"]["fname_training_history_csv"]
     )
+    profiling = _get_profiling_args(config, full_dir_artifacts)
 
     # Prepare before run
     np.random.seed(random_seed)
     torch.manual_seed(random_seed)
     full_dir_artifacts.mkdir(exist_ok=True)
+    if filepath_checkpoint is not None:
+        filepath_checkpoint.parent.mkdir(parents=True, exist_ok=True)
     mlflow.set_tracking_uri(mlflow_url)
     mlflow.set_experiment(mlflow_experiment)
 
     with mlflow.start_run(run_name="pytorch_example_train", tags=mlflow_tags):
 
-        # Load the data splits
-        train_loader, val_loader, _ = load_data_splits_as_dataloader(
-            dir_processed=dir_processed, batch_size=batch_size, n_workers=n_workers
+        batch_size, n_workers, n_threads = _maybe_autotune(
+            config, settings, dir_processed, mmap_mode, full_dir_artifacts
         )
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
 
-        # Instantiate the Dense NN, loss function and optimizer
-        net = DenseNN()
-        loss_fn = nn.BCELoss()
-        optimizer = torch.optim.Adam(net.parameters(), lr=learning_rate)
+        # Scale the learning rate (set for the configured batch size) to the effective batch size
+        effective_batch_size = batch_size * accumulation_steps * n_processes
+        learning_rate = scale_learning_rate(
+            settings["lr"],
+            settings["batch_size"],
+            effective_batch_size,
+            settings["lr_scaling"],
+        )
 
-        # Train and validate
-        net, df_history, _ = train_and_validate(
-            model=net,
-            loss_fn=loss_fn,
-            optimizer=optimizer,
-            train_loader=train_loader,
-            val_loader=val_loader,
+        # Load the data splits
+        train_loader, val_loader = load_data_splits_as_dataloader(
+            dir_processed=dir_processed,
+            batch_size=batch_size,
+            n_workers=n_workers,
+            mmap_mode=mmap_mode,
+            splits=("train", "val"),
+            in_memory=in_memory_loader,
+        )
+
+        training_args = dict(
             epochs=epochs,
             filepath_model=filepath_model,
+            precision=precision,
+            monitor=settings["monitor"],
+            patience=settings["patience"],
+            filepath_checkpoint=filepath_checkpoint,
+            checkpoint_every=settings["checkpoint_every"],
+            accumulation_steps=accumulation_steps,
+            warmup_epochs=settings["warmup_epochs"],
+            # A checkpoint is only resumed by a run of the same settings, model and data
+            run_key=get_run_key(
+                dict(
+                    training=dict(config["training"]),
+                    batch_size=batch_size,
+                    learning_rate=learning_rate,
+                    model="DenseNN",
+                    dataset_version=get_dataset_version(dir_processed),
+                )
+            ),
+        )
+        # The epoch metrics are logged to MLflow from this process (the main process of data parallel
+        # training writes the CSV file)
+        history = HistoryRecorder(
+            HISTORY_COLUMNS,
+            capacity=epochs,
+            filepath=filepath_training_history_csv if n_processes == 1 else None,
+            mlflow=mlflow if settings["log_epoch_metrics"] else None,
         )
 
-        # Load best version
-        net = DenseNN()
-        net.load_state_dict(torch.load(filepath_model))
+        # Train and validate
+        if n_processes > 1:
+            net, df_history = _train_data_parallel(
+                n_processes,
+                history,
+                dir_processed=dir_processed,
+                batch_size=batch_size,
+                n_workers=n_workers,
+                learning_rate=learning_rate,
+                filepath_history=filepath_training_history_csv,
+                random_seed=random_seed,
+                mmap_mode=mmap_mode,
+                in_memory=in_memory_loader,
+                profiling=profiling,
+                **training_args,
+            )
+        else:
+            profiler = (
+                create_training_profiler(**profiling) if profiling is not None else None
+            )
+            with profiler if profiler is not None else nullcontext():
+                net, df_history, _ = fit_densenet(
+                    train_loader,
+                    val_loader,
+                    learning_rate=learning_rate,
+                    history=history,
+                    profiler=profiler,
+                    **training_args,
+                )
 
-        # Get metrics on best model
+        if n_folds:
+            mlflow.log_metrics(
+                cross_validate_densenet(
+                    dir_processed=dir_processed,
+                    n_folds=n_folds,
+                    batch_size=batch_size,
+                    n_workers=n_workers,
+                    epochs=epochs,
+                    learning_rate=learning_rate,
+                    mmap_mode=mmap_mode,
+                    in_memory=in_memory_loader,
+                    precision=precision,
+                    monitor=settings["monitor"],
+                    patience=settings["patience"],
+                )
+            )
+
+        # Get metrics on best model (train_and_validate returns it with the weights of its best epoch)
+        loss_fn = nn.BCELoss()
         train_loss, train_acc, _ = val_loop(
-            dataloader=train_loader, model=net, loss_fn=loss_fn
+            dataloader=train_loader, model=net, loss_fn=loss_fn, precision=precision
         )
         val_loss, val_acc, (y_val_true, y_val_pred) = val_loop(
-            dataloader=val_loader, model=net, loss_fn=loss_fn
+            dataloader=val_loader, model=net, loss_fn=loss_fn, precision=precision
         )
         cm = confusion_matrix(y_val_true, y_val_pred)
 
@@ -148,7 +698,8 @@ def train_densenet(
         plot_training_history(
             df_history, title="Training history", savepath=filepath_training_history
         )
-        df_history.to_csv(filepath_training_history_csv)
+        if config.getboolean("quantization", "enabled", fallback=False):
+            _export_quantized(mlflow, net, val_loader, config, full_dir_artifacts)
 
         # Log to MLflow
         mlflow.log_artifacts(full_dir_artifacts)
@@ -165,8 +716,24 @@ def train_densenet(
                 epochs=epochs,
                 batch_size=batch_size,
                 learning_rate=learning_rate,
+                n_workers=n_workers,
+                n_threads=torch.get_num_threads(),
+                autotune=config.getboolean("autotune", "enabled", fallback=False),
+                n_processes=n_processes,
+                accumulation_steps=accumulation_steps,
+                effective_batch_size=effective_batch_size,
+                warmup_epochs=settings["warmup_epochs"],
+                precision=precision,
+                monitor=settings["monitor"],
+                patience=settings["patience"],
+                profiling=profiling is not None,
                 classifier="DenseNN",
+                dataset_version=get_dataset_version(dir_processed),
             )
         )
 
+        # The run is complete, so a later run must not resume from its checkpoint
+        if filepath_checkpoint is not None:
+            filepath_checkpoint.unlink(missing_ok=True)
+
         print("Done!")
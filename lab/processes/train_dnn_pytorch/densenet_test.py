@@ -45,12 +45,17 @@ def test_train_densenet_without_errors(temp_data_dir):
     fname_training_history_csv = vscode_config["filenames"][
         "fname_training_history_csv"
     ]
+    # Profiling is enabled in the test config
+    fname_profiler_trace = vscode_config["filenames"]["fname_profiler_trace"]
+    fname_profiler_ops = vscode_config["filenames"]["fname_profiler_ops"]
 
     for fname in [
         fname_model,
         fname_conf_matrix,
         fname_training_history,
         fname_training_history_csv,
+        fname_profiler_trace,
+        fname_profiler_ops,
     ]:
         assert fname in artifacts_contents
 
@@ -59,3 +64,33 @@ def test_train_densenet_without_errors(temp_data_dir):
     mlflow_stub.log_artifacts.assert_called_with(Path(dir_artifacts))
     mlflow_stub.log_params.assert_called()
     mlflow_stub.log_metrics.assert_called()
+    # The early stopping settings are logged to reproduce the run
+    params = mlflow_stub.log_params.call_args.args[0]
+    assert params["monitor"] == "val_acc" and params["patience"] is None
+
+
+@pytest.mark.integration
+@pytest.mark.filterwarnings("ignore:CUDA initialization")
+def test_train_densenet_in_parallel_processes(temp_data_dir):
+    """
+    Runs train_densenet in 2 data-parallel processes with a mock mlflow instance.
+
+    Verifies that the best model and training history are written by the main process and loaded back, and
+    that the epoch metrics and the number of processes are logged to mlflow
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(vscode_config)
+    config["paths"]["dir_processed"] = temp_data_dir
+    config["training"]["n_processes"] = "2"
+    config["training"]["log_epoch_metrics"] = "true"
+
+    mlflow_stub = get_mlflow_stub()
+
+    train_densenet(mlflow=mlflow_stub, config=config, mlflow_url=None, mlflow_tags=None)
+
+    dir_artifacts = Path(config["paths"]["artifacts_temp"])
+    assert (dir_artifacts / config["filenames"]["fname_model"]).is_file()
+    assert (dir_artifacts / config["filenames"]["fname_training_history_csv"]).is_file()
+    logged_metrics = [call.args[0] for call in mlflow_stub.log_metrics.call_args_list]
+    assert any("history_val_acc" in metrics for metrics in logged_metrics)
+    assert mlflow_stub.log_params.call_args.args[0]["n_processes"] == 2
@@ -0,0 +1,527 @@
+"""
+Training of an ensemble of independently initialized DenseNNs in a single pass over the data: the weights of
+the members are stacked, so that each layer of all members runs as one batched matrix product and every
+batch of data is shared by all members. The ensemble reports the validation metrics of each member (e.g. to
+estimate the variance across seeds) and of their average prediction.
+"""
+
+import time
+from configparser import ConfigParser
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from lab.processes.prepare_data.cancer_data import load_data_splits_as_dataloader
+from lab.processes.prepare_data.manifest import get_dataset_version
+from lab.processes.train_dnn_pytorch.densenet import (
+    DenseNN,
+    get_warmup_steps,
+    read_training_settings,
+)
+from lib.history import HistoryRecorder
+from lib.pytorch import autocast, create_warmup_scheduler, scale_learning_rate
+
+LINEAR_LAYERS = ("dense1", "dense2", "dense3", "output_layer")
+BATCH_NORM_LAYERS = ("bn1", "bn2", "bn3")
+MEMBER_METRICS = ("loss", "val_loss", "acc", "val_acc")
+
+
+class EnsembleLinear(nn.Module):
+    """
+    The linear layers of the members of an ensemble, applied to the inputs of each member at once with a
+    batched matrix product.
+
+    Args:
+        layers: (sequence of nn.Linear) the layer of each member, all of the same shape
+    """
+
+    def __init__(self, layers: Sequence[nn.Linear]):
+        super(EnsembleLinear, self).__init__()
+        # Stored as (member, in_features, out_features), the layout of a batched matrix product
+        self.weight = nn.Parameter(
+            torch.stack([layer.weight.detach().t() for layer in layers]).contiguous()
+        )
+        self.bias = nn.Parameter(
+            torch.stack([layer.bias.detach() for layer in layers]).unsqueeze(1)
+        )
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Applies each member's layer to x: inputs shared by all members (batch, in_features) or the inputs of
+        each member (member, batch, in_features). Returns outputs of shape (member, batch, out_features).
+        """
+        if x.dim() == 2:
+            return torch.matmul(x, self.weight) + self.bias
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class EnsembleBatchNorm(nn.Module):
+    """
+    The batch norm layers of the members of an ensemble, normalizing the outputs of each member with its
+    own batch statistics (in training) or running statistics (in eval mode), as nn.BatchNorm1d does.
+
+    Args:
+        layers: (sequence of nn.BatchNorm1d) the layer of each member, all with the same settings
+    """
+
+    def __init__(self, layers: Sequence[nn.BatchNorm1d]):
+        super(EnsembleBatchNorm, self).__init__()
+        self.eps = layers[0].eps
+        self.momentum = layers[0].momentum
+        self.weight = nn.Parameter(
+            torch.stack([layer.weight.detach() for layer in layers])
+        )
+        self.bias = nn.Parameter(torch.stack([layer.bias.detach() for layer in layers]))
+        self.register_buffer(
+            "running_mean", torch.stack([layer.running_mean for layer in layers])
+        )
+        self.register_buffer(
+            "running_var", torch.stack([layer.running_var for layer in layers])
+        )
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Normalizes the outputs of each member, of shape (member, batch, features)
+        """
+        if self.training:
+            if x.shape[1] < 2:
+                # As nn.BatchNorm1d: the unbiased variance of the running statistics needs two samples
+                raise ValueError(
+                    f"Expected more than 1 value per channel when training, got input size {tuple(x.shape)}"
+                )
+            mean = x.mean(dim=1)
+            var = x.var(dim=1, unbiased=False)
+            with torch.no_grad():
+                n = x.shape[1]
+                self.running_mean.lerp_(mean, self.momentum)
+                self.running_var.lerp_(var * n / (n - 1), self.momentum)
+        else:
+            mean, var = self.running_mean, self.running_var
+
+        x_norm = (x - mean.unsqueeze(1)) * torch.rsqrt(var.unsqueeze(1) + self.eps)
+        return x_norm * self.weight.unsqueeze(1) + self.bias.unsqueeze(1)
+
+
+class EnsembleDenseNN(nn.Module):
+    """
+    An ensemble of DenseNNs trained at once, starting from the weights of the given members. Its forward
+    pass returns the predicted probabilities of every member, of shape (member, batch, 1).
+
+    Args:
+        members: (sequence of DenseNN) the members, e.g. initialized with different seeds
+    """
+
+    def __init__(self, members: Sequence[DenseNN]):
+        super(EnsembleDenseNN, self).__init__()
+        self.n_members = len(members)
+        for name in LINEAR_LAYERS:
+            setattr(self, name, EnsembleLinear([getattr(net, name) for net in members]))
+        for name in BATCH_NORM_LAYERS:
+            setattr(
+                self, name, EnsembleBatchNorm([getattr(net, name) for net in members])
+            )
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        A forward pass of all members through the same inputs.
+
+        Arguments:
+            x {torch.Tensor} -- Input tensor (batch, features)
+
+        Returns:
+            torch.Tensor -- Output tensor (member, batch, 1)
+        """
+        x = F.relu(self.bn1(self.dense1(x)))
+        x = F.relu(self.bn2(self.dense2(x)))
+        x = F.relu(self.bn3(self.dense3(x)))
+        return torch.sigmoid(self.output_layer(x))
+
+    def get_member(self, member: int) -> DenseNN:
+        """
+        Returns a DenseNN with the current weights of one member of the ensemble
+        """
+        state = {}
+        for name in LINEAR_LAYERS:
+            layer = getattr(self, name)
+            state[f"{name}.weight"] = layer.weight[member].t()
+            state[f"{name}.bias"] = layer.bias[member, 0]
+        for name in BATCH_NORM_LAYERS:
+            layer = getattr(self, name)
+            for tensor in ("weight", "bias", "running_mean", "running_var"):
+                state[f"{name}.{tensor}"] = getattr(layer, tensor)[member]
+
+        net = DenseNN()
+        net.load_state_dict(state, strict=False)
+        return net
+
+
+def create_ensemble(seeds: Sequence[int]) -> EnsembleDenseNN:
+    """
+    Creates an ensemble whose members are initialized as DenseNNs created after seeding with each seed
+    (so that each member starts as the network of a single run with that seed)
+    """
+    members = []
+    for seed in seeds:
+        torch.manual_seed(seed)
+        members.append(DenseNN())
+    return EnsembleDenseNN(members)
+
+
+def ensemble_train_loop(
+    dataloader,
+    model: EnsembleDenseNN,
+    optimizer: torch.optim.Optimizer,
+    precision: str,
+    accumulation_steps: int = 1,
+    scheduler: Optional[torch.optim.lr_scheduler._LRScheduler] = None,
+) -> tuple:
+    """
+    Training loop of all members of an ensemble through the dataset for a single epoch. The loss of each
+    member is the binary cross-entropy of its own predictions, and the members' losses are summed, so that
+    each member receives the same gradients as if trained alone (see lib.pytorch.train_loop), including
+    the averaging of the gradients of accumulation_steps batches per optimizer step.
+
+    Args:
+        dataloader: (DataLoader or TensorBatchLoader) training samples (X) and labels (y)
+        model: (EnsembleDenseNN) the ensemble to train
+        optimizer: (torch.optim.Optimizer) optimizer of the parameters of the ensemble (an elementwise
+            optimizer such as Adam or SGD keeps the members independent)
+        precision: (str) precision of the forward pass, one of 'float32' or 'bfloat16'
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+        scheduler: (torch learning rate scheduler or None) scheduler stepped after every optimizer step
+
+    Returns:
+        (tuple) of numpy arrays of the training loss and accuracy of each member
+    """
+    size = len(dataloader.dataset)
+    n_batches = len(dataloader)
+    model.train()
+    optimizer.zero_grad()
+    train_loss, correct = 0.0, 0
+
+    for batch, (X, y) in enumerate(dataloader):
+        X = X.float()
+        y = y.float().expand(model.n_members, -1)
+
+        with autocast(precision, X.device.type):
+            probs = model(X).float().squeeze(2)
+        losses = F.binary_cross_entropy(probs, y, reduction="none").mean(dim=1)
+        train_loss += losses.detach()
+        correct += ((probs > 0.5) == y).sum(dim=1)
+
+        # Average the gradients of the batches of each optimizer step, as train_loop does
+        step_start = batch - batch % accumulation_steps
+        n_step_batches = min(accumulation_steps, n_batches - step_start)
+        (losses.sum() / n_step_batches).backward()
+        if batch == step_start + n_step_batches - 1:
+            optimizer.step()
+            optimizer.zero_grad()
+            if scheduler is not None:
+                scheduler.step()
+
+    return (train_loss / size).numpy(), (correct / size).numpy()
+
+
+def ensemble_val_loop(dataloader, model: EnsembleDenseNN, precision: str) -> dict:
+    """
+    Validation loop of all members of an ensemble and of the ensemble itself (the average of the members'
+    predicted probabilities).
+
+    Args:
+        dataloader: (DataLoader or TensorBatchLoader) validation samples (X) and labels (y)
+        model: (EnsembleDenseNN) the ensemble to validate
+        precision: (str) precision of the forward pass, one of 'float32' or 'bfloat16'
+
+    Returns:
+        (dict) of the validation loss and accuracy of each member (val_loss, val_acc: numpy arrays) and of
+            the ensemble (ensemble_val_loss, ensemble_val_acc: floats)
+    """
+    size = len(dataloader.dataset)
+    model.eval()
+    val_loss, correct = 0.0, 0
+    ensemble_val_loss, ensemble_correct = 0.0, 0
+
+    with torch.no_grad():
+        for X, y in dataloader:
+            X = X.float()
+            y = y.float()
+            with autocast(precision, X.device.type):
+                probs = model(X).float().squeeze(2)
+            y_members = y.expand(model.n_members, -1)
+            val_loss += F.binary_cross_entropy(probs, y_members, reduction="none").mean(
+                dim=1
+            )
+            correct += ((probs > 0.5) == y_members).sum(dim=1)
+
+            ensemble_probs = probs.mean(dim=0)
+            ensemble_val_loss += F.binary_cross_entropy(ensemble_probs, y)
+            ensemble_correct += ((ensemble_probs > 0.5) == y).sum()
+
+    return dict(
+        val_loss=(val_loss / size).numpy(),
+        val_acc=(correct / size).numpy(),
+        ensemble_val_loss=float(ensemble_val_loss) / size,
+        ensemble_val_acc=float(ensemble_correct) / size,
+    )
+
+
+def get_history_columns(n_members: int) -> List[str]:
+    """
+    Returns the columns of the training history of an ensemble: the ensemble metrics and those of each member
+    """
+    member_columns = [
+        f"{metric}_{member}" for member in range(n_members) for metric in MEMBER_METRICS
+    ]
+    return [
+        "epoch",
+        "ensemble_val_loss",
+        "ensemble_val_acc",
+        "epoch_time_s",
+    ] + member_columns
+
+
+def train_ensemble(
+    model: EnsembleDenseNN,
+    optimizer: torch.optim.Optimizer,
+    train_loader,
+    val_loader,
+    epochs: int,
+    precision: str = "float32",
+    monitor: str = "val_acc",
+    history: HistoryRecorder = None,
+    patience: Optional[int] = None,
+    accumulation_steps: int = 1,
+    scheduler: Optional[torch.optim.lr_scheduler._LRScheduler] = None,
+) -> EnsembleDenseNN:
+    """
+    Trains all members of an ensemble for the number of epochs specified, keeping the weights of each member
+    at its own best epoch by the monitored validation metric, which are loaded into the model at the end.
+    Training stops early once none of the members has improved for patience epochs.
+
+    Args:
+        model: (EnsembleDenseNN) the ensemble to train
+        optimizer: (torch.optim.Optimizer) optimizer of the parameters of the ensemble
+        train_loader: (DataLoader or TensorBatchLoader) the training data
+        val_loader: (DataLoader or TensorBatchLoader) the validation data
+        epochs: (int) the number of epochs
+        precision: (str) precision of the forward passes, one of 'float32' or 'bfloat16'
+        monitor: (str) metric selecting the best epoch of each member, one of MEMBER_METRICS (as the monitor
+            of lib.pytorch.train_and_validate): 'val_acc', 'val_loss', 'acc' or 'loss'
+        history: (HistoryRecorder or None) recorder of the metrics of each epoch, with the columns of
+            get_history_columns
+        patience: (int or None) number of epochs without improvement of the monitored metric of any member
+            after which training stops; None to train for all epochs
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+        scheduler: (torch learning rate scheduler or None) scheduler stepped after every optimizer step
+            (e.g. see lib.pytorch.create_warmup_scheduler)
+
+    Returns:
+        (EnsembleDenseNN) the trained ensemble, each member with the weights of its best epoch
+    """
+    if monitor not in MEMBER_METRICS:
+        raise ValueError(
+            "Please specify monitor as one of 'val_acc', 'val_loss', 'acc' or 'loss'"
+        )
+
+    if history is None:
+        history = HistoryRecorder(get_history_columns(model.n_members), capacity=epochs)
+    best_values, best_state = None, None
+    n_epochs_no_improvement = 0
+
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        train_loss, train_acc = ensemble_train_loop(
+            train_loader,
+            model,
+            optimizer,
+            precision,
+            accumulation_steps=accumulation_steps,
+            scheduler=scheduler,
+        )
+        val_metrics = ensemble_val_loop(val_loader, model, precision)
+        print(
+            f"Epoch {epoch}: ensemble validation accuracy "
+            f"{(100 * val_metrics['ensemble_val_acc']):>0.1f}%, members "
+            f"{(100 * val_metrics['val_acc'].min()):>0.1f}-{(100 * val_metrics['val_acc'].max()):>0.1f}%"
+        )
+
+        member_metrics = dict(
+            loss=train_loss,
+            val_loss=val_metrics["val_loss"],
+            acc=train_acc,
+            val_acc=val_metrics["val_acc"],
+        )
+        history.record(
+            epoch=epoch,
+            ensemble_val_loss=val_metrics["ensemble_val_loss"],
+            ensemble_val_acc=val_metrics["ensemble_val_acc"],
+            epoch_time_s=time.perf_counter() - start,
+            **{
+                f"{metric}_{member}": float(values[member])
+                for metric, values in member_metrics.items()
+                for member in range(model.n_members)
+            },
+        )
+
+        # Keep the weights of the members that improved on their best epoch so far
+        values = torch.from_numpy(member_metrics[monitor])
+        if best_values is None:
+            improved = torch.ones(model.n_members, dtype=torch.bool)
+            best_values = values.clone()
+            best_state = {
+                name: tensor.detach().clone()
+                for name, tensor in model.state_dict().items()
+            }
+        else:
+            improved = (
+                values < best_values
+                if monitor.endswith("loss")
+                else values > best_values
+            )
+            best_values = torch.where(improved, values, best_values)
+            for name, tensor in model.state_dict().items():
+                best_state[name][improved] = tensor[improved]
+
+        n_epochs_no_improvement = 0 if improved.any() else n_epochs_no_improvement + 1
+        if patience is not None and n_epochs_no_improvement >= patience:
+            break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return model
+
+
+def train_densenet_ensemble(
+    mlflow, config: ConfigParser, mlflow_url: str, mlflow_tags: dict
+) -> None:
+    """
+    The main function of the DenseNN ensemble training script
+
+    - Trains n_members DenseNNs (set in the "ensemble" section of the config), seeded with random_seed,
+      random_seed + 1, ..., at once on the same batches (see train_ensemble), with the settings of the
+      "training" section as for a single DenseNN: batch size, dataloader workers and threads, precision,
+      monitor and patience, gradient accumulation, learning rate scaling and warmup. The ensemble trains in a
+      single process (n_processes must be 1), without checkpoints, and does not use the autotune section
+    - Reports the validation metrics of each member, their mean and standard deviation across seeds, and the
+      validation metrics of the ensemble (average predicted probability)
+    - Saves the weights of each member (loadable into a DenseNN) and the training history in MLflow
+    """
+    # Unpack config
+    n_members = int(config["ensemble"]["n_members"])
+    settings = read_training_settings(config["training"])
+    random_seed = settings["random_seed"]
+    batch_size = settings["batch_size"]
+    accumulation_steps = settings["accumulation_steps"]
+    precision = settings["precision"]
+    epochs = settings["epochs"]
+    dir_processed = config["paths"]["dir_processed"]
+    mmap_mode = config["paths"].get("mmap_mode") or None
+    full_dir_artifacts = Path(config["paths"]["workspace_dir"]) / Path(
+        config["paths"]["artifacts_temp"]
+    )
+    filepath_ensemble = full_dir_artifacts / config["filenames"].get(
+        "fname_ensemble", fallback="densenet_ensemble.pt"
+    )
+    filepath_history = full_dir_artifacts / config["filenames"].get(
+        "fname_ensemble_history_csv", fallback="ensemble_history.csv"
+    )
+    seeds = [random_seed + member for member in range(n_members)]
+    if settings["n_processes"] != 1:
+        raise ValueError(
+            "The ensemble trains in a single process, please set n_processes to 1 in the training section"
+        )
+    # Scale the learning rate (set for the configured batch size) to the effective batch size
+    learning_rate = scale_learning_rate(
+        settings["lr"],
+        batch_size,
+        batch_size * accumulation_steps,
+        settings["lr_scaling"],
+    )
+
+    # Prepare before run
+    np.random.seed(random_seed)
+    if settings["n_threads"] is not None:
+        torch.set_num_threads(settings["n_threads"])
+    full_dir_artifacts.mkdir(exist_ok=True)
+    mlflow.set_tracking_uri(mlflow_url)
+    mlflow.set_experiment(config["mlflow"]["mlflow_experiment"])
+
+    with mlflow.start_run(run_name="pytorch_example_ensemble", tags=mlflow_tags):
+
+        model = create_ensemble(seeds)
+        torch.manual_seed(random_seed)
+        train_loader, val_loader = load_data_splits_as_dataloader(
+            dir_processed=dir_processed,
+            batch_size=batch_size,
+            n_workers=settings["n_workers"],
+            mmap_mode=mmap_mode,
+            splits=("train", "val"),
+            in_memory=settings["in_memory_loader"],
+        )
+
+        optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+        model = train_ensemble(
+            model,
+            optimizer=optimizer,
+            train_loader=train_loader,
+            val_loader=val_loader,
+            epochs=epochs,
+            precision=precision,
+            monitor=settings["monitor"],
+            history=HistoryRecorder(
+                get_history_columns(n_members),
+                capacity=epochs,
+                filepath=filepath_history,
+                mlflow=mlflow if settings["log_epoch_metrics"] else None,
+            ),
+            patience=settings["patience"],
+            accumulation_steps=accumulation_steps,
+            scheduler=create_warmup_scheduler(
+                optimizer,
+                get_warmup_steps(
+                    train_loader, settings["warmup_epochs"], accumulation_steps
+                ),
+            ),
+        )
+
+        # Get metrics of the members and of the ensemble at their best epochs
+        val_metrics = ensemble_val_loop(val_loader, model, precision)
+        metrics = dict(
+            ensemble_val_loss=val_metrics["ensemble_val_loss"],
+            ensemble_val_acc=val_metrics["ensemble_val_acc"],
+        )
+        for metric in ("val_loss", "val_acc"):
+            metrics[f"members_{metric}_mean"] = float(val_metrics[metric].mean())
+            metrics[f"members_{metric}_std"] = float(val_metrics[metric].std())
+            for member in range(n_members):
+                metrics[f"{metric}_{member}"] = float(val_metrics[metric][member])
+
+        # Save the weights of each member, as for a single DenseNN
+        torch.save(
+            [model.get_member(member).state_dict() for member in range(n_members)],
+            filepath_ensemble,
+        )
+
+        # Log to MLflow
+        mlflow.log_artifact(filepath_ensemble)
+        mlflow.log_artifact(filepath_history)
+        mlflow.log_metrics(metrics)
+        mlflow.log_params(
+            dict(
+                n_members=n_members,
+                seeds=",".join(map(str, seeds)),
+                epochs=epochs,
+                batch_size=batch_size,
+                accumulation_steps=accumulation_steps,
+                learning_rate=learning_rate,
+                precision=precision,
+                classifier="DenseNN ensemble",
+                dataset_version=get_dataset_version(dir_processed),
+            )
+        )
+
+        print("Done!")
@@ -0,0 +1,223 @@
+"""
+Tests for the single-pass training of an ensemble of DenseNNs (ensemble.py)
+"""
+
+import configparser
+
+import pandas as pd
+import pytest
+import torch
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.ensemble import (
+    create_ensemble,
+    ensemble_train_loop,
+    get_history_columns,
+    train_densenet_ensemble,
+    train_ensemble,
+)
+from lib.history import HistoryRecorder
+from lib.pytorch import create_tensor_loader, train_loop
+from lib.testing import get_mlflow_stub
+
+vscode_config = configparser.ConfigParser()
+vscode_config.read("lab/processes/config_test.ini")
+
+SEEDS = (0, 1, 2)
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("training", [True, False])
+def test_ensemble_members_predict_as_densenets_with_their_seeds(training):
+    """
+    Test that each member of the ensemble predicts as a DenseNN initialized with its seed, in training mode
+    (batch statistics) and eval mode (running statistics)
+    """
+    X = torch.randn(64, 30)
+    ensemble = create_ensemble(SEEDS).train(training)
+    members = []
+    for seed in SEEDS:
+        torch.manual_seed(seed)
+        members.append(DenseNN().train(training))
+
+    probs = ensemble(X)
+
+    assert probs.shape == (len(SEEDS), 64, 1)
+    for member, net in enumerate(members):
+        assert torch.allclose(probs[member], net(X), atol=1e-5)
+    if training:
+        assert torch.allclose(ensemble.bn1.running_mean[0], members[0].bn1.running_mean)
+        assert torch.allclose(ensemble.bn1.running_var[0], members[0].bn1.running_var)
+
+
+@pytest.mark.unittest
+def test_batch_norm_rejects_training_batches_of_one_row():
+    """
+    Test that a training batch of a single row raises a ValueError (as nn.BatchNorm1d does), instead of
+    writing an infinite running variance into the members
+    """
+    ensemble = create_ensemble(SEEDS).train()
+    with pytest.raises(ValueError):
+        ensemble(torch.randn(1, 30))
+    assert torch.isfinite(ensemble.bn1.running_var).all()
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("accumulation_steps", [1, 3])
+def test_training_the_ensemble_trains_each_member_independently(accumulation_steps):
+    """
+    Test that an epoch of ensemble training leaves each member with the weights of a DenseNN trained alone
+    from its seed on the same batches, with and without gradient accumulation
+    """
+    X = torch.randn(120, 30)
+    y = torch.randint(0, 2, (120,))
+    loader_args = dict(batch_size=30, shuffle=False)
+    ensemble = create_ensemble(SEEDS)
+
+    train_loss, _ = ensemble_train_loop(
+        create_tensor_loader(X, y, loader_args),
+        ensemble,
+        torch.optim.Adam(ensemble.parameters(), lr=0.01),
+        precision="float32",
+        accumulation_steps=accumulation_steps,
+    )
+
+    for member, seed in enumerate(SEEDS):
+        torch.manual_seed(seed)
+        net = DenseNN()
+        loss, _ = train_loop(
+            create_tensor_loader(X, y, loader_args),
+            net,
+            torch.nn.BCELoss(),
+            torch.optim.Adam(net.parameters(), lr=0.01),
+            accumulation_steps=accumulation_steps,
+        )
+        trained_member = ensemble.get_member(member)
+        assert train_loss[member] == pytest.approx(loss, rel=1e-4)
+        assert torch.allclose(trained_member.bn1.weight, net.bn1.weight, atol=1e-5)
+        assert torch.allclose(
+            trained_member.output_layer.weight, net.output_layer.weight, atol=1e-5
+        )
+        # Compared by predictions in training mode, as the layers before batch norm have gradients close to
+        # zero in some directions (exactly zero for their biases), which Adam amplifies from rounding errors
+        with torch.no_grad():
+            assert torch.allclose(trained_member(X), net(X), atol=1e-4)
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("monitor", ["val_acc", "val_loss", "acc", "loss"])
+def test_each_member_keeps_its_best_epoch_by_the_monitor(monitor):
+    """
+    Test that each member of the trained ensemble has the weights of its own best epoch by the monitored
+    metric (training or validation), i.e. the weights of the member after training for that many epochs. The
+    validation data is random, so that the validation metrics peak in earlier epochs than the training ones
+    """
+    torch.manual_seed(0)
+    train_loader = create_tensor_loader(
+        torch.randn(120, 30), torch.randint(0, 2, (120,)), dict(batch_size=30)
+    )
+    val_loader = create_tensor_loader(
+        torch.randn(60, 30), torch.randint(0, 2, (60,)), dict(batch_size=30)
+    )
+
+    def train(epochs: int, history: HistoryRecorder = None):
+        ensemble = create_ensemble(SEEDS)
+        return train_ensemble(
+            ensemble,
+            torch.optim.Adam(ensemble.parameters(), lr=0.01),
+            train_loader=train_loader,
+            val_loader=val_loader,
+            epochs=epochs,
+            monitor=monitor,
+            history=history,
+        )
+
+    history = HistoryRecorder(get_history_columns(len(SEEDS)), capacity=6)
+    ensemble = train(6, history)
+
+    df_history = history.to_dataframe().set_index("epoch")
+    for member in range(len(SEEDS)):
+        values = df_history[f"{monitor}_{member}"]
+        best_epoch = values.idxmin() if monitor.endswith("loss") else values.idxmax()
+        expected = train(best_epoch).get_member(member)
+        for name, tensor in ensemble.get_member(member).state_dict().items():
+            assert torch.allclose(tensor, expected.state_dict()[name], atol=1e-6)
+
+
+@pytest.mark.unittest
+def test_training_stops_once_no_member_improves_for_patience_epochs():
+    """
+    Test that training stops early when none of the members has improved for patience epochs (here never,
+    as the learning rate is zero)
+    """
+    loader = create_tensor_loader(
+        torch.randn(60, 30), torch.randint(0, 2, (60,)), dict(batch_size=30)
+    )
+    ensemble = create_ensemble(SEEDS)
+    history = HistoryRecorder(get_history_columns(len(SEEDS)), capacity=10)
+
+    train_ensemble(
+        ensemble,
+        torch.optim.SGD(ensemble.parameters(), lr=0.0),
+        train_loader=loader,
+        val_loader=loader,
+        epochs=10,
+        monitor="val_loss",
+        history=history,
+        patience=2,
+    )
+
+    assert list(history.to_dataframe()["epoch"]) == [1, 2, 3]
+
+
+@pytest.mark.unittest
+def test_unknown_monitor_is_rejected():
+    """
+    Test that a monitor other than the training and validation losses and accuracies raises a ValueError
+    """
+    ensemble = create_ensemble(SEEDS)
+    with pytest.raises(ValueError):
+        train_ensemble(ensemble, None, None, None, epochs=1, monitor="f1")
+
+
+@pytest.mark.integration
+def test_train_densenet_ensemble(temp_data_dir):
+    """
+    Runs the ensemble training with a mock mlflow instance, and checks the metrics of each member and of the
+    ensemble, and that the saved members load into DenseNNs
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(vscode_config)
+    config["paths"]["dir_processed"] = temp_data_dir
+    mlflow_stub = get_mlflow_stub()
+
+    train_densenet_ensemble(
+        mlflow=mlflow_stub, config=config, mlflow_url=None, mlflow_tags=None
+    )
+
+    metrics = mlflow_stub.log_metrics.call_args.args[0]
+    assert {"ensemble_val_acc", "members_val_acc_std", "val_acc_0", "val_acc_2"} <= set(
+        metrics
+    )
+    assert 0 <= metrics["ensemble_val_acc"] <= 1
+    artifacts = [call.args[0] for call in mlflow_stub.log_artifact.call_args_list]
+    states = torch.load(artifacts[0])
+    assert len(states) == 3
+    DenseNN().load_state_dict(states[0])
+    df_history = pd.read_csv(artifacts[1])
+    assert {"ensemble_val_acc", "val_acc_0", "loss_2"} <= set(df_history.columns)
+
+
+@pytest.mark.unittest
+def test_train_densenet_ensemble_rejects_several_processes():
+    """
+    Test that the ensemble training, which runs in a single process, rejects n_processes > 1
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(vscode_config)
+    config["training"]["n_processes"] = "2"
+
+    with pytest.raises(ValueError):
+        train_densenet_ensemble(
+            mlflow=get_mlflow_stub(), config=config, mlflow_url=None, mlflow_tags=None
+        )
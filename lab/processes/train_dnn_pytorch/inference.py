@@ -0,0 +1,207 @@
+"""
+Batch prediction with a trained DenseNN (as saved by train_densenet), for offline scoring of processed
+features (scaled as in prepare_data).
+
+For inference, the batch norm layers are folded into the preceding linear layers and the resulting network
+is compiled with TorchScript and frozen, so that each forward pass runs four matrix products with fused
+activations. Optionally, the linear layers are quantized to int8 (see quantization.py). Arrays of any size
+(e.g. memory-mapped .npy files) are scored in chunks, e.g. from the repository root:
+
+    python -m lab.processes.train_dnn_pytorch.inference --model densenet.pt --input X.npy --output proba.npy
+"""
+
+import argparse
+import copy
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+
+CHUNK_SIZE = 65_536
+
+
+def fold_batch_norm(linear: nn.Linear, batch_norm: nn.BatchNorm1d) -> nn.Linear:
+    """
+    Returns a linear layer computing batch_norm(linear(x)) in eval mode, i.e. with the running statistics
+    of the batch norm layer folded into the weights and bias of the linear layer.
+
+    Args:
+        linear: (nn.Linear) linear layer
+        batch_norm: (nn.BatchNorm1d) batch norm layer applied to the outputs of the linear layer
+
+    Returns:
+        (nn.Linear) the folded linear layer
+    """
+    scale = batch_norm.weight / torch.sqrt(batch_norm.running_var + batch_norm.eps)
+    bias = linear.bias if linear.bias is not None else torch.zeros_like(scale)
+
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(linear.weight * scale.unsqueeze(1))
+        folded.bias.copy_((bias - batch_norm.running_mean) * scale + batch_norm.bias)
+    return folded
+
+
+def fold_densenet(net: DenseNN) -> nn.Sequential:
+    """
+    Returns a network computing the same predictions as a DenseNN in eval mode, with its batch norm layers
+    folded into the preceding linear layers (see fold_batch_norm).
+
+    Args:
+        net: (DenseNN) trained network
+
+    Returns:
+        (nn.Sequential) the folded network, in eval mode
+    """
+    return nn.Sequential(
+        fold_batch_norm(net.dense1, net.bn1),
+        nn.ReLU(),
+        fold_batch_norm(net.dense2, net.bn2),
+        nn.ReLU(),
+        fold_batch_norm(net.dense3, net.bn3),
+        nn.ReLU(),
+        copy.deepcopy(net.output_layer),
+        nn.Sigmoid(),
+    ).eval()
+
+
+def prepare_densenet_for_inference(
+    net: DenseNN, script: bool = True, quantize: bool = False
+) -> nn.Module:
+    """
+    Converts a trained DenseNN into a network for inference: folded (see fold_densenet), optionally with
+    its linear layers quantized to int8 (dynamic quantization: int8 weights, with the activations quantized
+    on the fly for each batch) and, optionally, compiled with TorchScript and frozen.
+
+    Args:
+        net: (DenseNN) trained network (left unchanged, apart from being set to eval mode)
+        script: (bool) whether to compile the network with TorchScript
+        quantize: (bool) whether to quantize the linear layers to int8
+
+    Returns:
+        (nn.Module) the network for inference, a frozen TorchScript module if script is set
+    """
+    model = fold_densenet(net.eval())
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+    if script:
+        model = torch.jit.freeze(torch.jit.script(model))
+    return model
+
+
+def load_densenet_for_inference(
+    filepath_model: Union[str, Path], script: bool = True, quantize: bool = False
+) -> nn.Module:
+    """
+    Loads the weights of a DenseNN saved by train_densenet (densenet.pt) into a network for inference
+    (see prepare_densenet_for_inference).
+
+    Args:
+        filepath_model: (str or Path) location of the saved weights (state dict) of the DenseNN
+        script: (bool) whether to compile the network with TorchScript
+        quantize: (bool) whether to quantize the linear layers to int8
+
+    Returns:
+        (nn.Module) the network for inference, a frozen TorchScript module if script is set
+    """
+    net = DenseNN()
+    net.load_state_dict(torch.load(filepath_model, map_location="cpu"))
+    return prepare_densenet_for_inference(net, script=script, quantize=quantize)
+
+
+def predict_proba(
+    model: nn.Module,
+    X: Union[np.ndarray, torch.Tensor],
+    chunk_size: int = CHUNK_SIZE,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Predicts the probability of the positive class for each row of a feature array, scoring it in chunks
+    so that only one chunk is converted to float32 and held in memory at a time (the array can be
+    memory-mapped, and be larger than memory).
+
+    Args:
+        model: (nn.Module) network for inference, e.g. as returned by load_densenet_for_inference
+        X: (numpy ndarray or torch Tensor) processed features, one row per sample
+        chunk_size: (int) number of rows scored per forward pass
+        out: (numpy ndarray or None) float32 array of len(X) values to write the probabilities into, e.g.
+            a memory-mapped .npy file; by default a new array
+
+    Returns:
+        (numpy ndarray) float32 array of the probabilities, one per row
+    """
+    if out is None:
+        out = np.empty(len(X), dtype=np.float32)
+
+    with torch.inference_mode():
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start : start + chunk_size]
+            # Copies the chunk (e.g. out of a read-only memory map) as float32
+            chunk = (
+                chunk.float()
+                if isinstance(chunk, torch.Tensor)
+                else torch.from_numpy(np.array(chunk, dtype=np.float32))
+            )
+            out[start : start + len(chunk)] = model(chunk).squeeze(1).numpy()
+    return out
+
+
+def predict(
+    model: nn.Module,
+    X: Union[np.ndarray, torch.Tensor],
+    threshold: float = 0.5,
+    chunk_size: int = CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Predicts the class (0 or 1) of each row of a feature array, scoring it in chunks (see predict_proba).
+
+    Args:
+        model: (nn.Module) network for inference, e.g. as returned by load_densenet_for_inference
+        X: (numpy ndarray or torch Tensor) processed features, one row per sample
+        threshold: (float) probability above which a row is assigned to the positive class
+        chunk_size: (int) number of rows scored per forward pass
+
+    Returns:
+        (numpy ndarray) uint8 array of the predicted classes, one per row
+    """
+    return (predict_proba(model, X, chunk_size) > threshold).astype(np.uint8)
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments of the batch prediction
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--model", required=True, help="saved DenseNN weights (.pt)")
+    parser.add_argument("--input", required=True, help="processed features (.npy)")
+    parser.add_argument("--output", required=True, help="probabilities (.npy)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--int8", action="store_true", help="quantize the linear layers to int8"
+    )
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+
+    arguments = parse_args()
+    features = np.load(arguments.input, mmap_mode="r")
+    probabilities = np.lib.format.open_memmap(
+        arguments.output, mode="w+", dtype=np.float32, shape=(len(features),)
+    )
+    predict_proba(
+        load_densenet_for_inference(arguments.model, quantize=arguments.int8),
+        features,
+        chunk_size=arguments.chunk_size,
+        out=probabilities,
+    )
+    probabilities.flush()
@@ -0,0 +1,78 @@
+"""
+Unit tests for batch prediction with a trained DenseNN (inference.py)
+"""
+
+import numpy as np
+import pytest
+import torch
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.inference import (
+    fold_densenet,
+    load_densenet_for_inference,
+    predict,
+    predict_proba,
+)
+
+
+@pytest.fixture(name="trained_net")
+def densenet_with_batch_norm_statistics():
+    """
+    Pytest fixture that yields a DenseNN in eval mode, with non-trivial batch norm statistics and affine
+    parameters (as after training)
+    """
+    torch.manual_seed(0)
+    net = DenseNN()
+    for batch_norm in (net.bn1, net.bn2, net.bn3):
+        batch_norm.running_mean.uniform_(-1, 1)
+        batch_norm.running_var.uniform_(0.5, 2)
+        torch.nn.init.uniform_(batch_norm.weight, 0.5, 1.5)
+        torch.nn.init.uniform_(batch_norm.bias, -0.5, 0.5)
+    yield net.eval()
+
+
+@pytest.fixture(name="features")
+def random_features():
+    """
+    Pytest fixture that yields a float32 feature array of 1000 rows of 30 features
+    """
+    yield np.random.default_rng(0).standard_normal((1000, 30)).astype(np.float32)
+
+
+@pytest.mark.unittest
+def test_folded_network_matches_the_densenet_in_eval_mode(trained_net, features):
+    """
+    Test that folding the batch norm layers into the linear layers leaves the predictions unchanged
+    """
+    X = torch.from_numpy(features)
+
+    with torch.no_grad():
+        expected = trained_net(X)
+        folded = fold_densenet(trained_net)(X)
+
+    assert torch.allclose(folded, expected, atol=1e-5)
+
+
+@pytest.mark.unittest
+def test_saved_model_is_loaded_scripted_and_scores_in_chunks(
+    trained_net, features, tmp_path
+):
+    """
+    Test that a saved DenseNN is loaded as a TorchScript module, and that scoring a memory-mapped array in
+    chunks gives the probabilities and classes of the DenseNN
+    """
+    torch.save(trained_net.state_dict(), tmp_path / "densenet.pt")
+    np.save(tmp_path / "X.npy", features)
+    with torch.no_grad():
+        expected = trained_net(torch.from_numpy(features)).squeeze(1).numpy()
+
+    model = load_densenet_for_inference(tmp_path / "densenet.pt")
+    X = np.load(tmp_path / "X.npy", mmap_mode="r")
+    probabilities = predict_proba(model, X, chunk_size=300)
+
+    assert isinstance(model, torch.jit.ScriptModule)
+    assert probabilities.dtype == np.float32 and probabilities.shape == (1000,)
+    np.testing.assert_allclose(probabilities, expected, atol=1e-5)
+    np.testing.assert_array_equal(
+        predict(model, X, chunk_size=300), (probabilities > 0.5).astype(np.uint8)
+    )
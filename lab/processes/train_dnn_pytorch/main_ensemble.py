@@ -0,0 +1,25 @@
+"""
+ML pipeline for breast cancer classification
+Training of an ensemble of PyTorch neural networks in a single pass (see ensemble.py)
+"""
+
+import configparser
+import os
+
+import mlflow
+
+from lab.processes.train_dnn_pytorch.ensemble import train_densenet_ensemble
+
+PATH_CONFIG = os.getenv("PATH_CONFIG")
+config = configparser.ConfigParser()
+config.read(str(PATH_CONFIG))
+
+MLFLOW_URL = os.getenv("MLFLOW_URL")
+MLFLOW_TAGS = {"git_tag": os.getenv("DRONE_TAG")}
+
+
+if __name__ == "__main__":
+
+    train_densenet_ensemble(
+        mlflow=mlflow, config=config, mlflow_url=MLFLOW_URL, mlflow_tags=MLFLOW_TAGS
+    )
@@ -0,0 +1,25 @@
+"""
+ML pipeline for breast cancer classification
+Hyperparameter sweep of the PyTorch neural network (see sweep.py)
+"""
+
+import configparser
+import os
+
+import mlflow
+
+from lab.processes.train_dnn_pytorch.sweep import run_sweep
+
+PATH_CONFIG = os.getenv("PATH_CONFIG")
+config = configparser.ConfigParser()
+config.read(str(PATH_CONFIG))
+
+MLFLOW_URL = os.getenv("MLFLOW_URL")
+MLFLOW_TAGS = {"git_tag": os.getenv("DRONE_TAG")}
+
+
+if __name__ == "__main__":
+
+    run_sweep(
+        mlflow=mlflow, config=config, mlflow_url=MLFLOW_URL, mlflow_tags=MLFLOW_TAGS
+    )
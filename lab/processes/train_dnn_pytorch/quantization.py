@@ -0,0 +1,130 @@
+"""
+Post-training int8 quantization of a trained DenseNN for CPU serving, and a benchmark comparing the float32
+and int8 networks for inference (see inference.py) on single-row latency, batch throughput, serialized size
+and accuracy
+"""
+
+import io
+import math
+import time
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.inference import (
+    CHUNK_SIZE,
+    predict,
+    predict_proba,
+    prepare_densenet_for_inference,
+)
+
+N_SINGLE_ROWS = 1000
+MIN_THROUGHPUT_ROWS = 100_000
+
+
+def get_serialized_size(model: torch.jit.ScriptModule) -> int:
+    """
+    Returns the size in bytes of a TorchScript module saved with torch.jit.save
+    """
+    buffer = io.BytesIO()
+    torch.jit.save(model, buffer)
+    return len(buffer.getvalue())
+
+
+def export_quantized_densenet(net: DenseNN, filepath: Union[str, Path]) -> None:
+    """
+    Saves a trained DenseNN with its batch norm layers folded and its linear layers quantized to int8, as a
+    TorchScript module that can be loaded with torch.jit.load, without the DenseNN class.
+
+    Args:
+        net: (DenseNN) trained network
+        filepath: (str or Path) destination of the TorchScript module
+    """
+    torch.jit.save(prepare_densenet_for_inference(net, quantize=True), str(filepath))
+
+
+def benchmark_inference(
+    model: nn.Module,
+    X: torch.Tensor,
+    y: torch.Tensor,
+    n_single_rows: int = N_SINGLE_ROWS,
+    batch_size: int = CHUNK_SIZE,
+    min_throughput_rows: int = MIN_THROUGHPUT_ROWS,
+) -> dict:
+    """
+    Measures the inference performance of a network on a labelled dataset.
+
+    Args:
+        model: (nn.Module) network for inference (see inference.prepare_densenet_for_inference)
+        X: (torch Tensor) processed features
+        y: (torch Tensor) labels
+        n_single_rows: (int) number of single-row predictions timed for the latency percentiles
+            (cycling over the rows of X)
+        batch_size: (int) number of rows per forward pass for the throughput
+        min_throughput_rows: (int) minimum number of rows scored for the throughput (repeating X)
+
+    Returns:
+        (dict) of the median and 99th percentile single-row latency (latency_p50_ms, latency_p99_ms), the
+            batch throughput (rows_per_s), the serialized size (size_bytes, for TorchScript modules) and the
+            accuracy
+    """
+    X_float = X.float()
+
+    latencies = []
+    with torch.inference_mode():
+        for row in range(-10, n_single_rows):
+            x = X_float[row % len(X) : row % len(X) + 1]
+            start = time.perf_counter()
+            model(x)
+            # The first predictions warm up the model and are not recorded
+            if row >= 0:
+                latencies.append(time.perf_counter() - start)
+
+    n_passes = math.ceil(min_throughput_rows / len(X))
+    start = time.perf_counter()
+    for _ in range(n_passes):
+        predict_proba(model, X_float, chunk_size=batch_size)
+    rows_per_s = n_passes * len(X) / (time.perf_counter() - start)
+
+    y_pred = predict(model, X_float, chunk_size=batch_size)
+    return dict(
+        latency_p50_ms=float(np.percentile(latencies, 50) * 1000),
+        latency_p99_ms=float(np.percentile(latencies, 99) * 1000),
+        rows_per_s=rows_per_s,
+        size_bytes=(
+            get_serialized_size(model)
+            if isinstance(model, torch.jit.ScriptModule)
+            else np.nan
+        ),
+        accuracy=float((y_pred == y.numpy()).mean()),
+    )
+
+
+def benchmark_quantization(
+    net: DenseNN, X: torch.Tensor, y: torch.Tensor, **kwargs
+) -> pd.DataFrame:
+    """
+    Benchmarks the float32 and int8 networks for inference of a trained DenseNN (see benchmark_inference).
+
+    Args:
+        net: (DenseNN) trained network
+        X: (torch Tensor) processed features, e.g. of the validation set
+        y: (torch Tensor) labels
+        **kwargs: further arguments of benchmark_inference
+
+    Returns:
+        (pandas DataFrame) with the results of benchmark_inference for each network (indexed by
+            'float32' and 'int8')
+    """
+    results = {
+        name: benchmark_inference(
+            prepare_densenet_for_inference(net, quantize=quantize), X, y, **kwargs
+        )
+        for name, quantize in [("float32", False), ("int8", True)]
+    }
+    return pd.DataFrame.from_dict(results, orient="index").rename_axis("model")
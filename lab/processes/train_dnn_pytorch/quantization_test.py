@@ -0,0 +1,69 @@
+"""
+Unit tests for the int8 quantization of a trained DenseNN (quantization.py)
+"""
+
+import pytest
+import torch
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.quantization import (
+    benchmark_quantization,
+    export_quantized_densenet,
+)
+
+
+@pytest.fixture(name="trained_net")
+def densenet_in_eval_mode():
+    """
+    Pytest fixture that yields a seeded DenseNN in eval mode
+    """
+    torch.manual_seed(0)
+    yield DenseNN().eval()
+
+
+@pytest.mark.unittest
+def test_exported_int8_model_is_loaded_without_the_densenet_class(
+    trained_net, tmp_path
+):
+    """
+    Test that the exported int8 network is a TorchScript module whose predictions are close to those of the
+    float32 DenseNN
+    """
+    X = torch.randn(200, 30)
+    export_quantized_densenet(trained_net, tmp_path / "densenet_int8.pt")
+
+    model = torch.jit.load(str(tmp_path / "densenet_int8.pt"))
+
+    with torch.no_grad():
+        assert torch.allclose(model(X), trained_net(X), atol=0.02)
+
+
+@pytest.mark.unittest
+def test_benchmark_compares_the_float32_and_int8_networks(trained_net):
+    """
+    Test that the benchmark reports every metric for both networks, with a smaller int8 network of about
+    the same accuracy
+    """
+    X = torch.randn(200, 30)
+    with torch.no_grad():
+        y = (trained_net(X).squeeze(1) > 0.5).to(torch.uint8)
+
+    df_benchmark = benchmark_quantization(
+        trained_net, X, y, n_single_rows=20, min_throughput_rows=1000
+    )
+
+    assert df_benchmark.index.tolist() == ["float32", "int8"]
+    assert df_benchmark.columns.tolist() == [
+        "latency_p50_ms",
+        "latency_p99_ms",
+        "rows_per_s",
+        "size_bytes",
+        "accuracy",
+    ]
+    assert (df_benchmark["latency_p99_ms"] >= df_benchmark["latency_p50_ms"]).all()
+    assert (
+        df_benchmark.loc["int8", "size_bytes"]
+        < df_benchmark.loc["float32", "size_bytes"]
+    )
+    assert df_benchmark.loc["float32", "accuracy"] == 1.0
+    assert df_benchmark.loc["int8", "accuracy"] > 0.9
@@ -0,0 +1,202 @@
+"""
+Local scoring service for a trained model: the DenseNN (as saved by train_densenet) or a fitted sklearn
+classifier (as saved by train_classifiers), loaded from the artifacts directory and served on localhost over
+HTTP, with concurrent single-row requests scored in micro-batches (see lib.serving.MicroBatcher). The
+settings are read from the "serving" section of the config, e.g. from the repository root:
+
+    python -m lab.processes.train_dnn_pytorch.serving --config lab/processes/config.ini
+
+With --benchmark, generates concurrent load on the model instead, scoring single rows unbatched, in
+micro-batches in-process, and in micro-batches over HTTP, and saves the latency and throughput of each.
+"""
+
+import argparse
+import configparser
+import pickle
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from lab.processes.prepare_data.cancer_data import load_data_splits
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.inference import (
+    load_densenet_for_inference,
+    predict_proba,
+)
+from lib.serving import (
+    MicroBatcher,
+    create_http_client,
+    create_scoring_server,
+    run_load_test,
+)
+
+
+def load_scoring_function(
+    filepath_model: Union[str, Path], int8: bool = False
+) -> Tuple[Callable[[np.ndarray], np.ndarray], Optional[int]]:
+    """
+    Loads a trained model and returns a function scoring a batch of processed features with it.
+
+    Args:
+        filepath_model: (str or Path) the weights of a DenseNN (.pt), loaded for inference (see
+            load_densenet_for_inference), or a pickled sklearn classifier (.pkl)
+        int8: (bool) whether to quantize the linear layers of the DenseNN to int8
+
+    Returns:
+        (tuple) the scoring function, returning the probability of the positive class of each row (or the
+            predicted class, for classifiers without predict_proba such as SVC), and the number of features
+            the model expects (None if unknown)
+    """
+    filepath_model = Path(filepath_model)
+    if filepath_model.suffix == ".pt":
+        model = load_densenet_for_inference(filepath_model, quantize=int8)
+        return (
+            lambda X: predict_proba(model, X),
+            DenseNN().dense1.in_features,
+        )
+    if filepath_model.suffix == ".pkl":
+        with open(filepath_model, "rb") as file:
+            classifier = pickle.load(file)
+        if hasattr(classifier, "predict_proba"):
+
+            def predict_fn(X: np.ndarray) -> np.ndarray:
+                return classifier.predict_proba(X)[:, 1]
+
+        else:
+            predict_fn = classifier.predict
+        return predict_fn, getattr(classifier, "n_features_in_", None)
+    raise ValueError(
+        f"Cannot load {filepath_model}: expected DenseNN weights (.pt) or a pickled classifier (.pkl)"
+    )
+
+
+def benchmark_serving(
+    predict_fn: Callable[[np.ndarray], np.ndarray],
+    rows: np.ndarray,
+    concurrency: int = 32,
+    n_requests: int = 5000,
+    max_batch_size: int = 64,
+    max_wait_ms: float = 2.0,
+    http: bool = True,
+) -> pd.DataFrame:
+    """
+    Generates concurrent single-row requests on a scoring function (see lib.serving.run_load_test), scoring
+    them one by one ('unbatched'), in micro-batches in-process ('micro_batched'), and, optionally, in
+    micro-batches behind a local HTTP server on a free port ('http').
+
+    Args:
+        predict_fn: (callable) scores a batch of rows, e.g. as returned by load_scoring_function
+        rows: (numpy ndarray) rows of processed features, sent in turn
+        concurrency: (int) number of concurrent clients
+        n_requests: (int) number of requests per mode
+        max_batch_size: (int) maximum rows per micro-batch
+        max_wait_ms: (float) maximum wait of a request for its micro-batch to fill, in milliseconds
+        http: (bool) whether to also benchmark the HTTP server
+
+    Returns:
+        (pandas DataFrame) requests per second and latency percentiles (in ms), indexed by mode, with the mean
+            micro-batch size of the micro-batched modes
+    """
+    rows = np.asarray(rows, dtype=np.float32)
+    results = dict(
+        unbatched=run_load_test(
+            lambda row: predict_fn(row[np.newaxis])[0], rows, concurrency, n_requests
+        )
+    )
+
+    with MicroBatcher(predict_fn, max_batch_size, max_wait_ms) as batcher:
+        results["micro_batched"] = run_load_test(
+            batcher.predict, rows, concurrency, n_requests
+        )
+        results["micro_batched"]["mean_batch_size"] = batcher.stats()["mean_batch_size"]
+
+    if http:
+        with MicroBatcher(predict_fn, max_batch_size, max_wait_ms) as batcher:
+            server = create_scoring_server(batcher, port=0)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                host, port = server.server_address[:2]
+                results["http"] = run_load_test(
+                    create_http_client(f"http://{host}:{port}"),
+                    rows,
+                    concurrency,
+                    n_requests,
+                )
+                results["http"]["mean_batch_size"] = batcher.stats()["mean_batch_size"]
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+    return pd.DataFrame.from_dict(results, orient="index")
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments of the scoring service
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--config", required=True, help="config file (.ini)")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="generate load on the model instead of serving it",
+    )
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+
+    arguments = parse_args()
+    config = configparser.ConfigParser()
+    config.read(arguments.config)
+    settings = config["serving"]
+    full_dir_artifacts = Path(config["paths"]["workspace_dir"]) / Path(
+        config["paths"]["artifacts_temp"]
+    )
+    scoring_fn, n_model_features = load_scoring_function(
+        full_dir_artifacts / settings["model"],
+        int8=settings.getboolean("int8", fallback=False),
+    )
+    max_rows = int(settings.get("max_batch_size", fallback="64"))
+    max_wait = float(settings.get("max_wait_ms", fallback="2"))
+
+    if arguments.benchmark:
+        (X_val,) = load_data_splits(
+            dir_processed=config["paths"]["dir_processed"],
+            as_type="array",
+            splits=("X_val",),
+        )
+        df_benchmark = benchmark_serving(
+            scoring_fn,
+            X_val,
+            concurrency=int(settings.get("concurrency", fallback="32")),
+            n_requests=int(settings.get("n_requests", fallback="5000")),
+            max_batch_size=max_rows,
+            max_wait_ms=max_wait,
+        )
+        print(df_benchmark.round(3).to_string())
+        df_benchmark.to_csv(
+            full_dir_artifacts
+            / config["filenames"].get(
+                "fname_serving_benchmark", fallback="serving_benchmark.csv"
+            )
+        )
+    else:
+        with MicroBatcher(scoring_fn, max_rows, max_wait, n_model_features) as scorer:
+            scoring_server = create_scoring_server(
+                scorer,
+                host=settings.get("host", fallback="127.0.0.1"),
+                port=int(settings.get("port", fallback="8080")),
+            )
+            print(f"Serving {settings['model']} on {scoring_server.server_address}")
+            try:
+                scoring_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                scoring_server.server_close()
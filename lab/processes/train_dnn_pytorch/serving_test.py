@@ -0,0 +1,64 @@
+"""
+Tests for the local scoring service of trained models (serving.py)
+"""
+
+import pickle
+import time
+
+import numpy as np
+import pytest
+import torch
+from sklearn.linear_model import LogisticRegression
+
+from lab.processes.train_dnn_pytorch.densenet import DenseNN
+from lab.processes.train_dnn_pytorch.serving import (
+    benchmark_serving,
+    load_scoring_function,
+)
+
+
+@pytest.mark.unittest
+def test_load_scoring_function_of_densenet_and_classifier(tmp_path):
+    """
+    Test that the weights of a DenseNN and a pickled sklearn classifier load into functions scoring the
+    probability of the positive class of each row
+    """
+    X = np.random.default_rng(0).normal(size=(50, 30)).astype(np.float32)
+    torch.manual_seed(0)
+    net = DenseNN().eval()
+    torch.save(net.state_dict(), tmp_path / "densenet.pt")
+    classifier = LogisticRegression().fit(X, X[:, 0] > 0)
+    with open(tmp_path / "logistic_regression.pkl", "wb") as file:
+        pickle.dump(classifier, file)
+
+    predict_densenet, n_features = load_scoring_function(tmp_path / "densenet.pt")
+    predict_classifier, _ = load_scoring_function(tmp_path / "logistic_regression.pkl")
+
+    assert n_features == 30
+    with torch.no_grad():
+        expected = net(torch.from_numpy(X)).squeeze(1).numpy()
+    assert np.allclose(predict_densenet(X), expected, atol=1e-5)
+    assert np.allclose(predict_classifier(X), classifier.predict_proba(X)[:, 1])
+    with pytest.raises(ValueError):
+        load_scoring_function(tmp_path / "model.onnx")
+
+
+@pytest.mark.unittest
+def test_benchmark_serving_reports_each_mode():
+    """
+    Test that the serving benchmark reports the throughput and latency of each mode, with micro-batches
+    of more than one row under concurrent load
+    """
+    rows = np.random.default_rng(0).normal(size=(20, 4)).astype(np.float32)
+
+    def predict_fn(X):
+        time.sleep(0.002)
+        return X.sum(axis=1)
+
+    df_benchmark = benchmark_serving(
+        predict_fn, rows, concurrency=8, n_requests=200, max_wait_ms=5
+    )
+
+    assert df_benchmark.index.tolist() == ["unbatched", "micro_batched", "http"]
+    assert (df_benchmark["requests_per_s"] > 0).all()
+    assert df_benchmark.loc["micro_batched", "mean_batch_size"] > 1
@@ -0,0 +1,344 @@
+"""
+Hyperparameter sweep of the DenseNN training (see densenet.py): trains one trial per sampled configuration
+of the search space in the "sweep" section of the config, optionally pruning the worse trials early by
+successive halving, and logs each trial as a nested MLflow run of the sweep run.
+
+Each trial trains a DenseNN like train_densenet (see densenet.fit_densenet), with the options of the
+"training" section of the config overridden by those of the trial. The trials run concurrently in a bounded
+pool of processes, each of which loads the processed data once, memory-mapped, so that all processes share a
+single copy of the data through the page cache and neither the data loading nor the process startup is paid
+per trial.
+"""
+
+import itertools
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser, SectionProxy
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import torch
+
+from lab.processes.prepare_data.cancer_data import load_data_splits
+from lab.processes.train_dnn_pytorch.densenet import (
+    fit_densenet,
+    read_training_settings,
+)
+from lib.pytorch import create_dataloader, create_tensor_loader, scale_learning_rate
+
+# The number of epochs is not searchable: it is the budget of the trials (see get_rung_epochs)
+SEARCHABLE_OPTIONS = ("lr", "batch_size", "accumulation_steps", "warmup_epochs")
+SWEEP_SETTINGS = ("strategy", "n_trials", "max_workers", "min_epochs", "eta")
+
+# Data splits of the current worker process, loaded once by _load_worker_data
+_worker_data = {}
+
+
+def _parse_value(value: str) -> Union[int, float]:
+    """
+    Parses a number from the config, as an int if it has no decimals or exponent
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_search_space(sweep_config: SectionProxy) -> dict:
+    """
+    Parses the search space from the "sweep" section of the config: each searchable option of the
+    "training" section (see SEARCHABLE_OPTIONS) holds either comma-separated candidate values, or for random
+    search a range low:high, sampled log-uniformly for floats and uniformly for ints.
+
+    Args:
+        sweep_config: (SectionProxy) the "sweep" section of the config
+
+    Returns:
+        (dict) of option name to list of candidate values, or to a (low, high) tuple for ranges
+    """
+    space = {}
+    for option, value in sweep_config.items():
+        if option in SWEEP_SETTINGS:
+            continue
+        if option not in SEARCHABLE_OPTIONS:
+            raise ValueError(
+                f"Cannot sweep over {option}; please use any of {', '.join(SEARCHABLE_OPTIONS)}"
+            )
+        if ":" in value:
+            low, high = value.split(":")
+            space[option] = (_parse_value(low), _parse_value(high))
+        else:
+            space[option] = [_parse_value(item) for item in value.split(",")]
+    return space
+
+
+def sample_trials(
+    space: dict, strategy: str = "grid", n_trials: int = 8, random_state: int = 0
+) -> list:
+    """
+    Samples the configurations of the trials of a sweep from a search space.
+
+    Args:
+        space: (dict) search space, as returned by parse_search_space
+        strategy: (str) 'grid' for every combination of the candidate values (ranges are not allowed), or
+            'random' for n_trials configurations sampled independently per option
+        n_trials: (int) number of trials of a random search
+        random_state: (int) seed of the random search
+
+    Returns:
+        (list of dict) the option values of each trial
+    """
+    if strategy == "grid":
+        if any(isinstance(values, tuple) for values in space.values()):
+            raise ValueError("Ranges can only be sampled by the random strategy")
+        return [
+            dict(zip(space, values)) for values in itertools.product(*space.values())
+        ]
+    if strategy != "random":
+        raise ValueError("Please specify the sweep strategy as one of 'grid', 'random'")
+
+    rng = np.random.default_rng(random_state)
+    samples = {}
+    for option, values in space.items():
+        if not isinstance(values, tuple):
+            samples[option] = [
+                values[index] for index in rng.integers(len(values), size=n_trials)
+            ]
+        elif all(isinstance(bound, int) for bound in values):
+            samples[option] = rng.integers(
+                values[0], values[1] + 1, size=n_trials
+            ).tolist()
+        else:
+            samples[option] = np.exp(
+                rng.uniform(*np.log(values), size=n_trials)
+            ).tolist()
+    return [
+        {option: samples[option][trial] for option in space}
+        for trial in range(n_trials)
+    ]
+
+
+def get_rung_epochs(max_epochs: int, min_epochs: Optional[int], eta: int) -> list:
+    """
+    Returns the number of epochs up to which the trials are trained at each rung of successive halving:
+    min_epochs, multiplied by eta at every rung, up to max_epochs (a single rung without min_epochs)
+    """
+    if not min_epochs or min_epochs >= max_epochs:
+        return [max_epochs]
+
+    rung_epochs = [min_epochs]
+    while rung_epochs[-1] * eta < max_epochs:
+        rung_epochs.append(rung_epochs[-1] * eta)
+    return rung_epochs + [max_epochs]
+
+
+def _load_worker_data(dir_processed: str, mmap_mode: str, n_threads: int) -> None:
+    """
+    Initializer of the worker processes of a sweep: memory-maps the training and validation splits once
+    """
+    torch.set_num_threads(n_threads)
+    _worker_data["splits"] = load_data_splits(
+        dir_processed,
+        as_type="tensor",
+        mmap_mode=mmap_mode,
+        splits=("X_train", "X_val", "y_train", "y_val"),
+    )
+
+
+def train_trial(
+    settings: dict, base_batch_size: int, epochs: int, filepath_checkpoint: Path
+) -> pd.DataFrame:
+    """
+    Trains the DenseNN of a trial up to the given number of epochs, resuming from its checkpoint of the
+    previous rung if there is one (see lib.pytorch.train_and_validate), in a worker process of a sweep.
+    The trial trains in the worker process (n_processes is not used), with the loaders of in_memory_loader
+    and the learning rate scaled from base_batch_size to its effective batch size (see lr_scaling).
+
+    Args:
+        settings: (dict) options of the "training" section for the trial (see read_training_settings)
+        base_batch_size: (int) batch size in the "training" section, for which lr is set
+        epochs: (int) number of epochs to train the trial up to
+        filepath_checkpoint: (Path) location of the checkpoint of the trial
+
+    Returns:
+        (pandas DataFrame) training history of the trial, up to the given number of epochs
+    """
+    X_train, X_val, y_train, y_val = _worker_data["splits"]
+    np.random.seed(settings["random_seed"])
+    torch.manual_seed(settings["random_seed"])
+
+    dataloader_args = dict(
+        batch_size=settings["batch_size"],
+        num_workers=settings["n_workers"],
+        shuffle=True,
+    )
+    create_loader = (
+        create_tensor_loader if settings["in_memory_loader"] else create_dataloader
+    )
+
+    _, df_history, _ = fit_densenet(
+        create_loader(X_train, y_train, dataloader_args),
+        create_loader(X_val, y_val, dataloader_args),
+        learning_rate=scale_learning_rate(
+            settings["lr"],
+            base_batch_size,
+            settings["batch_size"] * settings["accumulation_steps"],
+            settings["lr_scaling"],
+        ),
+        warmup_epochs=settings["warmup_epochs"],
+        accumulation_steps=settings["accumulation_steps"],
+        epochs=epochs,
+        precision=settings["precision"],
+        monitor=settings["monitor"],
+        patience=settings["patience"],
+        filepath_checkpoint=filepath_checkpoint,
+        checkpoint_every=epochs,
+    )
+    return df_history
+
+
+def get_best_value(df_history: pd.DataFrame, monitor: str) -> float:
+    """
+    Returns the best value of the monitored metric in a training history (lowest for losses)
+    """
+    values = df_history[monitor]
+    return float(values.min() if monitor.endswith("loss") else values.max())
+
+
+def run_sweep(
+    mlflow, config: ConfigParser, mlflow_url: str, mlflow_tags: dict
+) -> pd.DataFrame:
+    """
+    The main function of the DenseNN hyperparameter sweep
+
+    - Samples the trials from the search space of the "sweep" section of the config (see sample_trials),
+      taking the options that are not searched from the "training" section (see read_training_settings)
+    - Trains max_workers trials at a time in a pool of processes sharing the memory-mapped data. With
+      min_epochs and eta set, trains by successive halving: all trials for min_epochs, then only the best
+      1/eta of them eta times longer (resuming from their checkpoints), and so on up to the epochs of the
+      "training" section
+    - Logs each trial as a nested MLflow run (its options, the best value of the monitored metric at each
+      rung and its final metrics), and the results table and best options in the sweep run
+
+    Returns:
+        (pandas DataFrame) the results of the trials, sorted from best to worst
+    """
+    # Unpack config
+    sweep_config = config["sweep"]
+    training_config = config["training"]
+    strategy = sweep_config.get("strategy", fallback="grid")
+    n_trials = int(sweep_config.get("n_trials", fallback="8"))
+    max_workers = int(sweep_config.get("max_workers", fallback="2"))
+    min_epochs = int(sweep_config.get("min_epochs", fallback="") or 0) or None
+    eta = int(sweep_config.get("eta", fallback="3"))
+    settings = read_training_settings(training_config)
+    monitor = settings["monitor"]
+    dir_processed = config["paths"]["dir_processed"]
+    mmap_mode = config["paths"].get("mmap_mode") or "r"
+    workspace_dir = Path(config["paths"]["workspace_dir"])
+    full_dir_artifacts = workspace_dir / Path(config["paths"]["artifacts_temp"])
+    filepath_results = full_dir_artifacts / config["filenames"].get(
+        "fname_sweep_results", fallback="sweep_results.csv"
+    )
+
+    space = parse_search_space(sweep_config)
+    trials = [
+        read_training_settings(training_config, params)
+        for params in sample_trials(space, strategy, n_trials, settings["random_seed"])
+    ]
+    rung_epochs = get_rung_epochs(settings["epochs"], min_epochs, eta)
+    scores = [{} for _ in trials]
+    histories = [None] * len(trials)
+
+    full_dir_artifacts.mkdir(exist_ok=True)
+    mlflow.set_tracking_uri(mlflow_url)
+    mlflow.set_experiment(config["mlflow"]["mlflow_experiment"])
+
+    with mlflow.start_run(
+        run_name="pytorch_example_sweep", tags=mlflow_tags
+    ), tempfile.TemporaryDirectory() as dir_checkpoints, ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load_worker_data,
+        initargs=(
+            dir_processed,
+            mmap_mode,
+            max(1, (os.cpu_count() or 1) // max_workers),
+        ),
+    ) as executor:
+
+        # Train the remaining trials rung by rung, keeping the best 1/eta of them after each rung
+        remaining = list(range(len(trials)))
+        for rung, rung_epoch in enumerate(rung_epochs):
+            futures = {
+                trial: executor.submit(
+                    train_trial,
+                    trials[trial],
+                    settings["batch_size"],
+                    rung_epoch,
+                    Path(dir_checkpoints) / f"trial_{trial}.pt",
+                )
+                for trial in remaining
+            }
+            for trial, future in futures.items():
+                histories[trial] = future.result()
+                scores[trial][rung_epoch] = get_best_value(histories[trial], monitor)
+
+            if rung < len(rung_epochs) - 1:
+                reverse = not monitor.endswith("loss")
+                remaining = sorted(
+                    remaining,
+                    key=lambda trial: scores[trial][rung_epoch],
+                    reverse=reverse,
+                )[: max(1, len(remaining) // eta)]
+
+        # Log each trial as a nested run, and the results in the sweep run
+        results = []
+        for trial, history in enumerate(histories):
+            params = {option: trials[trial][option] for option in SEARCHABLE_OPTIONS}
+            last_rung_epoch = list(scores[trial])[-1]
+            result = dict(
+                trial=trial,
+                **params,
+                epochs_trained=int(history["epoch"].max()),
+                score=scores[trial][last_rung_epoch],
+                rungs=len(scores[trial]),
+            )
+            results.append(result)
+
+            with mlflow.start_run(run_name=f"trial_{trial}", nested=True):
+                mlflow.log_params({**params, "trial": trial})
+                for rung_epoch, score in scores[trial].items():
+                    mlflow.log_metric(monitor, score, step=rung_epoch)
+                mlflow.log_metrics(
+                    dict(
+                        history.drop(columns=["epoch"]).iloc[-1].astype(float),
+                        epochs_trained=result["epochs_trained"],
+                    )
+                )
+
+        df_results = pd.DataFrame(results).sort_values(
+            ["rungs", "score"],
+            ascending=[False, monitor.endswith("loss")],
+        )
+        df_results.to_csv(filepath_results, index=False)
+        best = df_results.iloc[0]
+
+        mlflow.log_params(
+            dict(
+                strategy=strategy,
+                n_trials=len(trials),
+                max_workers=max_workers,
+                rung_epochs=",".join(map(str, rung_epochs)),
+                **{f"best_{option}": best[option] for option in SEARCHABLE_OPTIONS},
+            )
+        )
+        mlflow.log_metric(f"best_{monitor}", float(best["score"]))
+        mlflow.log_artifact(filepath_results)
+
+    return df_results
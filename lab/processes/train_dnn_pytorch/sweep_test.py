@@ -0,0 +1,117 @@
+"""
+Tests for the hyperparameter sweep of the DenseNN training (sweep.py)
+"""
+
+import configparser
+
+import pytest
+
+from lab.processes.train_dnn_pytorch.sweep import (
+    get_rung_epochs,
+    parse_search_space,
+    run_sweep,
+    sample_trials,
+)
+from lib.testing import get_mlflow_stub
+
+vscode_config = configparser.ConfigParser()
+vscode_config.read("lab/processes/config_test.ini")
+
+
+@pytest.mark.unittest
+class TestSearchSpace:
+    """
+    Tests for parsing and sampling the search space of a sweep
+    """
+
+    def test_grid_covers_every_combination_of_candidates(self):
+        """
+        Test that the grid strategy returns every combination of the candidate values, with ints and floats
+        """
+        config = configparser.ConfigParser()
+        config.read_dict(
+            dict(sweep=dict(lr="0.001, 1e-2", batch_size="30,60", eta="3"))
+        )
+
+        space = parse_search_space(config["sweep"])
+        trials = sample_trials(space, "grid")
+
+        assert space == dict(lr=[0.001, 0.01], batch_size=[30, 60])
+        assert trials == [
+            dict(lr=0.001, batch_size=30),
+            dict(lr=0.001, batch_size=60),
+            dict(lr=0.01, batch_size=30),
+            dict(lr=0.01, batch_size=60),
+        ]
+
+    def test_random_search_samples_within_ranges(self):
+        """
+        Test that the random strategy samples n_trials configurations within the ranges and candidates,
+        reproducibly for a seed
+        """
+        space = dict(lr=(1e-4, 1e-2), batch_size=(16, 64), warmup_epochs=[0, 2])
+
+        trials = sample_trials(space, "random", n_trials=20, random_state=1)
+
+        assert len(trials) == 20
+        assert all(1e-4 <= trial["lr"] <= 1e-2 for trial in trials)
+        assert all(isinstance(trial["batch_size"], int) for trial in trials)
+        assert all(16 <= trial["batch_size"] <= 64 for trial in trials)
+        assert {trial["warmup_epochs"] for trial in trials} == {0, 2}
+        assert trials == sample_trials(space, "random", n_trials=20, random_state=1)
+
+    def test_invalid_search_spaces_are_rejected(self):
+        """
+        Test that options that cannot be swept, and ranges in a grid, raise a ValueError
+        """
+        config = configparser.ConfigParser()
+        config.read_dict(dict(sweep=dict(n_workers="1, 2")))
+        with pytest.raises(ValueError):
+            parse_search_space(config["sweep"])
+        config.read_dict(dict(sweep=dict(epochs="10, 20")))
+        with pytest.raises(ValueError):
+            parse_search_space(config["sweep"])
+        with pytest.raises(ValueError):
+            sample_trials(dict(lr=(1e-4, 1e-2)), "grid")
+
+    @pytest.mark.parametrize(
+        "max_epochs, min_epochs, eta, expected",
+        [(80, 5, 3, [5, 15, 45, 80]), (9, 1, 3, [1, 3, 9]), (10, None, 3, [10])],
+    )
+    def test_rung_epochs_grow_by_eta(self, max_epochs, min_epochs, eta, expected):
+        """
+        Test the epochs of the rungs of successive halving
+        """
+        assert get_rung_epochs(max_epochs, min_epochs, eta) == expected
+
+
+@pytest.mark.integration
+@pytest.mark.filterwarnings("ignore:CUDA initialization")
+def test_run_sweep_prunes_trials_and_logs_nested_runs(temp_data_dir):
+    """
+    Runs a sweep of 2 trials by successive halving (1 epoch, then 2 epochs for the better trial) with a
+    mock mlflow instance, and checks the results and the nested runs logged
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(vscode_config)
+    config["paths"]["dir_processed"] = temp_data_dir
+    config["training"]["epochs"] = "2"
+    config.read_dict(
+        dict(sweep=dict(lr="0.001, 0.01", max_workers="2", min_epochs="1", eta="2"))
+    )
+    mlflow_stub = get_mlflow_stub()
+
+    df_results = run_sweep(
+        mlflow=mlflow_stub, config=config, mlflow_url=None, mlflow_tags=None
+    )
+
+    assert sorted(df_results["lr"]) == [0.001, 0.01]
+    assert df_results["rungs"].tolist() == [2, 1]
+    assert df_results["epochs_trained"].tolist() == [2, 1]
+    nested_runs = [
+        call
+        for call in mlflow_stub.start_run.call_args_list
+        if call.kwargs.get("nested")
+    ]
+    assert len(nested_runs) == 2
+    mlflow_stub.log_artifact.assert_called()
@@ -1,6 +1,7 @@
 """
 Functions for instantiating and training traditional ML classifiers
 """
+import pickle
 from configparser import ConfigParser
 from pathlib import Path
 from types import ModuleType
@@ -8,6 +9,7 @@ from typing import Union
 
 import numpy as np
 from mock import MagicMock
+from sklearn.base import ClassifierMixin, clone
 from sklearn.ensemble import (
     AdaBoostClassifier,
     GradientBoostingClassifier,
@@ -20,6 +22,8 @@ from sklearn.neighbors import KNeighborsClassifier
 from sklearn.svm import SVC
 
 from lab.processes.prepare_data.cancer_data import load_data_splits
+from lab.processes.prepare_data.cross_validation import iter_cv_folds
+from lab.processes.prepare_data.manifest import get_dataset_version
 from lib.viz import plot_confusion_matrix
 
 
@@ -43,6 +47,47 @@ def create_classifiers() -> dict:
     return models
 
 
+def get_classifier_filename(model_name: str) -> str:
+    """
+    Returns the name of the file a fitted classifier is saved to, e.g. 'logistic_regression.pkl' for the
+    'Logistic regression' classifier of create_classifiers
+    """
+    return model_name.lower().replace(" ", "_").replace("-", "_") + ".pkl"
+
+
+def cross_validate_classifier(
+    model: ClassifierMixin,
+    dir_processed: str,
+    n_folds: int,
+    mmap_mode: Union[str, None] = None,
+) -> dict:
+    """
+    Fits a fresh copy of the classifier on the training data of each stored cross-validation fold
+    (see prepare_data.cross_validation) and computes the accuracy on the validation data of that fold.
+
+    Args:
+        model: (sklearn classifier) the classifier to cross-validate (left unfitted)
+        dir_processed: (str) directory containing processed data files with cross-validation folds
+        n_folds: (int) number of folds
+        mmap_mode: (str or None) memory-map mode for the stored data
+
+    Returns:
+        (dict) of metrics: mean and standard deviation of the validation accuracy across folds
+            (cv_val_acc, cv_val_acc_std) and the validation accuracy of each fold (cv_val_acc_fold<n>)
+    """
+    accuracies = {}
+    for fold, X_train, X_val, y_train, y_val in iter_cv_folds(
+        dir_processed, n_folds=n_folds, mmap_mode=mmap_mode
+    ):
+        fold_model = clone(model).fit(X_train, y_train)
+        accuracies[fold] = accuracy_score(y_val, fold_model.predict(X_val))
+
+    metrics = {f"cv_val_acc_fold{fold}": acc for fold, acc in accuracies.items()}
+    metrics["cv_val_acc"] = float(np.mean(list(accuracies.values())))
+    metrics["cv_val_acc_std"] = float(np.std(list(accuracies.values())))
+    return metrics
+
+
 def train_classifiers(
     mlflow: Union[ModuleType, MagicMock],
     config: Union[ConfigParser, dict],
@@ -51,13 +96,16 @@ def train_classifiers(
 ) -> None:
     """
     Trains a number of classifiers on the data that is found in the directory specified as dir_processed in config.
+    Each fitted classifier is pickled to the artifacts directory (see get_classifier_filename).
 
     Arguments:
         mlflow {Union[ModuleType, MagicMock]} --  MLflow module or its mock replacement
         config {Union[ConfigParser, dict]} -- configuration for the training, with the required sections:
             - "training": containing "random_seed";
-            - "paths": containing "artifacts_temp" and "dir_processed";
+            - "paths": containing "artifacts_temp" and "dir_processed" (and optionally "mmap_mode");
             - "mlflow": containing "mlflow_experiment"
+            - "preparation" (optional): containing "n_folds", to also cross-validate each classifier on the
+                folds stored with the processed data
         mlflow_url {str} -- MLflow URL (empty if replacing mlflow with a mock)
         mlflow_tags {dict} -- MLflow tags (empty if replacing mlflow with a mock)
     """
@@ -65,10 +113,14 @@ def train_classifiers(
     random_seed = int(config["training"]["random_seed"])
     workspace_dir = Path(config["paths"]["workspace_dir"])
     dir_processed = config["paths"]["dir_processed"]
+    mmap_mode = config["paths"].get("mmap_mode") or None
     dir_artifacts = Path(config["paths"]["artifacts_temp"])
     full_dir_artifacts = workspace_dir / dir_artifacts
     filepath_conf_matrix = full_dir_artifacts / "confusion_matrix.png"
     mlflow_experiment = config["mlflow"]["mlflow_experiment"]
+    n_folds = (
+        int(config["preparation"].get("n_folds") or 0) if "preparation" in config else 0
+    )
 
     # Prepare before run
     np.random.seed(random_seed)
@@ -79,8 +131,11 @@ def train_classifiers(
     with mlflow.start_run(run_name="sklearn_example_train", tags=mlflow_tags):
 
         # Load training and validation data
-        X_train, X_val, _, y_train, y_val, _ = load_data_splits(
-            dir_processed=dir_processed, as_type="array"
+        X_train, X_val, y_train, y_val = load_data_splits(
+            dir_processed=dir_processed,
+            as_type="array",
+            mmap_mode=mmap_mode,
+            splits=("X_train", "X_val", "y_train", "y_val"),
         )
 
         # Define a number of classifiers
@@ -91,6 +146,13 @@ def train_classifiers(
 
             with mlflow.start_run(run_name=model_name, nested=True, tags=mlflow_tags):
 
+                if n_folds:
+                    mlflow.log_metrics(
+                        cross_validate_classifier(
+                            model, dir_processed, n_folds, mmap_mode=mmap_mode
+                        )
+                    )
+
                 model.fit(X_train, y_train)
                 y_pred = model.predict(X_val)
                 val_accuracy = accuracy_score(y_pred, y_val)
@@ -102,6 +164,17 @@ def train_classifiers(
                     savepath=filepath_conf_matrix,
                 )
 
+                # Save the fitted classifier, e.g. to be served (see train_dnn_pytorch/serving.py)
+                with open(
+                    full_dir_artifacts / get_classifier_filename(model_name), "wb"
+                ) as file:
+                    pickle.dump(model, file)
+
                 mlflow.log_artifacts(full_dir_artifacts)
-                mlflow.log_params({"classifier": model_name})
+                mlflow.log_params(
+                    {
+                        "classifier": model_name,
+                        "dataset_version": get_dataset_version(dir_processed),
+                    }
+                )
                 mlflow.log_metrics({"val_acc": val_accuracy})
@@ -7,8 +7,15 @@ import os
 from pathlib import Path
 
 import pytest
+from sklearn.linear_model import LogisticRegression
 
-from lab.processes.train_standard_classifiers.classifiers import train_classifiers
+from lab.processes.prepare_data.cancer_data import prepare_cancer_data
+from lab.processes.prepare_data.cross_validation import add_cv_folds
+from lab.processes.train_standard_classifiers.classifiers import (
+    cross_validate_classifier,
+    get_classifier_filename,
+    train_classifiers,
+)
 from lib.testing import get_mlflow_stub
 
 vscode_config = configparser.ConfigParser()
@@ -40,9 +47,33 @@ def test_train_classifiers_runs_without_errors(temp_data_dir):
     dir_artifacts = vscode_config["paths"]["artifacts_temp"]
     filename_conf_matrix = vscode_config["filenames"]["fname_conf_mat"]
     assert filename_conf_matrix in os.listdir(dir_artifacts)
+    assert get_classifier_filename("Logistic regression") in os.listdir(dir_artifacts)
 
     # Check that mlflow has been called to log artifacts, metrics, and params
     mlflow_stub.start_run.assert_called()
     mlflow_stub.log_artifacts.assert_called_with(Path(dir_artifacts))
     mlflow_stub.log_params.assert_called()
     mlflow_stub.log_metrics.assert_called()
+
+
+@pytest.mark.integration
+def test_cross_validate_classifier_reports_accuracy_per_fold(tmp_path):
+    """
+    Runs cross_validate_classifier on cross-validation folds stored with data in the indexed format.
+    Verifies that the accuracy of each fold and their mean and standard deviation are reported.
+    """
+    prepare_cancer_data(dir_output=str(tmp_path), output_format="indexed")
+    add_cv_folds(tmp_path, n_folds=3)
+
+    metrics = cross_validate_classifier(
+        LogisticRegression(), dir_processed=str(tmp_path), n_folds=3
+    )
+
+    assert set(metrics) == {
+        "cv_val_acc",
+        "cv_val_acc_std",
+        "cv_val_acc_fold0",
+        "cv_val_acc_fold1",
+        "cv_val_acc_fold2",
+    }
+    assert 0.5 < metrics["cv_val_acc"] <= 1.0
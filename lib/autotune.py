@@ -0,0 +1,257 @@
+"""
+Automatic tuning of the batch size, number of dataloader workers and torch threads of a training loop, by
+timing a few training iterations with each candidate setting
+"""
+
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+import torch
+import torch.nn as nn
+
+from lib.pytorch import create_dataloader, create_tensor_loader, train_loop
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+N_WARMUP_BATCHES = 2
+
+
+def get_rss(pid: Optional[int] = None) -> int:
+    """
+    Returns the current resident memory (RSS) of a process in bytes, read from /proc (Linux only)
+
+    Args:
+        pid: (int or None) process id, by default the current process
+    """
+    with open(f"/proc/{pid or 'self'}/statm", encoding="utf-8") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+class PeakMemoryMonitor:
+    """
+    Context manager sampling, in a background thread, the resident memory of the current process and of
+    its child processes (e.g. DataLoader workers), and recording the peak of their total above the
+    memory of the current process on entry.
+
+    Args:
+        interval: (float) seconds between samples
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._baseline = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _get_total_rss(self) -> int:
+        total = get_rss()
+        for child in multiprocessing.active_children():
+            try:
+                total += get_rss(child.pid)
+            except (FileNotFoundError, ProcessLookupError):
+                # The child exited between listing and reading
+                pass
+        return total
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak_bytes = max(
+                self.peak_bytes, self._get_total_rss() - self._baseline
+            )
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakMemoryMonitor":
+        self._baseline = get_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._get_total_rss() - self._baseline)
+
+
+def autotune_training(
+    X: torch.Tensor,
+    y: torch.Tensor,
+    create_model: Callable[[], nn.Module],
+    loss_fn: nn.Module,
+    create_optimizer: Callable[[Iterable[nn.Parameter]], torch.optim.Optimizer],
+    batch_sizes: Sequence[int],
+    n_workers_options: Sequence[int] = (0,),
+    n_threads_options: Optional[Sequence[int]] = None,
+    in_memory: bool = False,
+    n_batches: int = 20,
+    max_memory_bytes: Optional[int] = None,
+    precision: str = "float32",
+) -> dict:
+    """
+    Times a short run of train_loop (n_batches shuffled batches of the training data, after a warmup of
+    two batches drawn from the same loader, so that the startup of the dataloader workers is not timed)
+    for each combination of the candidate settings, and returns the fastest one (by training
+    samples per second) whose peak memory stays within max_memory_bytes. The peak memory is sampled from
+    the resident memory of the process and its dataloader workers (see PeakMemoryMonitor), so it includes
+    the workers' own interpreters and copies of the batches.
+
+    Each trial trains a fresh model, so the tuning does not change the model trained afterwards (but it
+    draws from the global random generator). The torch thread count is restored after the trials; apply
+    the chosen one with torch.set_num_threads. Batch sizes larger than the training data are skipped.
+
+    Args:
+        X: (torch Tensor) training features
+        y: (torch Tensor) training labels
+        create_model: (callable) returns a freshly initialized model
+        loss_fn: (nn.Module) loss function
+        create_optimizer: (callable) returns an optimizer for the parameters of a model
+        batch_sizes: (sequence of int) candidate batch sizes
+        n_workers_options: (sequence of int) candidate numbers of DataLoader workers (ignored with in_memory,
+            which has no workers)
+        n_threads_options: (sequence of int or None) candidate torch intra-op thread counts, by default the
+            CPU count divided by the number of processes (main process and workers), to not oversubscribe
+            the cores
+        in_memory: (bool) time TensorBatchLoaders instead of DataLoaders (see lib.pytorch.TensorBatchLoader)
+        n_batches: (int) number of batches timed per trial
+        max_memory_bytes: (int or None) memory cap of a trial, or None for no cap
+        precision: (str) precision of the forward passes (see train_loop)
+
+    Returns:
+        (dict) with the chosen setting ('best': batch_size, n_workers, n_threads, samples_per_s and
+            memory_bytes) and the results of all trials ('trials')
+    """
+    cpu_count = os.cpu_count() or 1
+    n_threads_default = torch.get_num_threads()
+    n_workers_options = [0] if in_memory else n_workers_options
+    batch_sizes = [batch_size for batch_size in batch_sizes if batch_size <= len(X)]
+    trials = []
+
+    try:
+        for batch_size, n_workers in itertools.product(batch_sizes, n_workers_options):
+            for n_threads in n_threads_options or [
+                max(1, cpu_count // (n_workers + 1))
+            ]:
+                trials.append(
+                    _run_trial(
+                        X,
+                        y,
+                        create_model,
+                        loss_fn,
+                        create_optimizer,
+                        batch_size=batch_size,
+                        n_workers=n_workers,
+                        n_threads=n_threads,
+                        in_memory=in_memory,
+                        n_batches=n_batches,
+                        precision=precision,
+                    )
+                )
+    finally:
+        torch.set_num_threads(n_threads_default)
+
+    if not trials:
+        raise ValueError(f"No candidate batch size fits the {len(X)} training samples")
+    allowed = [
+        trial
+        for trial in trials
+        if max_memory_bytes is None or trial["memory_bytes"] <= max_memory_bytes
+    ]
+    if not allowed:
+        raise ValueError(
+            f"No candidate setting stays within the memory cap of {max_memory_bytes} bytes "
+            f"(the smallest peak was {min(trial['memory_bytes'] for trial in trials)} bytes)"
+        )
+    return dict(
+        best=max(allowed, key=lambda trial: trial["samples_per_s"]), trials=trials
+    )
+
+
+class _BatchWindow:
+    """
+    The next n_batches full batches of an iterator over a loader, iterated once as a loader (e.g. by
+    train_loop), so that consecutive windows share the loader's iterator and its dataloader workers
+    """
+
+    def __init__(self, batches: Iterator, n_batches: int, batch_size: int):
+        self._batches = batches
+        self._n_batches = n_batches
+        self.dataset = range(n_batches * batch_size)
+
+    def __len__(self) -> int:
+        return self._n_batches
+
+    def __iter__(self) -> Iterator:
+        return itertools.islice(self._batches, self._n_batches)
+
+
+def _run_trial(
+    X: torch.Tensor,
+    y: torch.Tensor,
+    create_model: Callable[[], nn.Module],
+    loss_fn: nn.Module,
+    create_optimizer: Callable[[Iterable[nn.Parameter]], torch.optim.Optimizer],
+    batch_size: int,
+    n_workers: int,
+    n_threads: int,
+    in_memory: bool,
+    n_batches: int,
+    precision: str,
+) -> dict:
+    """
+    Times train_loop over n_batches batches with one setting, after warmup batches drawn from the same
+    loader iterator, so that only steady-state batches are timed (see autotune_training)
+    """
+    torch.set_num_threads(n_threads)
+    create_loader = create_tensor_loader if in_memory else create_dataloader
+    model = create_model()
+    optimizer = create_optimizer(model.parameters())
+
+    # At least one timed batch, when the data holds fewer batches than the warmup and the timed ones
+    n_full_batches = len(X) // batch_size
+    n_warmup = min(N_WARMUP_BATCHES, n_full_batches - 1)
+    n_timed = min(n_full_batches - n_warmup, n_batches)
+    n_rows = (n_warmup + n_timed) * batch_size
+    loader = create_loader(
+        X[:n_rows],
+        y[:n_rows],
+        # Full batches only, as batch norm layers cannot train on a batch of one sample
+        dict(
+            batch_size=batch_size,
+            num_workers=n_workers,
+            shuffle=True,
+            drop_last=True,
+        ),
+    )
+
+    with PeakMemoryMonitor() as monitor:
+        # Starts the dataloader workers, if any
+        batches = iter(loader)
+        if n_warmup:
+            train_loop(
+                _BatchWindow(batches, n_warmup, batch_size),
+                model,
+                loss_fn,
+                optimizer,
+                precision=precision,
+            )
+
+        start = time.perf_counter()
+        train_loop(
+            _BatchWindow(batches, n_timed, batch_size),
+            model,
+            loss_fn,
+            optimizer,
+            precision=precision,
+        )
+        elapsed = time.perf_counter() - start
+        del batches
+
+    return dict(
+        batch_size=batch_size,
+        n_workers=n_workers,
+        n_threads=n_threads,
+        samples_per_s=n_timed * batch_size / elapsed,
+        memory_bytes=monitor.peak_bytes,
+    )
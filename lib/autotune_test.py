@@ -0,0 +1,152 @@
+"""
+Unit tests for the functions in lib/autotune.py
+"""
+
+import pytest
+import torch
+import torch.nn as nn
+
+import lib.autotune
+from lib.autotune import PeakMemoryMonitor, autotune_training
+from lib.pytorch import create_tensor_loader
+
+
+def create_model() -> nn.Module:
+    """
+    Returns a small classifier with a batch norm layer
+    """
+    return nn.Sequential(
+        nn.Linear(4, 8), nn.BatchNorm1d(8), nn.Linear(8, 1), nn.Sigmoid()
+    )
+
+
+@pytest.fixture(name="training_data")
+def small_training_data():
+    """
+    Pytest fixture that yields 100 samples of 4 features and binary labels
+    """
+    torch.manual_seed(0)
+    X = torch.randn(100, 4)
+    yield X, (X[:, 0] > 0).to(torch.uint8)
+
+
+def run_autotune(training_data, **kwargs) -> dict:
+    """
+    Runs autotune_training on the training data with the small classifier and SGD
+    """
+    X, y = training_data
+    return autotune_training(
+        X,
+        y,
+        create_model=create_model,
+        loss_fn=nn.BCELoss(),
+        create_optimizer=lambda parameters: torch.optim.SGD(parameters, lr=0.1),
+        n_batches=3,
+        **kwargs,
+    )
+
+
+@pytest.mark.unittest
+class TestAutotuneTraining:
+    """
+    Tests for choosing training settings with autotune_training
+    """
+
+    def test_fastest_setting_is_chosen_among_all_combinations(self, training_data):
+        """
+        Test that every combination of candidates is timed (skipping batch sizes larger than the data),
+        that the fastest one is chosen and that the thread count is restored
+        """
+        n_threads = torch.get_num_threads()
+
+        results = run_autotune(
+            training_data,
+            batch_sizes=[8, 16, 200],
+            n_threads_options=[1, 2],
+            in_memory=True,
+        )
+
+        settings = [
+            (trial["batch_size"], trial["n_threads"]) for trial in results["trials"]
+        ]
+        assert settings == [(8, 1), (8, 2), (16, 1), (16, 2)]
+        assert results["best"] == max(
+            results["trials"], key=lambda trial: trial["samples_per_s"]
+        )
+        assert torch.get_num_threads() == n_threads
+
+    def test_memory_cap_counts_the_dataloader_workers(self, training_data):
+        """
+        Test that the peak memory of a DataLoader setting includes its worker, and that a memory cap below
+        it leads to the setting without workers
+        """
+        results = run_autotune(
+            training_data, batch_sizes=[16], n_workers_options=[0, 1]
+        )
+        memory = {
+            trial["n_workers"]: trial["memory_bytes"] for trial in results["trials"]
+        }
+        assert memory[1] > memory[0]
+
+        results = run_autotune(
+            training_data,
+            batch_sizes=[16],
+            n_workers_options=[0, 1],
+            max_memory_bytes=(memory[0] + memory[1]) // 2,
+        )
+        assert results["best"]["n_workers"] == 0
+
+    def test_warmup_and_timed_batches_share_one_loader_iterator(
+        self, training_data, monkeypatch
+    ):
+        """
+        Test that each trial iterates a single loader once, for the warmup and the timed batches, so that
+        the startup of dataloader workers happens before the timed batches
+        """
+        iterations = []
+
+        class CountingLoader:
+            def __init__(self, loader):
+                self.loader = loader
+                self.dataset = loader.dataset
+
+            def __len__(self):
+                return len(self.loader)
+
+            def __iter__(self):
+                iterations.append(0)
+                for batch in self.loader:
+                    iterations[-1] += 1
+                    yield batch
+
+        monkeypatch.setattr(
+            lib.autotune,
+            "create_tensor_loader",
+            lambda *args: CountingLoader(create_tensor_loader(*args)),
+        )
+
+        run_autotune(training_data, batch_sizes=[16, 32], in_memory=True)
+
+        # Two warmup batches and the three timed ones (n_batches), or all batches of the data
+        assert iterations == [5, 3]
+
+    def test_no_setting_within_the_memory_cap_is_rejected(self, training_data):
+        """
+        Test that a ValueError is raised if no setting stays within the memory cap
+        """
+        with pytest.raises(ValueError, match="memory cap"):
+            run_autotune(
+                training_data, batch_sizes=[16], in_memory=True, max_memory_bytes=-1
+            )
+
+
+@pytest.mark.unittest
+def test_peak_memory_monitor_records_allocations():
+    """
+    Test that the monitor records the memory of an allocation made within it
+    """
+    with PeakMemoryMonitor() as monitor:
+        data = torch.ones(16 * 2**20, dtype=torch.uint8)
+
+    assert monitor.peak_bytes >= 8 * 2**20
+    del data
@@ -0,0 +1,405 @@
+"""
+Training throughput benchmarks of train_loop, val_loop and train_and_validate (lib/pytorch.py) on synthetic
+data with a fixed seed, across data loaders (TensorBatchLoader or DataLoader), batch sizes, dataloader
+worker counts, dataset sizes and model widths, with a comparison against a stored baseline to flag
+regressions. E.g. from the repository root:
+
+    python -m lib.benchmark --baseline benchmark_baseline.json --save-baseline  # record the baseline
+    python -m lib.benchmark --baseline benchmark_baseline.json  # compare, exit status 1 on regressions
+
+The baseline is specific to the machine (and torch version) it was recorded on: record it on the machine
+the comparisons run on, e.g. the runner of the nightly trainings.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Callable, Sequence, Tuple, Union
+
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.profiler import ProfilerActivity, profile
+
+from lib.autotune import PeakMemoryMonitor
+from lib.pytorch import (
+    create_dataloader,
+    create_tensor_loader,
+    train_and_validate,
+    train_loop,
+    val_loop,
+)
+
+N_FEATURES = 30
+BENCHMARK_KEYS = ("benchmark", "loader", "batch_size", "n_workers", "n_rows", "width")
+# Batches taken from the tensors in memory (in_memory_loader = true in config.ini, the default of the
+# training steps) or from a DataLoader with worker processes
+LOADERS = dict(tensor=create_tensor_loader, dataloader=create_dataloader)
+TRAIN_LOOP_PHASES = ("data_loading", "forward", "backward", "optimizer_step")
+
+
+def create_synthetic_data(
+    n_rows: int, n_features: int = N_FEATURES, seed: int = 0
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Returns normally distributed features and binary labels given by a random linear rule, always the same
+    for a seed
+    """
+    generator = torch.Generator().manual_seed(seed)
+    X = torch.randn(n_rows, n_features, generator=generator)
+    weights = torch.randn(n_features, generator=generator)
+    return X, (X @ weights > 0).to(torch.uint8)
+
+
+def create_benchmark_model(width: int, n_features: int = N_FEATURES) -> nn.Module:
+    """
+    Returns a fully connected binary classifier with three hidden layers of width, width // 2 and width // 2
+    units (each with batch norm), the architecture of DenseNN (lab/processes/train_dnn_pytorch/densenet.py)
+    with width 200
+    """
+    return nn.Sequential(
+        nn.Linear(n_features, width),
+        nn.BatchNorm1d(width),
+        nn.ReLU(),
+        nn.Linear(width, width // 2),
+        nn.BatchNorm1d(width // 2),
+        nn.ReLU(),
+        nn.Linear(width // 2, width // 2),
+        nn.BatchNorm1d(width // 2),
+        nn.ReLU(),
+        nn.Linear(width // 2, 1),
+        nn.Sigmoid(),
+    )
+
+
+def _measure(fn: Callable, repeats: int = 1) -> tuple:
+    """
+    Runs fn repeats times, returning its shortest wall time in seconds (the least disturbed by other load on
+    the machine), the peak resident memory of the process and its dataloader workers above the memory before
+    the calls (see lib.autotune.PeakMemoryMonitor) in MB, and the result of the last call
+    """
+    elapsed = float("inf")
+    with PeakMemoryMonitor() as monitor:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, monitor.peak_bytes / 2**20, result
+
+
+def get_phase_breakdown(
+    dataloader, model: nn.Module, loss_fn: nn.Module, optimizer: torch.optim.Optimizer
+) -> dict:
+    """
+    Profiles an epoch of train_loop and returns the share of its labelled phases (see TRAIN_LOOP_PHASES) in
+    their total CPU time, in percent (e.g. 'forward_pct'). As the profiler slows the loop down, the epoch is
+    not used for the throughput.
+    """
+    with profile(activities=[ProfilerActivity.CPU]) as profiler:
+        train_loop(dataloader, model, loss_fn, optimizer, profiler=profiler)
+
+    phase_times = {
+        event.key: event.cpu_time_total
+        for event in profiler.key_averages()
+        if event.key in TRAIN_LOOP_PHASES
+    }
+    total_time = sum(phase_times.values()) or 1.0
+    return {
+        f"{phase}_pct": 100 * phase_times.get(phase, 0.0) / total_time
+        for phase in TRAIN_LOOP_PHASES
+    }
+
+
+def benchmark_case(
+    X: torch.Tensor,
+    y: torch.Tensor,
+    batch_size: int,
+    n_workers: int,
+    width: int,
+    loader: str = "tensor",
+    epochs: int = 2,
+    repeats: int = 3,
+    seed: int = 0,
+) -> list:
+    """
+    Benchmarks train_loop, val_loop and train_and_validate with one setting. The training loop is timed by
+    its fastest of repeats epochs after a warmup epoch, its phase breakdown profiled in another epoch (see
+    get_phase_breakdown), the validation loop timed likewise over the same data, and train_and_validate run
+    for epochs epochs (reporting the mean epoch time and training throughput of its history).
+
+    Args:
+        X: (torch Tensor) features, e.g. from create_synthetic_data
+        y: (torch Tensor) binary labels
+        batch_size: (int) batch size of the dataloaders
+        n_workers: (int) number of workers of the dataloaders (not used by the tensor loader)
+        width: (int) width of the model (see create_benchmark_model)
+        loader: (str) data loader, tensor (TensorBatchLoader) or dataloader (DataLoader), see LOADERS
+        epochs: (int) number of epochs of train_and_validate
+        repeats: (int) number of timed epochs of train_loop and val_loop
+        seed: (int) seed of the model initialization and of the shuffling of the data
+
+    Returns:
+        (list of dict) a result per benchmark: its setting (see BENCHMARK_KEYS), the throughput in samples per
+            second, the epoch wall time, the peak memory in MB, and the phase breakdown of train_loop
+    """
+    torch.manual_seed(seed)
+    model = create_benchmark_model(width, X.shape[1])
+    loss_fn = nn.BCELoss()
+    optimizer = torch.optim.Adam(model.parameters())
+    create_loader = LOADERS[loader]
+    # Full batches only, as batch norm layers cannot train on a batch of one sample
+    train_loader = create_loader(
+        X,
+        y,
+        dict(
+            batch_size=batch_size, num_workers=n_workers, shuffle=True, drop_last=True
+        ),
+    )
+    val_loader = create_loader(X, y, dict(batch_size=batch_size, num_workers=n_workers))
+    setting = dict(
+        loader=loader,
+        batch_size=batch_size,
+        n_workers=n_workers,
+        n_rows=len(X),
+        width=width,
+    )
+    results = []
+
+    train_loop(train_loader, model, loss_fn, optimizer)
+    elapsed, peak_rss_mb, _ = _measure(
+        lambda: train_loop(train_loader, model, loss_fn, optimizer), repeats
+    )
+    results.append(
+        dict(
+            benchmark="train_loop",
+            **setting,
+            samples_per_s=len(X) / elapsed,
+            epoch_time_s=elapsed,
+            peak_rss_mb=peak_rss_mb,
+            **get_phase_breakdown(train_loader, model, loss_fn, optimizer),
+        )
+    )
+
+    elapsed, peak_rss_mb, _ = _measure(
+        lambda: val_loop(val_loader, model, loss_fn), repeats
+    )
+    results.append(
+        dict(
+            benchmark="val_loop",
+            **setting,
+            samples_per_s=len(X) / elapsed,
+            epoch_time_s=elapsed,
+            peak_rss_mb=peak_rss_mb,
+        )
+    )
+
+    _, peak_rss_mb, (_, df_history, _) = _measure(
+        lambda: train_and_validate(
+            model, loss_fn, optimizer, train_loader, val_loader, epochs=epochs
+        )
+    )
+    results.append(
+        dict(
+            benchmark="train_and_validate",
+            **setting,
+            samples_per_s=df_history["samples_per_s"].mean(),
+            epoch_time_s=df_history["epoch_time_s"].mean(),
+            peak_rss_mb=peak_rss_mb,
+        )
+    )
+    return results
+
+
+def run_benchmarks(
+    batch_sizes: Sequence[int] = (32, 256),
+    n_workers_options: Sequence[int] = (0, 2),
+    n_rows_options: Sequence[int] = (10_000, 100_000),
+    widths: Sequence[int] = (64, 200, 512),
+    loaders: Sequence[str] = tuple(LOADERS),
+    epochs: int = 2,
+    repeats: int = 3,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Runs benchmark_case for every combination of the settings, on synthetic data (see create_synthetic_data)
+    generated with the seed. The tensor loader has no workers, so it is only run with n_workers 0.
+
+    Args:
+        batch_sizes: (sequence of int) batch sizes
+        n_workers_options: (sequence of int) numbers of dataloader workers
+        n_rows_options: (sequence of int) numbers of rows of the synthetic datasets
+        widths: (sequence of int) widths of the model
+        loaders: (sequence of str) data loaders (see LOADERS)
+        epochs: (int) number of epochs of train_and_validate
+        repeats: (int) number of timed epochs of train_loop and val_loop (see benchmark_case)
+        seed: (int) seed of the data, model initialization and shuffling
+
+    Returns:
+        (pandas DataFrame) the results of the benchmarks, a row per benchmark and setting
+    """
+    results = []
+    for n_rows in n_rows_options:
+        X, y = create_synthetic_data(n_rows, seed=seed)
+        for loader, batch_size, width in itertools.product(
+            loaders, batch_sizes, widths
+        ):
+            for n_workers in n_workers_options if loader == "dataloader" else [0]:
+                print(
+                    f"Benchmarking loader={loader}, batch_size={batch_size}, "
+                    f"n_workers={n_workers}, n_rows={n_rows}, width={width}"
+                )
+                results.extend(
+                    benchmark_case(
+                        X,
+                        y,
+                        batch_size,
+                        n_workers,
+                        width,
+                        loader,
+                        epochs,
+                        repeats,
+                        seed,
+                    )
+                )
+    return pd.DataFrame(results)
+
+
+def get_environment() -> dict:
+    """
+    Returns the versions and CPU count that the benchmark results depend on, stored with a baseline
+    """
+    return dict(
+        python=platform.python_version(),
+        torch=torch.__version__,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        torch_threads=torch.get_num_threads(),
+    )
+
+
+def save_baseline(df_results: pd.DataFrame, filepath: Union[str, Path]) -> None:
+    """
+    Saves benchmark results (see run_benchmarks) as a baseline JSON file, with the environment they were
+    measured in (see get_environment)
+    """
+    Path(filepath).write_text(
+        json.dumps(
+            dict(environment=get_environment(), results=df_results.to_dict("records")),
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+
+def compare_to_baseline(
+    df_results: pd.DataFrame,
+    filepath_baseline: Union[str, Path],
+    tolerance: float = 0.1,
+) -> pd.DataFrame:
+    """
+    Compares benchmark results with a baseline saved by save_baseline, matching the benchmarks by setting
+    (see BENCHMARK_KEYS). A benchmark regressed if its throughput fell by more than the tolerance. Warns if
+    the baseline was measured in another environment, where the comparison is not meaningful.
+
+    Args:
+        df_results: (pandas DataFrame) benchmark results, as returned by run_benchmarks
+        filepath_baseline: (str or Path) location of the baseline JSON file
+        tolerance: (float) relative fall in throughput (samples per second) flagged as a regression
+
+    Returns:
+        (pandas DataFrame) the results with the baseline throughput and peak memory (NaN for settings not in
+            the baseline), the speedup (throughput relative to the baseline) and a 'regression' flag
+    """
+    baseline = json.loads(Path(filepath_baseline).read_text(encoding="utf-8"))
+    environment = get_environment()
+    differences = [
+        key
+        for key, value in baseline["environment"].items()
+        if environment.get(key) != value
+    ]
+    if differences:
+        warnings.warn(
+            f"The baseline was measured in another environment ({', '.join(differences)} differ), so the "
+            "comparison may flag changes of the environment rather than of the code"
+        )
+
+    df_baseline = pd.DataFrame(baseline["results"])[
+        list(BENCHMARK_KEYS) + ["samples_per_s", "peak_rss_mb"]
+    ]
+    df_comparison = df_results.merge(
+        df_baseline, on=list(BENCHMARK_KEYS), how="left", suffixes=("", "_baseline")
+    )
+    df_comparison["speedup"] = (
+        df_comparison["samples_per_s"] / df_comparison["samples_per_s_baseline"]
+    )
+    df_comparison["regression"] = df_comparison["speedup"] < 1 - tolerance
+    return df_comparison
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments of the benchmarks
+    """
+
+    def int_list(value: str) -> list:
+        return [int(item) for item in value.split(",")]
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--baseline", help="baseline JSON file to compare with")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the results as the baseline instead of comparing with it",
+    )
+    parser.add_argument("--output", help="CSV file of the results")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--batch-sizes", type=int_list, default=[32, 256])
+    parser.add_argument("--n-workers", type=int_list, default=[0, 2])
+    parser.add_argument("--n-rows", type=int_list, default=[10_000, 100_000])
+    parser.add_argument("--widths", type=int_list, default=[64, 200, 512])
+    parser.add_argument(
+        "--loaders", type=lambda value: value.split(","), default=list(LOADERS)
+    )
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+
+    arguments = parse_args()
+    df_benchmarks = run_benchmarks(
+        batch_sizes=arguments.batch_sizes,
+        n_workers_options=arguments.n_workers,
+        n_rows_options=arguments.n_rows,
+        widths=arguments.widths,
+        loaders=arguments.loaders,
+        epochs=arguments.epochs,
+        repeats=arguments.repeats,
+        seed=arguments.seed,
+    )
+    n_regressions = 0
+    if arguments.baseline and arguments.save_baseline:
+        save_baseline(df_benchmarks, arguments.baseline)
+    elif arguments.baseline:
+        df_benchmarks = compare_to_baseline(
+            df_benchmarks, arguments.baseline, arguments.tolerance
+        )
+        n_regressions = int(df_benchmarks["regression"].sum())
+    if arguments.output:
+        df_benchmarks.to_csv(arguments.output, index=False)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(df_benchmarks.round(2).to_string(index=False))
+    if n_regressions:
+        print(
+            f"{n_regressions} benchmarks regressed by more than {arguments.tolerance:.0%}"
+        )
+    sys.exit(1 if n_regressions else 0)
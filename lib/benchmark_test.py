@@ -0,0 +1,88 @@
+"""
+Unit tests for the functions in lib/benchmark.py
+"""
+
+import pytest
+
+from lib.benchmark import (
+    BENCHMARK_KEYS,
+    TRAIN_LOOP_PHASES,
+    compare_to_baseline,
+    create_synthetic_data,
+    run_benchmarks,
+    save_baseline,
+)
+
+
+@pytest.fixture(name="benchmark_results", scope="module")
+def small_benchmark_results():
+    """
+    Pytest fixture that yields the results of benchmarks of both data loaders on a small dataset
+    """
+    yield run_benchmarks(
+        batch_sizes=[50],
+        n_workers_options=[0],
+        n_rows_options=[500],
+        widths=[16],
+        loaders=["tensor", "dataloader"],
+        epochs=1,
+    )
+
+
+@pytest.mark.unittest
+def test_synthetic_data_is_fixed_by_the_seed():
+    """
+    Test that the synthetic data is the same for a seed, and has both labels
+    """
+    X, y = create_synthetic_data(100, seed=1)
+    X_again, y_again = create_synthetic_data(100, seed=1)
+
+    assert X.shape == (100, 30)
+    assert X.equal(X_again) and y.equal(y_again)
+    assert 0 < y.float().mean() < 1
+
+
+@pytest.mark.unittest
+def test_run_benchmarks_reports_each_benchmark_and_setting(benchmark_results):
+    """
+    Test that every benchmark is run for every setting (each data loader), with its throughput, epoch time,
+    memory and (for the training loop) a phase breakdown summing to 100%
+    """
+    assert len(benchmark_results) == 6
+    assert set(benchmark_results["benchmark"]) == {
+        "train_loop",
+        "val_loop",
+        "train_and_validate",
+    }
+    assert set(benchmark_results["loader"]) == {"tensor", "dataloader"}
+    assert (benchmark_results["samples_per_s"] > 0).all()
+    assert (benchmark_results["epoch_time_s"] > 0).all()
+    assert (benchmark_results["peak_rss_mb"] >= 0).all()
+    df_train_loop = benchmark_results[benchmark_results["benchmark"] == "train_loop"]
+    phase_shares = df_train_loop[[f"{phase}_pct" for phase in TRAIN_LOOP_PHASES]]
+    assert phase_shares.sum(axis=1).tolist() == pytest.approx([100, 100])
+    assert (phase_shares["forward_pct"] > 0).all()
+
+
+@pytest.mark.unittest
+def test_compare_to_baseline_flags_regressions(benchmark_results, tmp_path):
+    """
+    Test that benchmarks slower than the baseline by more than the tolerance are flagged, and that
+    settings missing from the baseline are not
+    """
+    df_baseline = benchmark_results.copy()
+    df_baseline.loc[0, "samples_per_s"] *= 2
+    df_baseline.loc[1, "samples_per_s"] *= 1.05
+    save_baseline(df_baseline.drop(index=5), tmp_path / "baseline.json")
+
+    df_comparison = compare_to_baseline(
+        benchmark_results, tmp_path / "baseline.json", tolerance=0.1
+    )
+
+    assert df_comparison[list(BENCHMARK_KEYS)].equals(
+        benchmark_results[list(BENCHMARK_KEYS)]
+    )
+    assert df_comparison["regression"].tolist() == [True] + [False] * 5
+    assert df_comparison.loc[0, "speedup"] == pytest.approx(0.5)
+    missing_from_baseline = df_comparison["samples_per_s_baseline"].isna()
+    assert missing_from_baseline.tolist() == [False] * 5 + [True]
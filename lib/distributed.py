@@ -0,0 +1,115 @@
+"""
+Reusable functions for data-parallel training in several local processes with torch.distributed (gloo
+backend, CPU only)
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, List
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing
+import torch.nn as nn
+
+
+def run_data_parallel(fn: Callable, n_processes: int, kwargs: dict = None) -> None:
+    """
+    Runs fn(**kwargs) in n_processes local processes joined in a gloo process group, and waits for all of
+    them to finish. The processes meet through a file in a temporary directory, so no network port has to
+    be reserved. The CPU threads are divided among the processes.
+
+    Within fn, the process can be identified with get_rank (0 for the main process) and get_world_size,
+    e.g. to shard the training data (see lib.pytorch.shard_loader) and to write outputs from the main process only.
+
+    Args:
+        fn: (callable) function run by every process; must be importable (defined at module level), as it
+            is run in freshly spawned processes
+        n_processes: (int) number of processes
+        kwargs: (dict or None) keyword arguments of fn; must be picklable
+    """
+    with tempfile.TemporaryDirectory() as dir_rendezvous:
+        init_method = (Path(dir_rendezvous) / "rendezvous").as_uri()
+        torch.multiprocessing.spawn(
+            _run_process,
+            args=(fn, n_processes, init_method, kwargs or {}),
+            nprocs=n_processes,
+            join=True,
+        )
+
+
+def _run_process(
+    rank: int, fn: Callable, n_processes: int, init_method: str, kwargs: dict
+) -> None:
+    """
+    Entry point of each process started by run_data_parallel
+    """
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_processes))
+    dist.init_process_group(
+        "gloo", init_method=init_method, rank=rank, world_size=n_processes
+    )
+    try:
+        fn(**kwargs)
+    finally:
+        dist.destroy_process_group()
+
+
+def is_distributed() -> bool:
+    """
+    Returns whether the current process is part of a process group
+    """
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    """
+    Returns the rank of the current process in its process group (0 if not distributed)
+    """
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    """
+    Returns the number of processes in the process group (1 if not distributed)
+    """
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """
+    Returns whether the current process is the main process (rank 0), which writes the outputs
+    """
+    return get_rank() == 0
+
+
+def all_reduce_sum(values: List[float]) -> List[float]:
+    """
+    Sums a list of numbers over all processes (returning the list unchanged if not distributed)
+    """
+    if not is_distributed():
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+def broadcast_from_main(values: List[float]) -> List[float]:
+    """
+    Returns the values of the main process in every process (the list unchanged if not distributed)
+    """
+    if not is_distributed():
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.broadcast(tensor, src=0)
+    return tensor.tolist()
+
+
+def broadcast_buffers(model: nn.Module) -> None:
+    """
+    Copies the buffers of the model (e.g. batch norm running statistics, which each process updates on
+    its own shard of the data) from the main process to all other processes
+    """
+    if is_distributed():
+        for buffer in model.buffers():
+            dist.broadcast(buffer, src=0)
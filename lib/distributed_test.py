@@ -0,0 +1,67 @@
+"""
+Tests for the data-parallel training functions in lib/distributed.py
+"""
+
+import pytest
+import torch
+import torch.nn as nn
+
+from lib.distributed import get_rank, get_world_size, run_data_parallel
+from lib.history import HistoryRecorder
+from lib.pytorch import (
+    HISTORY_COLUMNS,
+    create_tensor_loader,
+    shard_loader,
+    train_and_validate,
+)
+
+
+def train_small_model(dir_output: str) -> None:
+    """
+    Trains a small model with batch norm on a shard of a fixed dataset, saving the final weights of each
+    process and, from the main process, the best model and the training history
+    """
+    torch.manual_seed(0)
+    X = torch.randn(64, 4)
+    y = (X.sum(dim=1) > 0).to(torch.uint8)
+    loader = create_tensor_loader(X, y, dict(batch_size=8, shuffle=True))
+    model = nn.Sequential(
+        nn.Linear(4, 8), nn.BatchNorm1d(8), nn.Linear(8, 1), nn.Sigmoid()
+    )
+    # The processes start from different weights, which training must synchronize
+    torch.manual_seed(get_rank())
+    nn.init.normal_(model[0].weight)
+
+    train_and_validate(
+        model=model,
+        loss_fn=nn.BCELoss(),
+        optimizer=torch.optim.SGD(model.parameters(), lr=0.1),
+        train_loader=shard_loader(loader),
+        val_loader=loader,
+        epochs=3,
+        filepath_model=f"{dir_output}/model.pt",
+        history=HistoryRecorder(
+            HISTORY_COLUMNS,
+            filepath=f"{dir_output}/history.csv" if get_rank() == 0 else None,
+        ),
+    )
+    torch.save(
+        dict(world_size=get_world_size(), state=model.state_dict()),
+        f"{dir_output}/state_{get_rank()}.pt",
+    )
+
+
+@pytest.mark.integration
+def test_processes_train_the_same_model_on_their_shards(tmp_path):
+    """
+    Test that training in 2 processes leaves the same weights and batch norm statistics in both, and that
+    only the main process writes the model and history
+    """
+    run_data_parallel(train_small_model, 2, kwargs=dict(dir_output=str(tmp_path)))
+
+    states = [torch.load(tmp_path / f"state_{rank}.pt") for rank in range(2)]
+    assert [state["world_size"] for state in states] == [2, 2]
+    for name, tensor in states[0]["state"].items():
+        assert torch.equal(tensor, states[1]["state"][name]), name
+    assert (tmp_path / "model.pt").is_file()
+    assert len((tmp_path / "history.csv").read_text().splitlines()) == 4
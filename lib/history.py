@@ -0,0 +1,137 @@
+"""
+Recording of training history (metrics per epoch), written out as it is recorded
+"""
+
+import json
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+class HistoryRecorder:
+    """
+    Records the metrics of each epoch in preallocated columnar buffers (doubled in size when full, so that
+    recording an epoch takes constant time however long the run), and streams each recorded row to a file
+    and optionally to MLflow, so that the progress of a run can be followed while it trains.
+
+    Args:
+        columns: (sequence of str) names of the metrics recorded for each epoch, starting with 'epoch'
+        capacity: (int) number of epochs to preallocate the buffers for (e.g. the maximum number of epochs)
+        filepath: (str, Path or None) file to which each row is appended as it is recorded, as CSV or,
+            for a '.jsonl' suffix, as a JSON object per line; None to keep the history in memory only
+        mlflow: (module or None) mlflow module (or stub) to log each row to as metrics at the step of the
+            epoch, or None to not log to MLflow
+        mlflow_prefix: (str) prefix of the names of the metrics logged to MLflow, to tell them apart from
+            the final metrics of a run
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        capacity: int = 64,
+        filepath: Optional[Union[str, Path]] = None,
+        mlflow=None,
+        mlflow_prefix: str = "history_",
+    ):
+        self.columns = list(columns)
+        self.filepath = Path(filepath) if filepath is not None else None
+        self.mlflow = mlflow
+        self.mlflow_prefix = mlflow_prefix
+        self._buffers = {column: np.empty(max(capacity, 1)) for column in self.columns}
+        self._n_rows = 0
+
+        if self.filepath is not None:
+            self._write_rows(0, mode="w")
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def _is_jsonl(self) -> bool:
+        return self.filepath.suffix == ".jsonl"
+
+    def _write_rows(self, start: int, mode: str = "a") -> None:
+        """
+        Writes the rows from start onwards to the file (with the CSV header if the file is rewritten)
+        """
+        with open(self.filepath, mode, encoding="utf-8") as history_file:
+            if mode == "w" and not self._is_jsonl():
+                history_file.write(",".join(self.columns) + "\n")
+            for row in range(start, self._n_rows):
+                values = {
+                    column: self._buffers[column][row].item() for column in self.columns
+                }
+                if "epoch" in values:
+                    values["epoch"] = int(values["epoch"])
+                if self._is_jsonl():
+                    history_file.write(json.dumps(values) + "\n")
+                else:
+                    history_file.write(",".join(map(repr, values.values())) + "\n")
+
+    def record(self, **metrics: float) -> None:
+        """
+        Records the metrics of an epoch, appending them to the file and logging them to MLflow.
+
+        Args:
+            **metrics: (float) value of each of the columns, including the epoch number
+        """
+        if set(metrics) != set(self.columns):
+            raise ValueError(f"Please record a value for each of {self.columns}")
+
+        if self._n_rows == len(self._buffers[self.columns[0]]):
+            for column, buffer in self._buffers.items():
+                self._buffers[column] = np.resize(buffer, 2 * len(buffer))
+
+        for column, value in metrics.items():
+            self._buffers[column][self._n_rows] = value
+        self._n_rows += 1
+
+        if self.filepath is not None:
+            self._write_rows(self._n_rows - 1)
+        if self.mlflow is not None:
+            self.mlflow.log_metrics(
+                {
+                    f"{self.mlflow_prefix}{column}": float(value)
+                    for column, value in metrics.items()
+                    if column != "epoch"
+                },
+                step=int(metrics["epoch"]),
+            )
+
+    def to_dict(self) -> dict:
+        """
+        Returns the recorded history as lists of values per column (e.g. to store in a checkpoint)
+        """
+        return {
+            column: self._buffers[column][: self._n_rows].tolist()
+            for column in self.columns
+        }
+
+    def restore(self, history: dict) -> None:
+        """
+        Replaces the recorded history by a history returned by to_dict (e.g. when resuming training from a
+        checkpoint), rewriting the file. The rows are not logged to MLflow again.
+
+        Args:
+            history: (dict) lists of values per column, as returned by to_dict
+        """
+        n_rows = len(history[self.columns[0]])
+        capacity = max(n_rows, len(self._buffers[self.columns[0]]))
+        self._buffers = {
+            column: np.resize(np.asarray(history[column], dtype=float), capacity)
+            for column in self.columns
+        }
+        self._n_rows = n_rows
+
+        if self.filepath is not None:
+            self._write_rows(0, mode="w")
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the recorded history as a data frame with a row per epoch (with integer epoch numbers)
+        """
+        df_history = pd.DataFrame(self.to_dict(), columns=self.columns)
+        if "epoch" in df_history:
+            df_history["epoch"] = df_history["epoch"].astype(int)
+        return df_history
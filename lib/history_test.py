@@ -0,0 +1,89 @@
+"""
+Unit tests for the functions in lib/history.py
+"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from lib.history import HistoryRecorder
+from lib.testing import get_mlflow_stub
+
+
+@pytest.mark.unittest
+class TestHistoryRecorder:
+    """
+    Tests for recording training history with HistoryRecorder
+    """
+
+    def test_rows_are_recorded_beyond_the_preallocated_capacity(self):
+        """
+        Test that the recorded history holds every epoch, also after the buffers grow
+        """
+        history = HistoryRecorder(["epoch", "loss"], capacity=2)
+
+        for epoch in range(1, 6):
+            history.record(epoch=epoch, loss=1.0 / epoch)
+
+        df_history = history.to_dataframe()
+        assert len(history) == 5
+        assert df_history["epoch"].tolist() == [1, 2, 3, 4, 5]
+        assert df_history["loss"].tolist() == pytest.approx(
+            [1, 1 / 2, 1 / 3, 1 / 4, 1 / 5]
+        )
+
+    def test_each_row_is_written_as_it_is_recorded(self, tmp_path):
+        """
+        Test that the CSV and JSONL files hold the rows recorded so far after every epoch
+        """
+        filepath_csv = tmp_path / "history.csv"
+        filepath_jsonl = tmp_path / "history.jsonl"
+        history_csv = HistoryRecorder(["epoch", "loss"], filepath=filepath_csv)
+        history_jsonl = HistoryRecorder(["epoch", "loss"], filepath=filepath_jsonl)
+
+        for epoch in (1, 2):
+            history_csv.record(epoch=epoch, loss=0.5)
+            history_jsonl.record(epoch=epoch, loss=0.5)
+
+            pd.testing.assert_frame_equal(
+                pd.read_csv(filepath_csv), history_csv.to_dataframe()
+            )
+            lines = filepath_jsonl.read_text().splitlines()
+            assert [json.loads(line) for line in lines] == [
+                dict(epoch=recorded, loss=0.5) for recorded in range(1, epoch + 1)
+            ]
+
+    def test_rows_are_logged_to_mlflow_by_epoch(self):
+        """
+        Test that each recorded row is logged to MLflow as prefixed metrics at the step of its epoch
+        """
+        mlflow_stub = get_mlflow_stub()
+        history = HistoryRecorder(["epoch", "val_acc"], mlflow=mlflow_stub)
+
+        history.record(epoch=3, val_acc=0.9)
+
+        mlflow_stub.log_metrics.assert_called_once_with(
+            {"history_val_acc": 0.9}, step=3
+        )
+
+    def test_restored_history_is_continued(self, tmp_path):
+        """
+        Test that a history restored from to_dict is continued from its last row, rewriting the file
+        """
+        history = HistoryRecorder(["epoch", "loss"])
+        history.record(epoch=1, loss=0.7)
+        filepath = tmp_path / "history.csv"
+
+        resumed = HistoryRecorder(["epoch", "loss"], filepath=filepath)
+        resumed.restore(history.to_dict())
+        resumed.record(epoch=2, loss=0.6)
+
+        assert pd.read_csv(filepath)["epoch"].tolist() == [1, 2]
+
+    def test_incomplete_rows_are_rejected(self):
+        """
+        Test that every column must be given a value when recording an epoch
+        """
+        with pytest.raises(ValueError):
+            HistoryRecorder(["epoch", "loss"]).record(epoch=1)
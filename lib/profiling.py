@@ -0,0 +1,71 @@
+"""
+Reusable functions for profiling a window of training steps with torch.profiler
+"""
+
+from pathlib import Path
+from typing import Union
+
+import torch.profiler
+
+TRAINING_PHASES = (
+    "data_loading",
+    "forward",
+    "backward",
+    "optimizer_step",
+    "validation",
+    "checkpoint",
+)
+
+
+def create_training_profiler(
+    filepath_trace: Union[str, Path],
+    filepath_ops: Union[str, Path],
+    wait: int = 5,
+    warmup: int = 2,
+    active: int = 10,
+    row_limit: int = 30,
+    record_shapes: bool = False,
+    profile_memory: bool = False,
+) -> torch.profiler.profile:
+    """
+    Creates a CPU profiler of a window of training steps, to be entered around training and passed to
+    train_and_validate (or train_loop), which labels the training phases (see TRAINING_PHASES) and steps the
+    profiler after every batch. The profiler skips the first wait steps, warms up for warmup steps and
+    records the next active steps, after which it exports:
+    - a Chrome trace of the recorded steps (open in chrome://tracing or https://ui.perfetto.dev)
+    - a table of the top row_limit operators (and training phases) by self CPU time
+
+    Nothing is exported if training ends before the recorded steps are complete.
+
+    Args:
+        filepath_trace: (str or Path) location of the Chrome trace (.json)
+        filepath_ops: (str or Path) location of the table of the top operators (.txt)
+        wait: (int) number of steps before profiling
+        warmup: (int) number of steps profiled but discarded, as the first profiled steps carry its overhead
+        active: (int) number of steps recorded
+        row_limit: (int) number of operators in the table
+        record_shapes: (bool) whether to record the shapes of the inputs of the operators
+        profile_memory: (bool) whether to record the memory allocated by the operators
+
+    Returns:
+        (torch.profiler.profile) the profiler, not yet started
+    """
+
+    def export(profiler: torch.profiler.profile) -> None:
+        profiler.export_chrome_trace(str(filepath_trace))
+        Path(filepath_ops).write_text(
+            profiler.key_averages().table(
+                sort_by="self_cpu_time_total", row_limit=row_limit
+            ),
+            encoding="utf-8",
+        )
+
+    return torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU],
+        schedule=torch.profiler.schedule(
+            wait=wait, warmup=warmup, active=active, repeat=1
+        ),
+        on_trace_ready=export,
+        record_shapes=record_shapes,
+        profile_memory=profile_memory,
+    )
@@ -0,0 +1,44 @@
+"""
+Unit tests for the functions in lib/profiling.py
+"""
+
+import json
+
+import pytest
+import torch
+import torch.nn as nn
+
+from lib.profiling import create_training_profiler
+from lib.pytorch import create_tensor_loader, train_and_validate
+
+
+@pytest.mark.unittest
+def test_training_profiler_exports_labelled_phases(tmp_path):
+    """
+    Test that profiling a window of training steps of train_and_validate exports a Chrome trace and a table
+    of the top operators, with the training phases labelled
+    """
+    torch.manual_seed(0)
+    X = torch.randn(200, 4)
+    y = (X[:, 0] > 0).to(torch.uint8)
+    model = nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 1), nn.Sigmoid())
+    loader_args = dict(batch_size=20, shuffle=True)
+
+    profiler = create_training_profiler(
+        tmp_path / "trace.json", tmp_path / "ops.txt", wait=2, warmup=1, active=3
+    )
+    with profiler:
+        train_and_validate(
+            model=model,
+            loss_fn=nn.BCELoss(),
+            optimizer=torch.optim.Adam(model.parameters()),
+            train_loader=create_tensor_loader(X, y, loader_args),
+            val_loader=create_tensor_loader(X, y, dict(batch_size=50)),
+            epochs=2,
+            profiler=profiler,
+        )
+
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    event_names = {event.get("name") for event in trace["traceEvents"]}
+    assert {"data_loading", "forward", "backward", "optimizer_step"} <= event_names
+    assert "forward" in (tmp_path / "ops.txt").read_text()
@@ -2,15 +2,56 @@
 Reusable functions for pytorch training, validation and data loading
 """
 
+import hashlib
+import inspect
+import json
+import math
+import os
+import time
+import warnings
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Optional, Tuple, Union
 
-import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, TensorDataset
-
-from lib.utils import flatten_list
+from torch.nn.parallel import DistributedDataParallel
+from torch.profiler import profile, record_function
+from torch.utils.data import (
+    DataLoader,
+    DistributedSampler,
+    RandomSampler,
+    TensorDataset,
+)
+
+from lib.distributed import (
+    all_reduce_sum,
+    broadcast_buffers,
+    broadcast_from_main,
+    get_rank,
+    get_world_size,
+    is_distributed,
+    is_main_process,
+)
+from lib.history import HistoryRecorder
+
+AUTOCAST_DTYPES = {"float32": None, "bfloat16": torch.bfloat16}
+LR_SCALING_RULES = ("none", "linear", "sqrt")
+# torch.load takes weights_only from torch 1.13 (earlier versions load any pickled object)
+TORCH_LOAD_WEIGHTS_ONLY = (
+    dict(weights_only=True)
+    if "weights_only" in inspect.signature(torch.load).parameters
+    else {}
+)
+HISTORY_COLUMNS = (
+    "epoch",
+    "loss",
+    "val_loss",
+    "acc",
+    "val_acc",
+    "epoch_time_s",
+    "samples_per_s",
+)
 
 
 def create_dataloader(
@@ -33,21 +74,269 @@ def create_dataloader(
     return dataloader
 
 
+class TensorBatchLoader:
+    """
+    Iterates over batches of tensors held in memory (or memory-mapped), as a faster replacement for a
+    DataLoader over a TensorDataset in train_loop and val_loop.
+
+    Each batch is taken from the tensors directly, as a slice (without shuffling) or by gathering the rows
+    of a slice of a single permutation drawn per epoch (with shuffling), instead of indexing and collating
+    the samples one at a time. Batches are built in the main process, so there are no worker processes.
+
+    With num_replicas > 1, the loader only visits the shard of the samples of one of num_replicas
+    processes training in parallel (see shard_loader), like a DataLoader with a DistributedSampler: the
+    samples are ordered in the same way in every process (a permutation seeded by seed and the epoch set
+    with set_epoch, when shuffling), padded by repeating samples to a multiple of num_replicas, and each
+    process takes every num_replicas-th sample from its rank on.
+
+    Args:
+        X: (torch Tensor) a tensor containing input features
+        y: (torch Tensor) a tensor containing labels
+        batch_size: (int) number of samples per batch
+        shuffle: (bool) whether to visit the samples in a new random order every epoch
+        drop_last: (bool) whether to skip the last batch if it holds fewer than batch_size samples
+        generator: (torch Generator or None) random generator for the permutations, by default the global one
+            (not used with num_replicas > 1)
+        num_replicas: (int) number of processes the samples are sharded across
+        rank: (int) rank of the process whose shard is visited, from 0 to num_replicas - 1
+        seed: (int) seed of the permutations of the samples with num_replicas > 1
+    """
+
+    def __init__(
+        self,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        batch_size: int,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        generator: Optional[torch.Generator] = None,
+        num_replicas: int = 1,
+        rank: int = 0,
+        seed: int = 0,
+    ):
+        if len(X) != len(y):
+            raise ValueError("X and y must hold the same number of samples")
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"Invalid rank {rank} for {num_replicas} replicas")
+        self.dataset = TensorDataset(X, y)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        Sets the epoch, which seeds the permutation of the samples when sharded across processes
+        """
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        """
+        Returns the number of batches per epoch
+        """
+        n_samples = -(-len(self.dataset) // self.num_replicas)
+        if self.drop_last:
+            return n_samples // self.batch_size
+        return -(-n_samples // self.batch_size)
+
+    def _get_shard_indices(self) -> torch.Tensor:
+        """
+        Returns the indices of the samples of the shard of this process, in the order they are visited
+        """
+        n_samples = len(self.dataset)
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(n_samples, generator=generator)
+        else:
+            order = torch.arange(n_samples)
+        n_padded = -(-n_samples // self.num_replicas) * self.num_replicas
+        order = order[torch.arange(n_padded) % n_samples]
+        return order[self.rank :: self.num_replicas]
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        X, y = self.dataset.tensors
+
+        if self.num_replicas > 1:
+            indices = self._get_shard_indices()
+        elif self.shuffle:
+            indices = torch.randperm(len(X), generator=self.generator)
+        else:
+            indices = None
+
+        n_samples = len(X) if indices is None else len(indices)
+        if self.drop_last:
+            n_samples = len(self) * self.batch_size
+
+        if indices is None:
+            for start in range(0, n_samples, self.batch_size):
+                yield X[start : start + self.batch_size], y[
+                    start : start + self.batch_size
+                ]
+            return
+
+        for start in range(0, n_samples, self.batch_size):
+            batch_indices = indices[start : start + self.batch_size]
+            yield X[batch_indices], y[batch_indices]
+
+
+def create_tensor_loader(
+    X: torch.Tensor, y: torch.Tensor, dataloader_args: dict
+) -> TensorBatchLoader:
+    """
+    Converts input torch tensors X and y into a TensorBatchLoader, taking the same arguments as
+    create_dataloader. Arguments that only apply to DataLoader worker processes (e.g. num_workers,
+    pin_memory) are ignored.
+
+    Args:
+        X: (torch Tensor) a tensor containing input features
+        y: (torch Tensor) a tensor containing labels
+        dataloader_args: (dict) keyword arguments as for create_dataloader
+            (e.g. batch_size: int, shuffle: bool)
+
+    Returns:
+        (TensorBatchLoader)
+    """
+    return TensorBatchLoader(
+        X,
+        y,
+        batch_size=dataloader_args.get("batch_size", 1),
+        shuffle=dataloader_args.get("shuffle", False),
+        drop_last=dataloader_args.get("drop_last", False),
+        generator=dataloader_args.get("generator"),
+    )
+
+
+def shard_loader(
+    loader: Union[DataLoader, TensorBatchLoader],
+    rank: Optional[int] = None,
+    num_replicas: Optional[int] = None,
+) -> Union[DataLoader, TensorBatchLoader]:
+    """
+    Returns a loader over the shard of the samples of a loader that belongs to one of the processes
+    training in parallel, with the same batch size (per process) and shuffling. Every process gets the
+    same number of batches (repeating some samples if the samples do not divide evenly), and the shards
+    are reshuffled every epoch by train_and_validate (through set_epoch).
+
+    Args:
+        loader: (DataLoader or TensorBatchLoader) loader over all samples
+        rank: (int or None) rank of the process, by default that of the current process
+            (see lib.distributed.get_rank)
+        num_replicas: (int or None) number of processes, by default the size of the current process group
+
+    Returns:
+        (DataLoader or TensorBatchLoader) loader over the shard of the process
+    """
+    rank = get_rank() if rank is None else rank
+    num_replicas = get_world_size() if num_replicas is None else num_replicas
+
+    if isinstance(loader, TensorBatchLoader):
+        return TensorBatchLoader(
+            *loader.dataset.tensors,
+            batch_size=loader.batch_size,
+            shuffle=loader.shuffle,
+            drop_last=loader.drop_last,
+            num_replicas=num_replicas,
+            rank=rank,
+        )
+
+    sampler = DistributedSampler(
+        loader.dataset,
+        num_replicas=num_replicas,
+        rank=rank,
+        shuffle=isinstance(loader.sampler, RandomSampler),
+    )
+    return DataLoader(
+        loader.dataset,
+        batch_size=loader.batch_size,
+        sampler=sampler,
+        num_workers=loader.num_workers,
+        drop_last=loader.drop_last,
+    )
+
+
+def autocast(precision: str, device_type: str = "cpu") -> torch.autocast:
+    """
+    Returns a context manager running the operations within it in the given precision (see torch.autocast).
+
+    Args:
+        precision: (str) one of 'float32' (full precision, autocast disabled) or 'bfloat16'
+        device_type: (str) type of the device the operations run on, e.g. 'cpu' or 'cuda'
+
+    Returns:
+        (torch.autocast) the autocast context manager
+    """
+    if precision not in AUTOCAST_DTYPES:
+        raise ValueError(
+            f"Please specify precision as one of {', '.join(AUTOCAST_DTYPES)}"
+        )
+
+    dtype = AUTOCAST_DTYPES[precision]
+    return torch.autocast(
+        device_type=device_type, dtype=dtype, enabled=dtype is not None
+    )
+
+
+def profile_phase(profiler: Optional[profile], name: str):
+    """
+    Returns a context manager labelling the operations within it as a training phase in the traces of the
+    profiler, or doing nothing without a profiler (see lib.profiling.create_training_profiler)
+    """
+    return record_function(name) if profiler is not None else nullcontext()
+
+
+def _profile_batches(dataloader: Union[DataLoader, TensorBatchLoader]) -> Iterator:
+    """
+    Yields the batches of a dataloader, labelling the loading of each as the data_loading phase
+    """
+    batches = iter(dataloader)
+    while True:
+        with record_function("data_loading"):
+            batch = next(batches, None)
+        if batch is None:
+            return
+        yield batch
+
+
 def train_loop(
     dataloader: DataLoader,
     model: nn.Module,
     loss_fn: nn.BCELoss,
     optimizer: torch.optim.Optimizer,
+    precision: str = "float32",
+    accumulation_steps: int = 1,
+    scheduler: Optional[torch.optim.lr_scheduler._LRScheduler] = None,
+    profiler: Optional[profile] = None,
 ) -> tuple:
     """
     Training loop through the dataset for a single epoch of training.
-    Side effect: modifies input objects (model, loss_fn and optimizer) without returning.
+    Side effect: modifies input objects (model, loss_fn, optimizer and scheduler) without returning.
+
+    With a reduced precision, the forward pass runs under autocast (see autocast), while the loss is
+    computed in float32 from the model outputs cast back to float32, and the weights, gradients and
+    optimizer state stay in float32.
+
+    With accumulation_steps > 1, the gradients of that many consecutive batches are averaged before each
+    optimizer step, as for a single batch of accumulation_steps times the size (the last step of the epoch
+    may average fewer batches). Within a process group, the gradients are only averaged across processes
+    at the optimizer steps.
 
     Args:
-        dataloader: (Dataloader) a torch DataLoader containing training samples (X) and labels (y)
+        dataloader: (Dataloader or TensorBatchLoader) a torch DataLoader containing training samples (X)
+            and labels (y)
         model: (nn.Module) a torch neural network object to train
         loss_fn: (torch.nn.BCELoss) a torch loss function object
         optimizer: (torch.optim.Optimizer) torch optimizer object, e.g. Adam or SGD
+        precision: (str) precision of the forward pass, one of 'float32' or 'bfloat16'
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+        scheduler: (torch learning rate scheduler or None) scheduler stepped after every optimizer step
+            (e.g. see create_warmup_scheduler)
+        profiler: (torch.profiler.profile or None) active profiler, stepped after every batch, with the
+            data_loading, forward, backward and optimizer_step phases labelled (see profile_phase); None to
+            not instrument the loop
 
     Returns:
         (tuple):
@@ -55,73 +344,213 @@ def train_loop(
             (float) correct: training set accuracy
     """
     size = len(dataloader.dataset)
+    n_batches = len(dataloader)
     model.train()
+    optimizer.zero_grad()
 
-    train_loss, correct = 0.0, 0.0
+    # Accumulated as tensors on the device of the model, and only copied to the host once per epoch
+    train_loss, correct = 0.0, 0
 
-    for X, y in dataloader:
-        y = y.unsqueeze(1)
+    batches = dataloader if profiler is None else _profile_batches(dataloader)
+    for batch, (X, y) in enumerate(batches):
+        # Stored features and labels may use compact dtypes (e.g. float16, uint8)
+        X = X.float()
+        y = y.unsqueeze(1).float()
 
         # Compute prediction and loss
-        probs = model(X)
-        loss = loss_fn(probs, y)
-        train_loss += loss.item()
+        with profile_phase(profiler, "forward"):
+            with autocast(precision, X.device.type):
+                probs = model(X).float()
+            loss = loss_fn(probs, y)
+        train_loss += loss.detach()
 
         preds = probs > 0.5
-        correct += (preds == y).sum().item()
-
-        # Backpropagation
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-
-    train_loss /= size
-    correct /= size
+        correct += (preds == y).sum()
+
+        # Backpropagation, averaging the gradients of the batches of each optimizer step
+        step_start = batch - batch % accumulation_steps
+        n_step_batches = min(accumulation_steps, n_batches - step_start)
+        is_step = batch == step_start + n_step_batches - 1
+        no_sync = getattr(model, "no_sync", None)
+        with profile_phase(profiler, "backward"):
+            with nullcontext() if is_step or no_sync is None else no_sync():
+                (loss / n_step_batches).backward()
+
+        if is_step:
+            with profile_phase(profiler, "optimizer_step"):
+                optimizer.step()
+                optimizer.zero_grad()
+            if scheduler is not None:
+                scheduler.step()
+        if profiler is not None:
+            profiler.step()
+
+    train_loss = float(train_loss) / size
+    correct = float(correct) / size
 
     return train_loss, correct
 
 
-def val_loop(dataloader: DataLoader, model: nn.Module, loss_fn: nn.BCELoss) -> tuple:
+def val_loop(
+    dataloader: DataLoader,
+    model: nn.Module,
+    loss_fn: nn.BCELoss,
+    precision: str = "float32",
+) -> tuple:
     """
-    Validation loop through the dataset.
+    Validation loop through the dataset. With a reduced precision, the forward pass runs under autocast
+    and the loss is computed in float32 (see train_loop).
 
     Args:
-        dataloader: (Dataloader) a torch DataLoader containing validation samples (X) and labels (y)
+        dataloader: (Dataloader or TensorBatchLoader) a torch DataLoader containing validation samples (X)
+            and labels (y)
         model: (nn.Module) a torch neural network object to validate
         loss_fn: (torch.nn.BCELoss) a torch loss function object to compute validation loss
+        precision: (str) precision of the forward pass, one of 'float32' or 'bfloat16'
 
     Returns:
         (tuple):
             (float) val_loss: the value of loss function on all validation data provided with the dataloader
             (float) correct: validation set accuracy
-            (tuple[list]): (y_true, y_pred): lists containing true labels and the labels as predicted by the model
+            (tuple[numpy ndarray]): (y_true, y_pred): arrays containing true labels and the labels as
+                predicted by the model
     """
     size = len(dataloader.dataset)
     model.eval()
 
     y_true = []
     y_pred = []
-    val_loss, correct = 0.0, 0.0
+    val_loss = 0.0
 
     with torch.no_grad():
         for X, y in dataloader:
-            y = y.unsqueeze(1)
-            y_proba = model(X)
-            val_loss += loss_fn(y_proba, y).item()
+            X = X.float()
+            y = y.unsqueeze(1).float()
+            with autocast(precision, X.device.type):
+                y_proba = model(X).float()
+            val_loss += loss_fn(y_proba, y)
+
+            y_pred.append(y_proba > 0.5)
+            y_true.append(y)
+
+    # Concatenated on the device, and copied to the host once
+    y_pred = torch.cat(y_pred).flatten().float().cpu()
+    y_true = torch.cat(y_true).flatten().cpu()
+
+    val_loss = float(val_loss) / size
+    correct = float((y_pred == y_true).sum()) / size
+
+    return val_loss, correct, (y_true.numpy(), y_pred.numpy())
+
+
+def scale_learning_rate(
+    learning_rate: float, batch_size: int, effective_batch_size: int, rule: str
+) -> float:
+    """
+    Scales a learning rate tuned for a batch size to a larger (or smaller) effective batch size, e.g. that
+    of gradient accumulation over several batches and processes.
+
+    Args:
+        learning_rate: (float) learning rate tuned for batch_size
+        batch_size: (int) batch size the learning rate was tuned for
+        effective_batch_size: (int) number of samples per optimizer step
+        rule: (str) 'linear' (proportional to the batch size), 'sqrt' (proportional to its square root,
+            often better suited to Adam) or 'none' (unchanged)
+
+    Returns:
+        (float) the scaled learning rate
+    """
+    if rule not in LR_SCALING_RULES:
+        raise ValueError(
+            f"Please specify the learning rate scaling as one of {', '.join(LR_SCALING_RULES)}"
+        )
+
+    ratio = effective_batch_size / batch_size
+    if rule == "linear":
+        return learning_rate * ratio
+    if rule == "sqrt":
+        return learning_rate * math.sqrt(ratio)
+    return learning_rate
+
+
+def create_warmup_scheduler(
+    optimizer: torch.optim.Optimizer, warmup_steps: int
+) -> Optional[torch.optim.lr_scheduler.LambdaLR]:
+    """
+    Creates a scheduler that increases the learning rate linearly over the first warmup_steps optimizer
+    steps, up to the learning rate of the optimizer, which is kept from then on. Warmup stabilizes the
+    first steps of training with the high learning rates of large effective batch sizes.
+
+    Args:
+        optimizer: (torch.optim.Optimizer) optimizer whose learning rate is scheduled
+        warmup_steps: (int) number of optimizer steps of the warmup
+
+    Returns:
+        (torch LambdaLR or None) the scheduler, to step after every optimizer step (see train_loop),
+            or None without warmup steps
+    """
+    if warmup_steps <= 0:
+        return None
+    return torch.optim.lr_scheduler.LambdaLR(
+        optimizer, lambda step: min(1.0, (step + 1) / warmup_steps)
+    )
 
-            y_preds_batch = (y_proba > 0.5).double()
-            correct += (y_preds_batch == y).sum().item()
 
-            y_pred.append(y_preds_batch.tolist())
-            y_true.append(y.tolist())
+def save_checkpoint(filepath: Union[str, Path], checkpoint: dict) -> None:
+    """
+    Saves a training checkpoint. The file is replaced atomically, so that an interrupted save never
+    leaves a partially written checkpoint behind.
+
+    Args:
+        filepath: (str or Path) location of the checkpoint
+        checkpoint: (dict) checkpoint contents, e.g. as saved by train_and_validate
+    """
+    filepath_tmp = Path(f"{filepath}.tmp")
+    torch.save(checkpoint, filepath_tmp)
+    os.replace(filepath_tmp, filepath)
+
+
+def load_checkpoint(filepath: Union[str, Path]) -> dict:
+    """
+    Loads a training checkpoint saved by save_checkpoint, restricted to tensors and plain Python values
+    (weights_only, where supported by the torch version), so that a checkpoint file cannot run code
+    """
+    return torch.load(filepath, **TORCH_LOAD_WEIGHTS_ONLY)
+
+
+def get_run_key(settings: dict) -> str:
+    """
+    Returns a key identifying a training run by its settings (e.g. the training config, model and dataset
+    version), to store in its checkpoints, so that a run only resumes from checkpoints of the same settings
+
+    Args:
+        settings: (dict) JSON-serializable settings (other values are converted to strings)
+
+    Returns:
+        (str) a hash of the settings
+    """
+    serialized = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
 
-    val_loss /= size
-    correct /= size
 
-    y_pred = flatten_list(y_pred)
-    y_true = flatten_list(y_true)
+def _is_improvement(value: float, best_value: Optional[float], monitor: str) -> bool:
+    """
+    Checks whether the value of the monitored metric improves on the best value so far
+    (lower is better for losses, higher for accuracies)
+    """
+    if best_value is None:
+        return True
+    return value < best_value if monitor.endswith("loss") else value > best_value
 
-    return val_loss, correct, (y_true, y_pred)
+
+def _set_epoch(loader: Union[DataLoader, TensorBatchLoader], epoch: int) -> None:
+    """
+    Sets the epoch of a sharded loader (or of the DistributedSampler of a DataLoader), which reshuffles
+    the shards
+    """
+    for obj in (loader, getattr(loader, "sampler", None)):
+        if hasattr(obj, "set_epoch"):
+            obj.set_epoch(epoch)
 
 
 def train_and_validate(
@@ -131,65 +560,201 @@ def train_and_validate(
     train_loader: DataLoader,
     val_loader: DataLoader,
     epochs: int,
-    filepath_model: Union[str, Path],
+    filepath_model: Optional[Union[str, Path]] = None,
+    precision: str = "float32",
+    monitor: str = "val_acc",
+    patience: Optional[int] = None,
+    filepath_checkpoint: Optional[Union[str, Path]] = None,
+    checkpoint_every: int = 1,
+    history: Optional[HistoryRecorder] = None,
+    accumulation_steps: int = 1,
+    scheduler: Optional[torch.optim.lr_scheduler._LRScheduler] = None,
+    profiler: Optional[profile] = None,
+    run_key: Optional[str] = None,
 ) -> tuple:
     """
     Runs model training and validation using the dataloaders provided for the number of epochs specified,
-    saving the best version of the model to specified location.
+    keeping the best version of the model (by the monitored metric) in memory. At the end, the best weights
+    are loaded into the model and saved to the location specified.
+
+    Training stops early if the monitored metric has not improved for patience epochs. With a checkpoint
+    location, a full checkpoint (model, optimizer, epoch, history, best weights and random generator state)
+    is saved every checkpoint_every epochs and at the end, and training resumes from the checkpoint if one
+    is found there, so that an interrupted run can continue where it left off. A checkpoint saved with
+    another run_key (e.g. left by a crashed run with other settings) is ignored with a warning, and
+    overwritten by the checkpoints of this run.
+
+    Within a process group (see lib.distributed.run_data_parallel), each process trains on its shard of
+    the training data (see shard_loader) with the gradients averaged across processes (the model is wrapped
+    in DistributedDataParallel). The training metrics are summed over the shards, the batch norm statistics
+    and validation metrics of the main process are shared with all processes, so that they all stop at the
+    same epoch, and only the main process saves the model and checkpoints (the history recorder of the
+    other processes should not write to a file or MLflow).
 
     Args:
         model: (torch.nn.Module) torch model object to train and validate
         loss_fn: (torch.nn.BCELoss) torch loss function object to use in training and validation
         optimizer: (torch.optim.Optimizer) torch optimizer object to use in training
-        train_loader: (DataLoader) the dataloader containing training data
+        train_loader: (DataLoader) the dataloader containing training data (the shard of the process, within
+            a process group)
         val_loader: (DataLoader) the dataloader containing validation data
-        epochs: (int) the number of epochs
-        filepath_model: (str or Path) the location at which to save the best model
+        epochs: (int) the maximum number of epochs
+        filepath_model: (str, Path or None) the location at which to save the best model, or None to not
+            save it
+        precision: (str) precision of the forward passes, one of 'float32' or 'bfloat16'
+            (see train_loop)
+        monitor: (str) metric selecting the best model and checked for early stopping: one of 'val_acc',
+            'val_loss', 'acc' or 'loss'
+        patience: (int or None) number of epochs without improvement of the monitored metric after which
+            training stops, or None to always train for all epochs
+        filepath_checkpoint: (str, Path or None) location of the training checkpoint, or None to not
+            checkpoint
+        checkpoint_every: (int) number of epochs between checkpoints
+        history: (HistoryRecorder or None) recorder of the metrics of each epoch (see HISTORY_COLUMNS),
+            e.g. writing them to a file and MLflow as they are recorded; None to record them in memory only
+        accumulation_steps: (int) number of batches whose gradients are accumulated per optimizer step
+            (see train_loop)
+        scheduler: (torch learning rate scheduler or None) scheduler stepped after every optimizer step,
+            saved with the checkpoints
+        profiler: (torch.profiler.profile or None) active profiler stepped after every training batch (see
+            train_loop), with the validation and checkpoint phases also labelled; None to not profile
+        run_key: (str or None) key of the settings of the run (see get_run_key), stored in the checkpoints
+            and required of the checkpoint to resume from
 
     Returns:
         (tuple):
-            (torch.nn.Module): trained model
-            (pandas DataFrame): training history metrics
-            (tuple[list]): (y_true, y_pred): lists containing true labels and the labels as predicted by
-                the model for the validation set in last iteration
+            (torch.nn.Module): trained model, with the weights of its best epoch
+            (pandas DataFrame): training history metrics, including the wall time and training throughput
+                (samples per second) of each epoch
+            (tuple[numpy ndarray]): (y_true, y_pred): arrays containing true labels and the labels as
+                predicted by the model for the validation set in last iteration
     """
-    df_history = pd.DataFrame(
-        [], columns=["epoch", "loss", "val_loss", "acc", "val_acc"]
-    )
+    if monitor not in ("val_acc", "val_loss", "acc", "loss"):
+        raise ValueError(
+            "Please specify monitor as one of 'val_acc', 'val_loss', 'acc' or 'loss'"
+        )
 
-    best_acc = 0
+    if history is None:
+        history = HistoryRecorder(HISTORY_COLUMNS, capacity=epochs)
+    # Only the main process reports progress
+    log = print if is_main_process() else lambda *args: None
+    first_epoch, best_value, best_state, n_epochs_no_improvement = 1, None, None, 0
+    y_true, y_pred = None, None
+
+    checkpoint = None
+    if filepath_checkpoint is not None and Path(filepath_checkpoint).is_file():
+        checkpoint = load_checkpoint(filepath_checkpoint)
+        if checkpoint.get("run_key") != run_key:
+            warnings.warn(
+                f"Ignoring the checkpoint {filepath_checkpoint}, saved by a run with other settings "
+                f"(run key {checkpoint.get('run_key')}, not {run_key}); it will be overwritten"
+            )
+            checkpoint = None
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        if scheduler is not None:
+            scheduler.load_state_dict(checkpoint["scheduler"])
+        torch.set_rng_state(checkpoint["rng_state"])
+        history.restore(checkpoint["history"])
+        first_epoch = checkpoint["epoch"] + 1
+        best_value, best_state = checkpoint["best_value"], checkpoint["best_state"]
+        n_epochs_no_improvement = checkpoint["n_epochs_no_improvement"]
+        log(f"Resuming training from the checkpoint of epoch {checkpoint['epoch']}")
+
+    # Synchronizes the initial weights and averages the gradients across processes
+    train_model = DistributedDataParallel(model) if is_distributed() else model
 
     # Loop through epochs
-    for epoch in range(1, epochs + 1):
-        print(f"Epoch {epoch}\n-------------------------------")
+    for epoch in range(first_epoch, epochs + 1):
+        if patience is not None and n_epochs_no_improvement >= patience:
+            break
+
+        log(f"Epoch {epoch}\n-------------------------------")
+        start = time.perf_counter()
+        _set_epoch(train_loader, epoch)
 
         train_loss, train_acc = train_loop(
-            dataloader=train_loader, model=model, loss_fn=loss_fn, optimizer=optimizer
+            dataloader=train_loader,
+            model=train_model,
+            loss_fn=loss_fn,
+            optimizer=optimizer,
+            precision=precision,
+            accumulation_steps=accumulation_steps,
+            scheduler=scheduler,
+            profiler=profiler,
         )
-        print(
+        if is_distributed():
+            train_loss, train_acc = all_reduce_sum([train_loss, train_acc])
+            broadcast_buffers(model)
+        train_time = time.perf_counter() - start
+        log(
             f"Training set: Accuracy: {(100*train_acc):>0.1f}%, Avg loss: {train_loss:>7f}"
         )
 
-        val_loss, val_acc, (y_true, y_pred) = val_loop(
-            dataloader=val_loader, model=model, loss_fn=loss_fn
-        )
-        print(
+        with profile_phase(profiler, "validation"):
+            val_loss, val_acc, (y_true, y_pred) = val_loop(
+                dataloader=val_loader,
+                model=model,
+                loss_fn=loss_fn,
+                precision=precision,
+            )
+        val_loss, val_acc = broadcast_from_main([val_loss, val_acc])
+        log(
             f"Validation set: Accuracy: {(100*val_acc):>0.1f}%, Avg loss: {val_loss:>7f} \n"
         )
 
-        df_history = df_history.append(
-            dict(
-                epoch=epoch,
-                loss=train_loss,
-                val_loss=val_loss,
-                acc=train_acc,
-                val_acc=val_acc,
-            ),
-            ignore_index=True,
+        metrics = dict(
+            epoch=epoch,
+            loss=train_loss,
+            val_loss=val_loss,
+            acc=train_acc,
+            val_acc=val_acc,
+            epoch_time_s=time.perf_counter() - start,
+            samples_per_s=len(train_loader.dataset) / train_time,
         )
-
-        if val_acc > best_acc:
-            torch.save(model.state_dict(), filepath_model)
-            best_acc = val_acc
-
-    return model, df_history, (y_true, y_pred)
+        history.record(**metrics)
+
+        if _is_improvement(metrics[monitor], best_value, monitor):
+            best_value = metrics[monitor]
+            best_state = {
+                name: tensor.detach().clone()
+                for name, tensor in model.state_dict().items()
+            }
+            n_epochs_no_improvement = 0
+        else:
+            n_epochs_no_improvement += 1
+
+        is_last_epoch = epoch == epochs or (
+            patience is not None and n_epochs_no_improvement >= patience
+        )
+        if (
+            filepath_checkpoint is not None
+            and is_main_process()
+            and (epoch % checkpoint_every == 0 or is_last_epoch)
+        ):
+            with profile_phase(profiler, "checkpoint"):
+                save_checkpoint(
+                    filepath_checkpoint,
+                    dict(
+                        model=model.state_dict(),
+                        optimizer=optimizer.state_dict(),
+                        scheduler=scheduler.state_dict()
+                        if scheduler is not None
+                        else None,
+                        rng_state=torch.get_rng_state(),
+                        epoch=epoch,
+                        history=history.to_dict(),
+                        best_value=best_value,
+                        best_state=best_state,
+                        n_epochs_no_improvement=n_epochs_no_improvement,
+                        run_key=run_key,
+                    ),
+                )
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        if filepath_model is not None and is_main_process():
+            torch.save(best_state, filepath_model)
+
+    return model, history.to_dataframe(), (y_true, y_pred)
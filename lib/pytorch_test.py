@@ -0,0 +1,401 @@
+"""
+Unit tests for the functions in lib/pytorch.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch.nn as nn
+
+from lib.pytorch import (
+    TensorBatchLoader,
+    autocast,
+    create_dataloader,
+    create_tensor_loader,
+    create_warmup_scheduler,
+    get_run_key,
+    load_checkpoint,
+    scale_learning_rate,
+    shard_loader,
+    train_and_validate,
+    train_loop,
+    val_loop,
+)
+
+
+@pytest.fixture(name="tensors")
+def small_classification_tensors():
+    """
+    Pytest fixture that yields a small feature tensor (with the row number as feature) and binary labels
+    """
+    X = torch.arange(10, dtype=torch.float32).unsqueeze(1)
+    y = (torch.arange(10) % 2).to(torch.uint8)
+    yield X, y
+
+
+@pytest.mark.unittest
+class TestTensorBatchLoader:
+    """
+    Tests for iterating over tensors in batches with TensorBatchLoader
+    """
+
+    def test_batches_without_shuffling_are_slices_in_order(self, tensors):
+        """
+        Test that the batches cover all samples in order, with a shorter last batch
+        """
+        X, y = tensors
+        loader = TensorBatchLoader(X, y, batch_size=4)
+
+        batches = list(loader)
+
+        assert len(loader) == len(batches) == 3
+        assert [len(X_batch) for X_batch, _ in batches] == [4, 4, 2]
+        assert torch.equal(torch.cat([X_batch for X_batch, _ in batches]), X)
+        assert torch.equal(torch.cat([y_batch for _, y_batch in batches]), y)
+
+    def test_shuffled_batches_cover_each_sample_once_per_epoch(self, tensors):
+        """
+        Test that each epoch visits every sample exactly once, keeping the labels with their features,
+        in a different order across epochs
+        """
+        X, y = tensors
+        loader = TensorBatchLoader(
+            X, y, batch_size=3, shuffle=True, generator=torch.Generator().manual_seed(0)
+        )
+
+        epochs = [torch.cat([X_batch for X_batch, _ in loader]) for _ in range(2)]
+
+        for X_epoch in epochs:
+            assert sorted(X_epoch.squeeze(1).tolist()) == list(range(10))
+        assert not torch.equal(epochs[0], epochs[1])
+        for X_batch, y_batch in loader:
+            assert torch.equal(X_batch.squeeze(1).long() % 2, y_batch.long())
+
+    def test_drop_last_skips_the_incomplete_batch(self, tensors):
+        """
+        Test that with drop_last only full batches are returned
+        """
+        X, y = tensors
+        loader = create_tensor_loader(
+            X, y, dict(batch_size=4, num_workers=2, shuffle=True, drop_last=True)
+        )
+
+        assert [len(X_batch) for X_batch, _ in loader] == [4, 4] and len(loader) == 2
+
+    def test_loader_can_replace_a_dataloader_in_the_training_loops(self, tensors):
+        """
+        Test that train_loop and val_loop run on a TensorBatchLoader
+        """
+        X, y = tensors
+        loader = TensorBatchLoader(X, y, batch_size=4, shuffle=True)
+        model = nn.Sequential(nn.Linear(1, 1), nn.Sigmoid())
+
+        train_loop(
+            loader, model, nn.BCELoss(), torch.optim.SGD(model.parameters(), lr=0.1)
+        )
+        _, accuracy, (y_true, y_pred) = val_loop(loader, model, nn.BCELoss())
+
+        assert 0.0 <= accuracy <= 1.0
+        assert len(y_true) == len(y_pred) == 10
+
+
+@pytest.mark.unittest
+class TestShardLoader:
+    """
+    Tests for sharding the samples of a loader across processes with shard_loader
+    """
+
+    @pytest.mark.parametrize("in_memory", [True, False])
+    def test_shards_cover_all_samples_with_the_same_number_of_batches(
+        self, tensors, in_memory
+    ):
+        """
+        Test that the shards of 3 processes hold the same number of batches and together cover every
+        sample (padded with repeated samples), both for a TensorBatchLoader and a DataLoader
+        """
+        X, y = tensors
+        create_loader = create_tensor_loader if in_memory else create_dataloader
+        loader = create_loader(X, y, dict(batch_size=2, shuffle=True))
+
+        shards = [shard_loader(loader, rank=rank, num_replicas=3) for rank in range(3)]
+        samples = [
+            torch.cat([X_batch for X_batch, _ in shard]).squeeze(1).long().tolist()
+            for shard in shards
+        ]
+
+        assert [len(shard) for shard in shards] == [2, 2, 2]
+        assert [len(shard_samples) for shard_samples in samples] == [4, 4, 4]
+        assert set(sum(samples, [])) == set(range(10))
+
+    def test_shards_are_disjoint_and_reshuffled_every_epoch(self, tensors):
+        """
+        Test that the shards of 2 processes split the samples between them in every epoch, in an order
+        that changes with the epoch
+        """
+        X, y = tensors
+        loader = TensorBatchLoader(X, y, batch_size=2, shuffle=True)
+        shards = [shard_loader(loader, rank=rank, num_replicas=2) for rank in range(2)]
+
+        orders = []
+        for epoch in range(2):
+            for shard in shards:
+                shard.set_epoch(epoch)
+            samples = [torch.cat([X_batch for X_batch, _ in shard]) for shard in shards]
+            assert sorted(torch.cat(samples).squeeze(1).tolist()) == list(range(10))
+            orders.append(samples[0])
+
+        assert not torch.equal(orders[0], orders[1])
+
+
+@pytest.mark.unittest
+class TestGradientAccumulation:
+    """
+    Tests for gradient accumulation and the learning rate policy of large effective batches
+    """
+
+    def test_accumulated_batches_match_a_single_larger_batch(self, tensors):
+        """
+        Test that accumulating the gradients of 2 batches of 4 samples (and of a last batch of 2) gives the
+        same weights as training with batches of 8 samples
+        """
+        X, y = tensors
+        weights = []
+        for batch_size, accumulation_steps in [(8, 1), (4, 2)]:
+            torch.manual_seed(0)
+            model = nn.Sequential(nn.Linear(1, 1), nn.Sigmoid())
+            optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+            train_loop(
+                TensorBatchLoader(X, y, batch_size=batch_size),
+                model,
+                nn.BCELoss(),
+                optimizer,
+                accumulation_steps=accumulation_steps,
+            )
+            weights.append(model[0].weight.detach().clone())
+
+        assert torch.allclose(weights[0], weights[1])
+
+    def test_scheduler_warms_up_the_learning_rate_per_optimizer_step(self, tensors):
+        """
+        Test that the warmup scheduler is stepped once per optimizer step and ramps up the learning rate
+        linearly, then keeps it
+        """
+        X, y = tensors
+        model = nn.Sequential(nn.Linear(1, 1), nn.Sigmoid())
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.4)
+        scheduler = create_warmup_scheduler(optimizer, warmup_steps=4)
+
+        learning_rates = [optimizer.param_groups[0]["lr"]]
+        for _ in range(2):
+            # 5 batches of 2 samples, accumulated in optimizer steps of 2, 2 and 1 batches
+            train_loop(
+                TensorBatchLoader(X, y, batch_size=2),
+                model,
+                nn.BCELoss(),
+                optimizer,
+                accumulation_steps=2,
+                scheduler=scheduler,
+            )
+            learning_rates.append(optimizer.param_groups[0]["lr"])
+
+        assert learning_rates == pytest.approx([0.1, 0.4, 0.4])
+        assert scheduler.last_epoch == 6
+        assert create_warmup_scheduler(optimizer, warmup_steps=0) is None
+
+    @pytest.mark.parametrize(
+        "rule, expected", [("none", 0.001), ("linear", 0.004), ("sqrt", 0.002)]
+    )
+    def test_learning_rate_is_scaled_to_the_effective_batch_size(self, rule, expected):
+        """
+        Test each rule scaling the learning rate from a batch size of 32 to 128
+        """
+        assert scale_learning_rate(0.001, 32, 128, rule) == pytest.approx(expected)
+
+    def test_unknown_scaling_rule_is_rejected(self):
+        """
+        Test that an unknown scaling rule raises a ValueError
+        """
+        with pytest.raises(ValueError):
+            scale_learning_rate(0.001, 32, 128, "quadratic")
+
+
+@pytest.mark.unittest
+class TestValidationLoop:
+    """
+    Tests for the metrics returned by val_loop
+    """
+
+    def test_val_loop_returns_epoch_metrics_and_prediction_arrays(self, tensors):
+        """
+        Test that the accuracy and loss match those computed on the whole dataset at once, and that the
+        labels and predictions are returned as flat numpy arrays in the order of the batches
+        """
+        X, y = tensors
+        model = nn.Sequential(nn.Linear(1, 1), nn.Sigmoid())
+        loss_fn = nn.BCELoss(reduction="sum")
+
+        val_loss, accuracy, (y_true, y_pred) = val_loop(
+            TensorBatchLoader(X, y, batch_size=3), model, loss_fn
+        )
+
+        with torch.no_grad():
+            probs = model(X).squeeze(1)
+        assert isinstance(y_true, np.ndarray) and isinstance(y_pred, np.ndarray)
+        assert y_true.shape == y_pred.shape == (10,)
+        np.testing.assert_array_equal(y_true, y.numpy())
+        np.testing.assert_array_equal(y_pred, (probs > 0.5).numpy())
+        assert accuracy == pytest.approx(np.mean(y_true == y_pred))
+        assert val_loss == pytest.approx(loss_fn(probs, y.float()).item() / 10)
+
+
+@pytest.mark.unittest
+class TestReducedPrecision:
+    """
+    Tests for training and validation with bfloat16 autocast
+    """
+
+    def test_bfloat16_training_keeps_float32_weights_and_loss(self, tensors):
+        """
+        Test that a bfloat16 epoch returns a finite loss and leaves the weights in float32
+        """
+        X, y = tensors
+        model = nn.Sequential(nn.Linear(1, 8), nn.ReLU(), nn.Linear(8, 1), nn.Sigmoid())
+        loader = TensorBatchLoader(X, y, batch_size=4)
+
+        train_loss, _ = train_loop(
+            loader,
+            model,
+            nn.BCELoss(),
+            torch.optim.Adam(model.parameters()),
+            precision="bfloat16",
+        )
+        val_loss, _, (_, y_pred) = val_loop(
+            loader, model, nn.BCELoss(), precision="bfloat16"
+        )
+
+        assert np.isfinite(train_loss) and np.isfinite(val_loss)
+        assert all(param.dtype == torch.float32 for param in model.parameters())
+        assert y_pred.dtype == np.float32
+
+    def test_unknown_precision_is_rejected(self):
+        """
+        Test that only the supported precisions can be requested
+        """
+        with pytest.raises(ValueError):
+            autocast("int8")
+
+
+@pytest.fixture(name="training_setup")
+def small_training_setup(tensors):
+    """
+    Pytest fixture that yields a function creating a freshly seeded model, loss, optimizer and loaders for
+    train_and_validate
+    """
+
+    def create():
+        torch.manual_seed(0)
+        X, y = tensors
+        model = nn.Sequential(nn.Linear(1, 4), nn.ReLU(), nn.Linear(4, 1), nn.Sigmoid())
+        return dict(
+            model=model,
+            loss_fn=nn.BCELoss(),
+            optimizer=torch.optim.Adam(model.parameters(), lr=0.01),
+            train_loader=TensorBatchLoader(X, y, batch_size=4, shuffle=True),
+            val_loader=TensorBatchLoader(X, y, batch_size=4),
+        )
+
+    yield create
+
+
+@pytest.mark.unittest
+class TestTrainAndValidate:
+    """
+    Tests for early stopping, best model selection and checkpointing in train_and_validate
+    """
+
+    def test_training_stops_after_patience_epochs_without_improvement(
+        self, training_setup
+    ):
+        """
+        Test that training stops once the monitored metric has not improved for patience epochs
+        """
+        setup = training_setup()
+        setup["optimizer"] = torch.optim.SGD(setup["model"].parameters(), lr=0.0)
+
+        _, df_history, _ = train_and_validate(
+            **setup, epochs=20, monitor="val_loss", patience=3
+        )
+
+        assert df_history["epoch"].tolist() == [1, 2, 3, 4]
+
+    def test_best_weights_are_returned_and_saved(self, training_setup, tmp_path):
+        """
+        Test that the model is returned with the weights of the epoch with the best monitored metric,
+        which are also saved to the model file
+        """
+        setup = training_setup()
+        filepath_model = tmp_path / "model.pt"
+
+        model, df_history, _ = train_and_validate(
+            **setup, epochs=8, filepath_model=filepath_model, monitor="val_loss"
+        )
+
+        val_loss, _, _ = val_loop(setup["val_loader"], model, setup["loss_fn"])
+        assert val_loss == pytest.approx(df_history["val_loss"].min())
+        for name, tensor in torch.load(filepath_model).items():
+            assert torch.equal(tensor, model.state_dict()[name])
+
+    def test_interrupted_training_resumes_from_checkpoint(
+        self, training_setup, tmp_path
+    ):
+        """
+        Test that training resumed from a checkpoint ends with the same history and weights as
+        uninterrupted training
+        """
+        filepath_checkpoint = tmp_path / "checkpoint.pt"
+
+        setup = training_setup()
+        model, df_history, _ = train_and_validate(**setup, epochs=6)
+
+        setup_interrupted = training_setup()
+        train_and_validate(
+            **setup_interrupted,
+            epochs=3,
+            filepath_checkpoint=filepath_checkpoint,
+            checkpoint_every=3,
+        )
+        setup_resumed = training_setup()
+        model_resumed, df_history_resumed, _ = train_and_validate(
+            **setup_resumed, epochs=6, filepath_checkpoint=filepath_checkpoint
+        )
+
+        metrics = ["epoch", "loss", "val_loss", "acc", "val_acc"]
+        pd.testing.assert_frame_equal(df_history_resumed[metrics], df_history[metrics])
+        for name, tensor in model_resumed.state_dict().items():
+            assert torch.allclose(tensor, model.state_dict()[name])
+
+    def test_checkpoint_of_other_settings_is_ignored(self, training_setup, tmp_path):
+        """
+        Test that a checkpoint saved with another run key is not resumed from (even when it is past the
+        epochs of the run), but trained over and overwritten with the key of the run
+        """
+        filepath_checkpoint = tmp_path / "checkpoint.pt"
+        run_key = get_run_key(dict(lr=0.01, epochs=3))
+        train_and_validate(
+            **training_setup(),
+            epochs=4,
+            filepath_checkpoint=filepath_checkpoint,
+            run_key=get_run_key(dict(lr=0.1, epochs=4)),
+        )
+
+        with pytest.warns(UserWarning, match="other settings"):
+            _, df_history, _ = train_and_validate(
+                **training_setup(),
+                epochs=3,
+                filepath_checkpoint=filepath_checkpoint,
+                run_key=run_key,
+            )
+
+        assert df_history["epoch"].tolist() == [1, 2, 3]
+        assert load_checkpoint(filepath_checkpoint)["run_key"] == run_key
@@ -0,0 +1,340 @@
+"""
+Reusable functions for scoring a model online on localhost: a micro-batcher coalescing concurrent single-row
+requests into batches, an HTTP server in front of it, and a load generator to measure its latency and
+throughput under concurrent requests
+"""
+
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+_STOP = object()
+
+
+def get_latency_percentiles(latencies_s: Sequence[float]) -> dict:
+    """
+    Returns the p50, p95, p99 and maximum of latencies in seconds, in milliseconds (NaN if there are none)
+    """
+    if len(latencies_s) == 0:
+        return dict.fromkeys(
+            ("latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "latency_max_ms"),
+            float("nan"),
+        )
+    p50, p95, p99 = np.percentile(np.asarray(latencies_s) * 1e3, [50, 95, 99])
+    return dict(
+        latency_p50_ms=float(p50),
+        latency_p95_ms=float(p95),
+        latency_p99_ms=float(p99),
+        latency_max_ms=float(max(latencies_s)) * 1e3,
+    )
+
+
+class MicroBatcher:
+    """
+    Scores single-row requests made concurrently (e.g. from the threads of a server) in micro-batches: a
+    background thread takes the first pending request, waits up to max_wait_ms for more requests to arrive
+    (up to max_batch_size rows in total), and scores them together with one call to predict_fn. Under load,
+    the batches fill up without waiting, so that each forward pass scores many rows; at low load, a
+    request waits at most max_wait_ms before being scored.
+
+    Use as a context manager, or call close() to stop the background thread.
+
+    Args:
+        predict_fn: (callable) scores a float32 array of rows (batch, n_features), returning one value per row
+        max_batch_size: (int) maximum number of rows scored per call of predict_fn
+        max_wait_ms: (float) maximum time a request waits for others to join its batch, in milliseconds
+        n_features: (int or None) number of features of a row; requests of another shape are rejected with a
+            ValueError (so that they cannot fail the batches of other requests); None to not check
+        max_latencies: (int) number of most recent request latencies kept for the percentiles of stats()
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        n_features: Optional[int] = None,
+        max_latencies: int = 100_000,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1e3
+        self.n_features = n_features
+
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._latencies = deque(maxlen=max_latencies)
+        self._n_requests, self._n_batches, self._n_errors = 0, 0, 0
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, row: Sequence[float]) -> Future:
+        """
+        Queues a row for scoring, returning a future of its score (a float)
+        """
+        row = np.asarray(row, dtype=np.float32)
+        if row.ndim != 1 or (
+            self.n_features is not None and row.shape[0] != self.n_features
+        ):
+            raise ValueError(
+                f"Expected a row of {self.n_features or 'n'} features, got an array of shape {row.shape}"
+            )
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The micro-batcher is closed")
+            self._queue.put((row, future, time.perf_counter()))
+        return future
+
+    def predict(self, row: Sequence[float], timeout: Optional[float] = None) -> float:
+        """
+        Scores a row, blocking until its micro-batch has been scored
+        """
+        return self.submit(row).result(timeout)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # The wait is counted from the arrival of the first request of the batch
+            deadline = item[2] + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.perf_counter(), 0)
+                    )
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._score(batch)
+
+    def _score(self, batch: list) -> None:
+        rows, futures, submitted = zip(*batch)
+        try:
+            scores = np.asarray(self.predict_fn(np.stack(rows))).reshape(len(rows))
+        except Exception as error:  # pylint: disable=broad-except
+            for future in futures:
+                future.set_exception(error)
+            n_errors = len(rows)
+        else:
+            for future, score in zip(futures, scores):
+                future.set_result(float(score))
+            n_errors = 0
+
+        now = time.perf_counter()
+        with self._lock:
+            self._latencies.extend(now - start for start in submitted)
+            self._n_requests += len(rows)
+            self._n_batches += 1
+            self._n_errors += n_errors
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the micro-batcher since it started: the number of requests scored, batches,
+        mean batch size, errors, requests per second, and the latency percentiles of the most recent requests
+        (from submission to the score being available, see get_latency_percentiles)
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+            n_requests, n_batches = self._n_requests, self._n_batches
+            n_errors = self._n_errors
+        uptime_s = time.perf_counter() - self._start
+        return dict(
+            requests=n_requests,
+            batches=n_batches,
+            mean_batch_size=n_requests / n_batches if n_batches else 0.0,
+            errors=n_errors,
+            uptime_s=uptime_s,
+            requests_per_s=n_requests / uptime_s,
+            **get_latency_percentiles(latencies),
+        )
+
+    def close(self) -> None:
+        """
+        Scores the pending requests and stops the background thread; further requests raise a RuntimeError
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self) -> "MicroBatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _ScoringRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests to a scoring server (see create_scoring_server)
+    """
+
+    batcher: MicroBatcher = None
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.path == "/health":
+            self._send_json(200, dict(status="ok"))
+        elif self.path == "/stats":
+            self._send_json(200, self.batcher.stats())
+        else:
+            self._send_json(404, dict(error=f"Unknown path {self.path}"))
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        if self.path != "/predict":
+            self._send_json(404, dict(error=f"Unknown path {self.path}"))
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if "instances" in payload:
+                futures = [self.batcher.submit(row) for row in payload["instances"]]
+            else:
+                futures = [self.batcher.submit(payload["features"])]
+        except (KeyError, TypeError, ValueError) as error:
+            self._send_json(400, dict(error=str(error)))
+            return
+        try:
+            scores = [future.result() for future in futures]
+        except Exception as error:  # pylint: disable=broad-except
+            self._send_json(500, dict(error=str(error)))
+            return
+        if "instances" in payload:
+            self._send_json(200, dict(predictions=scores))
+        else:
+            self._send_json(200, dict(prediction=scores[0]))
+
+    def log_message(self, format, *args) -> None:  # pylint: disable=redefined-builtin
+        # Per-request logging would dominate the latency of the server
+        pass
+
+
+class _ScoringServer(ThreadingHTTPServer):
+    """
+    HTTP server with a thread per connection, and a listen backlog for many concurrent clients (the
+    default of 5 resets the connections of bursts of requests)
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def create_scoring_server(
+    batcher: MicroBatcher, host: str = "127.0.0.1", port: int = 8080
+) -> ThreadingHTTPServer:
+    """
+    Creates an HTTP server scoring requests with a micro-batcher, with a thread per connection. Run it with
+    serve_forever() (e.g. in a thread) and stop it with shutdown(). Endpoints:
+    - POST /predict: JSON {"features": [...]} (one row), answered with {"prediction": score}, or
+      {"instances": [[...], ...]} (several rows), answered with {"predictions": [scores]}
+    - GET /stats: the counters of the micro-batcher (see MicroBatcher.stats)
+    - GET /health: {"status": "ok"}
+
+    Args:
+        batcher: (MicroBatcher) micro-batcher scoring the rows of the requests
+        host: (str) address to listen on
+        port: (int) port to listen on, or 0 for any free port (see server.server_address)
+
+    Returns:
+        (ThreadingHTTPServer) the server, bound but not yet serving
+    """
+    handler = type(
+        "ScoringRequestHandler", (_ScoringRequestHandler,), dict(batcher=batcher)
+    )
+    return _ScoringServer((host, port), handler)
+
+
+def create_http_client(url: str) -> Callable[[Sequence[float]], float]:
+    """
+    Returns a function scoring a row with POST requests to the /predict endpoint of a scoring server at url
+    (e.g. 'http://127.0.0.1:8080')
+    """
+
+    def predict(row: Sequence[float]) -> float:
+        request = urllib.request.Request(
+            f"{url}/predict",
+            data=json.dumps(dict(features=[float(value) for value in row])).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())["prediction"]
+
+    return predict
+
+
+def run_load_test(
+    predict_one: Callable[[np.ndarray], float],
+    rows: np.ndarray,
+    concurrency: int = 16,
+    n_requests: int = 1000,
+) -> dict:
+    """
+    Generates load on a scoring function: concurrency threads (clients) each send requests one after another,
+    cycling through the rows, until n_requests have been made in total.
+
+    Args:
+        predict_one: (callable) scores a single row, e.g. MicroBatcher.predict or create_http_client(url)
+        rows: (numpy ndarray) rows to send, one per request
+        concurrency: (int) number of concurrent clients
+        n_requests: (int) total number of requests
+
+    Returns:
+        (dict) with the number of requests, concurrency, elapsed time, requests per second and the latency
+            percentiles of the requests (see get_latency_percentiles)
+    """
+    counter = itertools.count()
+    latencies = []
+
+    def run_client() -> None:
+        client_latencies = []
+        for request in iter(lambda: next(counter), None):
+            if request >= n_requests:
+                break
+            start = time.perf_counter()
+            predict_one(rows[request % len(rows)])
+            client_latencies.append(time.perf_counter() - start)
+        latencies.extend(client_latencies)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for client in [executor.submit(run_client) for _ in range(concurrency)]:
+            client.result()
+    elapsed_s = time.perf_counter() - start
+
+    return dict(
+        requests=n_requests,
+        concurrency=concurrency,
+        elapsed_s=elapsed_s,
+        requests_per_s=n_requests / elapsed_s,
+        **get_latency_percentiles(latencies),
+    )
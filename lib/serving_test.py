@@ -0,0 +1,128 @@
+"""
+Unit tests for the functions in lib/serving.py
+"""
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from lib.serving import (
+    MicroBatcher,
+    create_http_client,
+    create_scoring_server,
+    run_load_test,
+)
+
+
+class RecordingModel:
+    """
+    Scoring function returning the sum of each row, and recording the size of each batch scored
+    """
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.batch_sizes = []
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(X))
+        time.sleep(self.delay_s)
+        return X.sum(axis=1)
+
+
+@pytest.mark.unittest
+class TestMicroBatcher:
+    """
+    Tests for the micro-batching of concurrent requests
+    """
+
+    def test_concurrent_requests_are_coalesced_into_batches(self):
+        """
+        Test that concurrent requests are scored correctly in batches of at most max_batch_size rows
+        """
+        model = RecordingModel(delay_s=0.005)
+        rows = np.random.default_rng(0).normal(size=(200, 3))
+
+        with MicroBatcher(model, max_batch_size=16, max_wait_ms=5) as batcher:
+            result = run_load_test(
+                batcher.predict, rows, concurrency=32, n_requests=200
+            )
+            stats = batcher.stats()
+
+        assert result["requests"] == 200
+        assert stats["requests"] == sum(model.batch_sizes) == 200
+        assert max(model.batch_sizes) <= 16
+        assert stats["mean_batch_size"] > 2
+        assert stats["latency_p99_ms"] >= stats["latency_p50_ms"] > 0
+        with MicroBatcher(model) as batcher:
+            assert batcher.predict(rows[0]) == pytest.approx(rows[0].sum(), rel=1e-5)
+
+    def test_a_lone_request_waits_at_most_max_wait(self):
+        """
+        Test that a request without concurrent requests is scored alone after max_wait_ms
+        """
+        model = RecordingModel()
+
+        with MicroBatcher(model, max_batch_size=64, max_wait_ms=20) as batcher:
+            start = time.perf_counter()
+            batcher.predict([1.0, 2.0])
+            elapsed = time.perf_counter() - start
+
+        assert model.batch_sizes == [1]
+        assert 0.015 < elapsed < 1.0
+
+    def test_errors_are_raised_to_the_requests_of_the_batch(self):
+        """
+        Test that an error of the model fails the requests of its batch and is counted, and that rows of the
+        wrong shape and requests after closing are rejected
+        """
+
+        def failing_model(X):
+            raise RuntimeError("model error")
+
+        with MicroBatcher(failing_model, n_features=2) as batcher:
+            with pytest.raises(RuntimeError, match="model error"):
+                batcher.predict([1.0, 2.0])
+            with pytest.raises(ValueError):
+                batcher.submit([1.0, 2.0, 3.0])
+            assert batcher.stats()["errors"] == 1
+
+        with pytest.raises(RuntimeError):
+            batcher.submit([1.0, 2.0])
+
+
+@pytest.mark.unittest
+def test_scoring_server_answers_predictions_and_stats():
+    """
+    Test the endpoints of the HTTP scoring server, on a free port
+    """
+    with MicroBatcher(RecordingModel(), n_features=2) as batcher:
+        server = create_scoring_server(batcher, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            prediction = create_http_client(url)([1.0, 2.5])
+            request = urllib.request.Request(
+                f"{url}/predict",
+                data=json.dumps(dict(instances=[[1, 1], [2, 2]])).encode(),
+            )
+            with urllib.request.urlopen(request) as response:
+                predictions = json.loads(response.read())["predictions"]
+            with urllib.request.urlopen(f"{url}/stats") as response:
+                stats = json.loads(response.read())
+            with pytest.raises(urllib.error.HTTPError) as error:
+                create_http_client(url)([1.0])
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    assert prediction == pytest.approx(3.5)
+    assert predictions == [2.0, 4.0]
+    assert stats["requests"] == 3
+    assert error.value.code == 400